@@ -0,0 +1,64 @@
+"""
+Контрольные точки LLM-конвейеров (реферат, суммаризация).
+
+Каждый шаг конвейера сохраняется в таблицу llm_artifacts сразу после
+выполнения. Ключ - документ, хеш его текста, версия промптов и модель LLM,
+поэтому повторный запуск продолжает с последнего готового шага, а смена
+текста, промптов или модели автоматически дает пересчет.
+"""
+
+from typing import Dict, Optional
+
+
+def llm_model_id(llm) -> str:
+    """Идентификатор модели LLM для ключа кеша: класс менеджера + имя модели."""
+    llm = getattr(llm, 'wrapped', llm)
+    model = None
+    for attr in ('model', 'model_name'):
+        value = getattr(llm, attr, None)
+        if isinstance(value, str) and value:
+            model = value
+            break
+    name = llm.__class__.__name__
+    return f"{name}:{model}" if model else name
+
+
+class LLMCheckpoint:
+    """Сохраненные шаги одного запуска конвейера для одного документа."""
+
+    def __init__(self, vector_store, document_id: int, kind: str, prompt_version: str, model: str):
+        self.vector_store = vector_store
+        self.document_id = document_id
+        self.kind = kind
+        self.prompt_version = prompt_version
+        self.model = model
+        self.content_hash: Optional[str] = None
+        self.steps: Dict[str, str] = {}
+
+    async def load(self, force: bool = False):
+        """
+        Загружает сохраненные шаги для текущей версии текста документа.
+
+        Args:
+            force: удалить сохраненные шаги и посчитать все заново
+        """
+        self.content_hash = await self.vector_store.get_document_content_hash(self.document_id)
+        if force:
+            await self.vector_store.delete_artifacts(self.document_id, self.kind)
+            self.steps = {}
+        elif self.content_hash:
+            self.steps = await self.vector_store.get_artifacts(
+                self.document_id, self.kind, self.content_hash, self.prompt_version, self.model
+            )
+        if self.steps:
+            print(f"[CHECKPOINT] {self.kind} for document {self.document_id}: {len(self.steps)} saved steps")
+
+    def get(self, step: str) -> Optional[str]:
+        return self.steps.get(step)
+
+    async def save(self, step: str, content: str):
+        self.steps[step] = content
+        if self.content_hash:
+            await self.vector_store.save_artifact(
+                self.document_id, self.kind, self.content_hash, self.prompt_version, self.model, step, content
+            )
@@ -0,0 +1,108 @@
+"""
+Экстрактивное сжатие контекста перед вызовом LLM.
+
+Отрывки контекста разбиваются на предложения; в каждом отрывке остаются
+предложения, наиболее близкие к запросу по эмбеддингу, вместе с соседними
+(чтобы не терять связки и местоимения), пока не наберется заданная доля текста.
+Пропуски внутри отрывка обозначаются многоточием.
+"""
+
+import re
+from typing import List, Dict, Any
+
+import numpy as np
+
+from .context_packer import estimate_tokens
+
+
+# Граница предложения: знак конца предложения и пробел либо перевод строки
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…;])\s+|\n+')
+
+GAP_MARKER = ' … '
+
+
+def split_sentences(text: str) -> List[str]:
+    """Разбивает текст на предложения (чанки режутся по символам, крайние могут быть обрывками)."""
+    return [sentence.strip() for sentence in _SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+def select_sentences(
+    query_embedding: np.ndarray,
+    sentence_embeddings: np.ndarray,
+    lengths: List[int],
+    ratio: float
+) -> List[int]:
+    """
+    Выбирает предложения, наиболее похожие на запрос, вместе с ближайшими соседями.
+
+    Args:
+        query_embedding: вектор запроса, shape (dim,)
+        sentence_embeddings: векторы предложений одного отрывка, shape (n, dim)
+        lengths: длины предложений в символах
+        ratio: доля символов отрывка, которую нужно сохранить
+
+    Returns:
+        Индексы сохраненных предложений по порядку текста (хотя бы одно предложение)
+    """
+    n = len(lengths)
+    sentences = sentence_embeddings / np.maximum(
+        np.linalg.norm(sentence_embeddings, axis=1, keepdims=True), 1e-12
+    )
+    query = query_embedding / max(np.linalg.norm(query_embedding), 1e-12)
+    similarity = sentences @ query
+
+    budget = ratio * sum(lengths)
+    kept = set()
+    kept_chars = 0
+    for best in np.argsort(-similarity):
+        for index in (int(best), int(best) - 1, int(best) + 1):
+            if 0 <= index < n and index not in kept and (not kept or kept_chars + lengths[index] <= budget):
+                kept.add(index)
+                kept_chars += lengths[index]
+        if kept_chars >= budget:
+            break
+    return sorted(kept)
+
+
+def compress_passages(
+    passages: List[Dict[str, Any]],
+    passage_sentences: List[List[str]],
+    query_embedding: np.ndarray,
+    sentence_embeddings: np.ndarray,
+    ratio: float
+) -> List[Dict[str, Any]]:
+    """
+    Сжимает отрывки контекста (см. context_packer.pack_context).
+
+    Args:
+        passages: отрывки контекста
+        passage_sentences: предложения каждого отрывка (split_sentences)
+        query_embedding: вектор запроса
+        sentence_embeddings: векторы всех предложений подряд, shape (sum(len), dim)
+        ratio: доля текста каждого отрывка, которую нужно сохранить
+
+    Returns:
+        Отрывки с сокращенным content и пересчитанным tokens
+    """
+    compressed = []
+    offset = 0
+    for passage, sentences in zip(passages, passage_sentences):
+        embeddings = sentence_embeddings[offset:offset + len(sentences)]
+        offset += len(sentences)
+        if len(sentences) < 2:
+            compressed.append(passage)
+            continue
+
+        kept = select_sentences(query_embedding, embeddings, [len(s) for s in sentences], ratio)
+        parts = []
+        previous = -1
+        for index in kept:
+            if parts and index != previous + 1:
+                parts.append(GAP_MARKER)
+            elif parts:
+                parts.append(' ')
+            parts.append(sentences[index])
+            previous = index
+        content = ''.join(parts)
+        compressed.append({**passage, 'content': content, 'tokens': estimate_tokens(content)})
+    return compressed
@@ -0,0 +1,128 @@
+"""
+Сборка контекста для LLM из найденных фрагментов.
+
+Соседние чанки одного документа склеиваются в непрерывные отрывки без
+дублирования перекрытия (split_text_into_chunks режет текст с overlap),
+отрывки отбираются по рангу в пределах бюджета токенов и выстраиваются
+в порядке чтения.
+"""
+
+from typing import List, Dict, Any, Optional
+
+from .config import settings, CHARS_PER_TOKEN
+
+
+# Перекрытие короче этого считается случайным совпадением и не вырезается
+_MIN_OVERLAP = 8
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов (без токенизатора конкретной модели)."""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def join_overlapping(left: str, right: str, max_overlap: int) -> str:
+    """
+    Склеивает два последовательных чанка, убирая повтор перекрытия.
+
+    Ищется самый длинный суффикс left, совпадающий с префиксом right
+    (не длиннее max_overlap). Если совпадения нет - чанки склеиваются через пробел.
+    """
+    limit = min(len(left), len(right), max_overlap)
+    for size in range(limit, _MIN_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return f"{left} {right}"
+
+
+def merge_adjacent(results: List[Dict[str, Any]], max_overlap: int) -> List[Dict[str, Any]]:
+    """
+    Объединяет результаты поиска с соседними chunk_index одного документа в отрывки.
+
+    Args:
+        results: результаты поиска, отсортированные по убыванию релевантности
+        max_overlap: максимальная длина перекрытия соседних чанков в символах
+
+    Returns:
+        Отрывки с полями document_id, filename, chunk_start, chunk_end, content,
+        rank (лучшая позиция входящего чанка в results) и chunks (исходные результаты)
+    """
+    by_document: Dict[Any, List[tuple]] = {}
+    for rank, result in enumerate(results):
+        by_document.setdefault(result['document_id'], []).append((rank, result))
+
+    passages = []
+    for document_id, ranked in by_document.items():
+        ranked.sort(key=lambda item: item[1]['chunk_index'])
+        current = None
+        for rank, result in ranked:
+            index = result['chunk_index']
+            if current is not None and index == current['chunk_end']:
+                # Дубликат чанка (например, из разных вариантов запроса)
+                current['rank'] = min(current['rank'], rank)
+                continue
+            if current is not None and index == current['chunk_end'] + 1:
+                current['content'] = join_overlapping(current['content'], result['content'], max_overlap)
+                current['chunk_end'] = index
+                current['rank'] = min(current['rank'], rank)
+                current['chunks'].append(result)
+                continue
+            current = {
+                'document_id': document_id,
+                'filename': result['filename'],
+                'chunk_start': index,
+                'chunk_end': index,
+                'content': result['content'],
+                'rank': rank,
+                'chunks': [result]
+            }
+            passages.append(current)
+    return passages
+
+
+def pack_context(
+    results: List[Dict[str, Any]],
+    token_budget: int,
+    max_overlap: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Собирает контекст в пределах бюджета токенов.
+
+    Отрывки берутся по рангу (лучший входящий чанк), пока помещаются в бюджет;
+    самый релевантный отрывок, не помещающийся целиком, обрезается. Итоговый
+    порядок: документы по лучшему рангу, внутри документа - по порядку текста.
+
+    Args:
+        results: результаты поиска, отсортированные по убыванию релевантности
+        token_budget: бюджет токенов на весь контекст
+        max_overlap: максимальная длина перекрытия соседних чанков (по умолчанию settings.chunk_overlap)
+
+    Returns:
+        Отрывки (см. merge_adjacent) с полем tokens
+    """
+    if max_overlap is None:
+        max_overlap = settings.chunk_overlap
+    passages = merge_adjacent(results, max_overlap)
+
+    selected = []
+    used_tokens = 0
+    for passage in sorted(passages, key=lambda p: p['rank']):
+        tokens = estimate_tokens(passage['content'])
+        if used_tokens + tokens > token_budget:
+            if not selected:
+                # Даже лучший отрывок не помещается - отдаем его начало
+                passage['content'] = passage['content'][:token_budget * CHARS_PER_TOKEN]
+                tokens = estimate_tokens(passage['content'])
+            else:
+                continue
+        passage['tokens'] = tokens
+        used_tokens += tokens
+        selected.append(passage)
+
+    document_rank = {}
+    for passage in selected:
+        document_rank[passage['document_id']] = min(
+            document_rank.get(passage['document_id'], passage['rank']), passage['rank']
+        )
+    selected.sort(key=lambda p: (document_rank[p['document_id']], p['chunk_start']))
+    return selected
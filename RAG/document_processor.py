@@ -1,6 +1,6 @@
 import io
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from pathlib import Path
 import chardet
 from pypdf import PdfReader
@@ -145,18 +145,24 @@ class DocumentProcessor:
         return chunks
     
     @staticmethod
-    def prepare_chunks_for_storage(chunks: List[str], embeddings: List[List[float]]) -> List[Dict[str, Any]]:
+    def prepare_chunks_for_storage(
+        chunks: List[str],
+        embeddings: List[List[float]],
+        languages: Optional[List[Optional[str]]] = None
+    ) -> List[Dict[str, Any]]:
         print(f"[DOC_PROCESSOR] Preparing {len(chunks)} chunks for storage")
         prepared_chunks = []
         
         for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+            metadata = {'length': len(chunk)}
+            # Язык чанка (ISO 639-1), если определен
+            if languages and languages[idx]:
+                metadata['language'] = languages[idx]
             prepared_chunks.append({
                 'content': chunk,
                 'embedding': embedding,
                 'chunk_index': idx,
-                'metadata': {
-                    'length': len(chunk)
-                }
+                'metadata': metadata
             })
         
         print(f"[DOC_PROCESSOR] Prepared {len(prepared_chunks)} chunks")
@@ -2,26 +2,35 @@
 Модуль для автоматического определения языка текста и адаптивного кросс-языкового поиска.
 """
 
-from typing import Optional, Union, List
+import asyncio
+from typing import Optional, Union, List, Tuple
 import re
 
+from .config import settings
+from .language_id import NgramLanguageIdentifier
+from .translator import AsyncTranslator
+
 
 class LanguageDetector:
     """Детектор языка с поддержкой автоматического перевода для улучшения поиска."""
     
-    def __init__(self):
+    def __init__(self, engine: Optional[str] = None):
+        self.engine = engine or settings.language_id_engine
+        if self.engine not in ('ngram', 'langdetect'):
+            raise ValueError(f"Неизвестный движок определения языка: {self.engine}")
         self._langdetect = None
+        self._ngram = None
         self._translator = None
-        print("[LANG_DETECTOR] LanguageDetector initialized")
+        print(f"[LANG_DETECTOR] LanguageDetector initialized (engine: {self.engine})")
         
     def _load_langdetect(self):
         """Ленивая загрузка библиотеки определения языка."""
         if self._langdetect is None:
             try:
-                from langdetect import detect, DetectorFactory
+                from langdetect import detect_langs, DetectorFactory
                 # Делаем результаты детекции детерминированными
                 DetectorFactory.seed = 0
-                self._langdetect = detect
+                self._langdetect = detect_langs
                 print("[LANG_DETECTOR] langdetect library loaded")
             except ImportError:
                 print("[LANG_DETECTOR] WARNING: langdetect not installed")
@@ -29,45 +38,95 @@ class LanguageDetector:
                 self._langdetect = False
         return self._langdetect if self._langdetect else None
     
-    def _load_translator(self):
-        """Ленивая загрузка переводчика."""
-        if self._translator is None:
+    def _load_ngram(self) -> Optional[NgramLanguageIdentifier]:
+        """Ленивая загрузка n-граммной модели (строится из профилей langdetect)."""
+        if self._ngram is None:
             try:
-                from deep_translator import GoogleTranslator
-                self._translator = GoogleTranslator
-                print("[LANG_DETECTOR] Translator loaded (deep-translator)")
+                identifier = NgramLanguageIdentifier()
+                identifier.load()
+                self._ngram = identifier
             except ImportError:
-                print("[LANG_DETECTOR] WARNING: deep-translator not installed")
-                print("[LANG_DETECTOR] Install with: pip install deep-translator")
-                self._translator = False
-        return self._translator if self._translator else None
+                print("[LANG_DETECTOR] WARNING: langdetect not installed, n-gram profiles unavailable")
+                print("[LANG_DETECTOR] Install with: pip install langdetect")
+                self._ngram = False
+        return self._ngram if self._ngram else None
     
-    def detect_language(self, text: str) -> Optional[str]:
+    def load(self):
+        """Загружает модель определения языка заранее, чтобы первый запрос ее не ждал."""
+        if self.engine == 'ngram':
+            self._load_ngram()
+        else:
+            self._load_langdetect()
+    
+    @property
+    def translator(self) -> AsyncTranslator:
+        """Асинхронный переводчик с кешем (см. RAG/translator.py), создается при первом обращении."""
+        if self._translator is None:
+            self._translator = AsyncTranslator()
+        return self._translator
+    
+    def detect_languages(self, texts: List[str]) -> List[Tuple[Optional[str], float]]:
         """
-        Определяет язык текста.
+        Определяет языки пакета текстов.
         
         Args:
-            text: текст для анализа
+            texts: тексты для анализа
             
         Returns:
-            Код языка (ISO 639-1) или None если не удалось определить
+            Для каждого текста (код языка ISO 639-1, вероятность); (None, 0.0) если
+            текст слишком короткий, язык не определен или вероятность ниже
+            settings.language_id_min_confidence
         """
-        if not text or len(text.strip()) < 10:
-            return None
-        
-        detect_func = self._load_langdetect()
-        if not detect_func:
-            return None
+        results: List[Tuple[Optional[str], float]] = [(None, 0.0)] * len(texts)
+        # Используем первые 1000 символов для определения языка
+        samples = {
+            i: text[:1000].strip() for i, text in enumerate(texts)
+            if text and len(text.strip()) >= 10
+        }
+        if not samples:
+            return results
         
         try:
-            # Используем первые 1000 символов для определения языка
-            sample = text[:1000].strip()
-            lang = detect_func(sample)
-            print(f"[LANG_DETECTOR] Detected language: {lang}")
-            return lang
+            if self.engine == 'ngram':
+                identifier = self._load_ngram()
+                if not identifier:
+                    return results
+                detected = identifier.detect_batch(list(samples.values()))
+            else:
+                detect_func = self._load_langdetect()
+                if not detect_func:
+                    return results
+                detected = []
+                for sample in samples.values():
+                    best = detect_func(sample)[0]
+                    detected.append((best.lang, best.prob))
         except Exception as e:
             print(f"[LANG_DETECTOR] Language detection error: {e}")
-            return None
+            return results
+        
+        for i, (lang, confidence) in zip(samples, detected):
+            if lang and confidence >= settings.language_id_min_confidence:
+                results[i] = (lang, confidence)
+        return results
+    
+    def detect_language_with_confidence(self, text: str) -> Tuple[Optional[str], float]:
+        """Определяет язык текста и вероятность (см. detect_languages)."""
+        return self.detect_languages([text])[0]
+    
+    def detect_language(self, text: str) -> Optional[str]:
+        """
+        Определяет язык текста.
+        
+        Args:
+            text: текст для анализа
+            
+        Returns:
+            Код языка (ISO 639-1) или None если не удалось определить
+        """
+        lang, confidence = self.detect_language_with_confidence(text)
+        if lang:
+            print(f"[LANG_DETECTOR] Detected language: {lang} ({confidence:.1%})")
+        return lang
     
     def detect_document_language(self, chunks: List[str], sample_size: int = 5) -> Optional[str]:
         """
@@ -90,13 +149,21 @@ class LanguageDetector:
             if i < len(chunks):
                 sample_chunks.append(chunks[i])
         
-        # Определяем язык для каждого фрагмента
-        languages = []
-        for chunk in sample_chunks:
-            lang = self.detect_language(chunk)
-            if lang:
-                languages.append(lang)
+        # Определяем язык всех фрагментов одним пакетом
+        return self.majority_language([lang for lang, _ in self.detect_languages(sample_chunks)])
+    
+    @staticmethod
+    def majority_language(languages: List[Optional[str]]) -> Optional[str]:
+        """
+        Язык документа по языкам его фрагментов: наиболее частый.
         
+        Args:
+            languages: языки фрагментов (None - не определен)
+            
+        Returns:
+            Наиболее частый код языка или None
+        """
+        languages = [lang for lang in languages if lang]
         if not languages:
             return None
         
@@ -111,43 +178,56 @@ class LanguageDetector:
         print(f"[LANG_DETECTOR] Document language: {most_common_lang} (confidence: {confidence:.1%})")
         return most_common_lang
     
-    def translate_text(self, text: str, target_lang: str) -> Optional[str]:
+    def translate_text(self, text: str, target_lang: str, source_lang: Optional[str] = None) -> Optional[str]:
         """
-        Переводит текст на целевой язык.
+        Переводит текст на целевой язык (синхронно, для вызовов вне event loop).
         
         Args:
             text: исходный текст
             target_lang: целевой язык (ISO 639-1)
+            source_lang: исходный язык, если уже известен (иначе определяется)
             
         Returns:
             Переведенный текст или None при ошибке
         """
-        translator_class = self._load_translator()
-        if not translator_class:
-            return None
+        if source_lang is None:
+            source_lang = self.detect_language(text)
+        
+        # Если уже на целевом языке, не переводим
+        if source_lang == target_lang:
+            print(f"[LANG_DETECTOR] Text already in target language ({target_lang})")
+            return text
         
         try:
-            # Определяем исходный язык
-            source_lang = self.detect_language(text)
-            
-            # Если уже на целевом языке, не переводим
-            if source_lang == target_lang:
-                print(f"[LANG_DETECTOR] Text already in target language ({target_lang})")
-                return text
-            
-            # Переводим с использованием deep-translator
-            translator = translator_class(source=source_lang, target=target_lang)
-            translation = translator.translate(text)
-            
-            print(f"[LANG_DETECTOR] Translated from {source_lang} to {target_lang}")
-            print(f"[LANG_DETECTOR]   Original: {text[:100]}...")
-            print(f"[LANG_DETECTOR]   Translated: {translation[:100]}...")
+            translation = self.translator.translate_sync(text, source_lang, target_lang)
+            if translation:
+                print(f"[LANG_DETECTOR] Translated from {source_lang} to {target_lang}")
+                print(f"[LANG_DETECTOR]   Original: {text[:100]}...")
+                print(f"[LANG_DETECTOR]   Translated: {translation[:100]}...")
             return translation
-            
         except Exception as e:
             print(f"[LANG_DETECTOR] Translation error: {e}")
             return None
     
+    async def translate(self, text: str, target_lang: str, source_lang: Optional[str] = None) -> Optional[str]:
+        """
+        Переводит текст на целевой язык, не блокируя event loop.
+        
+        Перевод выполняется в пуле потоков с тайм-аутом settings.translation_timeout_ms
+        и кешируется по (текст, исходный язык, целевой язык).
+        
+        Args:
+            text: исходный текст
+            target_lang: целевой язык (ISO 639-1)
+            source_lang: исходный язык, если уже известен (иначе определяется)
+            
+        Returns:
+            Переведенный текст или None при ошибке или тайм-ауте
+        """
+        if source_lang is None:
+            source_lang = await asyncio.to_thread(self.detect_language, text)
+        return await self.translator.translate(text, source_lang, target_lang)
+    
     def should_translate_query(self, query_lang: Optional[str], document_lang: Optional[str]) -> bool:
         """
         Определяет, нужно ли переводить запрос для улучшения поиска.
@@ -171,34 +251,41 @@ class LanguageDetector:
         print(f"[LANG_DETECTOR] Cross-lingual query detected: {query_lang} -> {document_lang}")
         return True
     
-    def create_multilingual_query(self, query: str, target_langs: List[str]) -> List[str]:
+    async def create_multilingual_query(
+        self,
+        query: str,
+        target_langs: List[str],
+        source_lang: Optional[str] = None
+    ) -> List[str]:
         """
         Создает мультиязычные варианты запроса для параллельного поиска.
         
+        Переводы на все целевые языки выполняются параллельно.
+        
         Args:
             query: исходный запрос
             target_langs: список целевых языков
+            source_lang: язык запроса, если уже известен (иначе определяется)
             
         Returns:
             Список вариантов запроса на разных языках
         """
-        translator_class = self._load_translator()
-        if not translator_class:
-            return [query]
+        if source_lang is None:
+            source_lang = await asyncio.to_thread(self.detect_language, query)
         
         queries = [query]  # Всегда включаем оригинальный запрос
-        query_lang = self.detect_language(query)
-        
-        for target_lang in target_langs:
-            if target_lang == query_lang:
-                continue
-            
-            translated = self.translate_text(query, target_lang)
-            if translated and translated != query:
+        targets = [lang for lang in target_langs if lang != source_lang]
+        translations = await self.translator.translate_many(query, source_lang, targets)
+        for translated in translations.values():
+            if translated and translated not in queries:
                 queries.append(translated)
         
         print(f"[LANG_DETECTOR] Generated {len(queries)} query variants")
         return queries
+    
+    def close(self):
+        if self._translator is not None:
+            self._translator.close()
 
 
 # Глобальный экземпляр детектора
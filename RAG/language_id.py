@@ -0,0 +1,203 @@
+"""
+Быстрое определение языка по символьным n-граммам.
+
+Модель - компактная таблица логарифмов частот n-грамм (1-3 символа) по языкам,
+построенная из профилей, поставляемых с langdetect: для каждого языка берутся
+самые частые n-граммы. Оценка текста - наивный Байес: сумма логарифмов
+вероятностей его n-грамм для всех языков сразу, пакет текстов считается
+одной операцией numpy. В отличие от langdetect результат детерминирован.
+"""
+
+import json
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import settings
+
+
+# Сколько n-грамм текста учитывается при оценке уверенности: без ограничения
+# наивный Байес дает уверенность ~1.0 для любого длинного текста
+_CONFIDENCE_NGRAMS = 40
+# Сглаживание для n-грамм, которых нет в профиле языка
+_SMOOTHING = 0.5
+# Анализируется начало текста (как и в LanguageDetector)
+_MAX_CHARS = 1000
+
+
+def _normalize_char(char: str) -> str:
+    """Приводит символ к виду, в котором n-граммы хранятся в профилях langdetect."""
+    if not char.isalpha():
+        return ' '
+    code = ord(char)
+    if 0x3040 <= code <= 0x309F:
+        return 'あ'  # хирагана
+    if 0x30A0 <= code <= 0x30FF:
+        return 'ア'  # катакана
+    if 0x3100 <= code <= 0x312F:
+        return 'ㄅ'  # бопомофо
+    if 0xAC00 <= code <= 0xD7AF:
+        return '가'  # хангыль
+    return char
+
+
+def extract_ngrams(text: str) -> List[str]:
+    """N-граммы длиной 1-3 по словам текста, слово обрамляется пробелами."""
+    normalized = ''.join(_normalize_char(char) for char in unicodedata.normalize('NFC', text[:_MAX_CHARS]))
+    ngrams = []
+    for word in normalized.split():
+        padded = f" {word} "
+        ngrams.extend(word)
+        ngrams.extend(padded[i:i + 2] for i in range(len(padded) - 1))
+        ngrams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return ngrams
+
+
+class NgramLanguageIdentifier:
+    """
+    Определитель языка по n-граммам с пакетным API и потокобезопасным LRU-кешем.
+
+    Args:
+        languages: коды языков, среди которых выбирать (по умолчанию все профили)
+        max_ngrams: сколько самых частых n-грамм каждого языка входит в модель
+        cache_size: размер LRU-кеша результатов для отдельных текстов
+    """
+
+    def __init__(
+        self,
+        languages: Optional[List[str]] = None,
+        max_ngrams: Optional[int] = None,
+        cache_size: Optional[int] = None
+    ):
+        self.languages = languages if languages is not None else settings.language_id_languages_list
+        self.max_ngrams = max_ngrams if max_ngrams is not None else settings.language_id_max_ngrams
+        self.cache_size = cache_size if cache_size is not None else settings.language_id_cache_size
+        self.labels: List[str] = []
+        self._vocabulary: Dict[str, int] = {}
+        self._log_probs: Optional[np.ndarray] = None  # (n_languages, n_ngrams)
+        self._cache: OrderedDict = OrderedDict()
+        # Определение языка вызывается из пула потоков (asyncio.to_thread)
+        self._cache_lock = threading.Lock()
+
+    def load(self):
+        """Строит модель из профилей langdetect (один раз)."""
+        if self._log_probs is not None:
+            return
+        import langdetect
+        profiles_dir = os.path.join(os.path.dirname(langdetect.__file__), 'profiles')
+        names = sorted(os.listdir(profiles_dir))
+        if self.languages:
+            names = [name for name in names if name in set(self.languages)]
+
+        profiles = []
+        for name in names:
+            with open(os.path.join(profiles_dir, name), 'r', encoding='utf-8') as f:
+                profile = json.load(f)
+            # Самые частые n-граммы каждой длины: иначе в модель попали бы почти одни униграммы
+            top = {}
+            for length in (1, 2, 3):
+                ranked = sorted(
+                    ((ngram, count) for ngram, count in profile['freq'].items() if len(ngram) == length),
+                    key=lambda item: item[1], reverse=True
+                )
+                top.update(ranked[:self.max_ngrams])
+            profiles.append((profile['name'], top, profile['n_words']))
+            for ngram in top:
+                self._vocabulary.setdefault(ngram, len(self._vocabulary))
+
+        ngram_lengths = np.array([len(ngram) for ngram in self._vocabulary], dtype=np.int64)
+        log_probs = np.empty((len(profiles), len(self._vocabulary)), dtype=np.float32)
+        for row, (name, freq, n_words) in enumerate(profiles):
+            totals = np.asarray(n_words, dtype=np.float64)
+            # N-грамма, не попавшая в профиль языка, встречается в нем реже самой редкой
+            # сохраненной n-граммы той же длины
+            floor = np.ones(3)
+            for length in (1, 2, 3):
+                kept = [count for ngram, count in freq.items() if len(ngram) == length]
+                if kept:
+                    floor[length - 1] = min(kept) * _SMOOTHING
+            counts = floor[ngram_lengths - 1].copy()
+            for ngram, count in freq.items():
+                counts[self._vocabulary[ngram]] = count
+            # Вероятность n-граммы среди всех n-грамм той же длины в языке
+            log_probs[row] = np.log(counts / totals[ngram_lengths - 1])
+            self.labels.append(name)
+        self._log_probs = log_probs
+        print(f"[LANGUAGE_ID] N-gram model loaded: {len(self.labels)} languages, {len(self._vocabulary)} n-grams")
+
+    def predict_batch(self, texts: List[str]) -> List[Dict[str, float]]:
+        """
+        Вероятности языков для пакета текстов.
+
+        Returns:
+            Для каждого текста - словарь {язык: вероятность} по убыванию (пустой, если n-грамм нет)
+        """
+        self.load()
+        ids = []
+        offsets = []
+        for text in texts:
+            offsets.append(len(ids))
+            ids.extend(self._vocabulary[ngram] for ngram in extract_ngrams(text) if ngram in self._vocabulary)
+        lengths = np.diff(np.append(offsets, len(ids)))
+        if not ids:
+            return [{} for _ in texts]
+
+        # Сумма логарифмов вероятностей n-грамм каждого текста для всех языков сразу
+        gathered = self._log_probs[:, np.asarray(ids, dtype=np.int64)]
+        # reduceat только по текстам с n-граммами: у пустых текстов начало совпадает
+        # с началом следующего, и их строка получила бы чужие n-граммы
+        nonempty = lengths > 0
+        scores = np.zeros((len(texts), len(self.labels)), dtype=gathered.dtype)  # (n_texts, n_languages)
+        scores[nonempty] = np.add.reduceat(gathered, np.asarray(offsets, dtype=np.int64)[nonempty], axis=1).T
+        # Ограничиваем вклад длины текста, чтобы уверенность отражала различимость языков
+        scale = np.minimum(1.0, _CONFIDENCE_NGRAMS / np.maximum(lengths, 1))[:, None]
+        scores = scores * scale
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+        predictions = []
+        for row, length in zip(probabilities, lengths):
+            if length == 0:
+                predictions.append({})
+                continue
+            order = np.argsort(-row)[:3]
+            predictions.append({self.labels[i]: float(row[i]) for i in order})
+        return predictions
+
+    def detect_batch(self, texts: List[str]) -> List[Tuple[Optional[str], float]]:
+        """Лучший язык и его вероятность для каждого текста пакета; (None, 0.0) - не удалось."""
+        results: List[Optional[Tuple[Optional[str], float]]] = [None] * len(texts)
+        missing = []
+        with self._cache_lock:
+            for i, text in enumerate(texts):
+                key = text[:_MAX_CHARS]
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    results[i] = cached
+                else:
+                    missing.append(i)
+
+        if missing:
+            predictions = self.predict_batch([texts[i] for i in missing])
+            for i, prediction in zip(missing, predictions):
+                best = next(iter(prediction.items()), (None, 0.0))
+                results[i] = best
+                self._remember(texts[i][:_MAX_CHARS], best)
+        return results
+
+    def detect(self, text: str) -> Tuple[Optional[str], float]:
+        """Лучший язык текста и его вероятность."""
+        return self.detect_batch([text])[0]
+
+    def _remember(self, key: str, value: Tuple[Optional[str], float]):
+        with self._cache_lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
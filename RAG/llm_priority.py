@@ -0,0 +1,62 @@
+"""
+Приоритеты вызовов LLM: интерактивные (чат, поиск, запросы API) и фоновые.
+
+Фоновые задачи (обогащение документов после загрузки) выполняются внутри
+background_priority(): их вызовы LLM проходят через отдельный маленький
+бюджет параллелизма и ждут, пока не завершатся все интерактивные вызовы.
+"""
+
+import asyncio
+import contextvars
+from contextlib import contextmanager, asynccontextmanager
+
+
+_background = contextvars.ContextVar('llm_background_priority', default=False)
+
+
+@contextmanager
+def background_priority():
+    """Помечает вызовы LLM в текущем контексте (и созданных в нем задачах) как фоновые."""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+class PrioritizedLLM:
+    """
+    Обертка над менеджером LLM, уступающая интерактивным вызовам.
+
+    Остальные атрибуты (model, stream_response и т.д.) берутся у исходного менеджера.
+    """
+
+    def __init__(self, llm, background_concurrency: int = 1):
+        self.wrapped = llm
+        self._interactive_calls = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._background = asyncio.Semaphore(background_concurrency)
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    @asynccontextmanager
+    async def interactive(self):
+        """Учитывает интерактивный вызов: пока он идет, фоновые вызовы не начинаются."""
+        self._interactive_calls += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._interactive_calls -= 1
+            if self._interactive_calls == 0:
+                self._idle.set()
+
+    async def get_response(self, *args, **kwargs):
+        if _background.get():
+            async with self._background:
+                await self._idle.wait()
+                return await self.wrapped.get_response(*args, **kwargs)
+        async with self.interactive():
+            return await self.wrapped.get_response(*args, **kwargs)
@@ -1,7 +1,11 @@
 import sys
 import os
 import re
-from typing import List, Dict, Any, Optional
+import asyncio
+import time
+import numpy as np
+from contextlib import aclosing
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'llm_manager'))
 
@@ -11,6 +15,21 @@ from .document_processor import DocumentProcessor
 from .config import settings
 from .language_detector import get_language_detector
 from .pdf_generator import get_pdf_generator
+from .retrieval import is_keyword_query, reciprocal_rank_fusion, mmr_select
+from .artifacts import LLMCheckpoint, llm_model_id
+from .llm_priority import PrioritizedLLM, background_priority
+from .context_packer import pack_context
+from .context_compressor import split_sentences, compress_passages
+from .reranker import Reranker
+from .translation_policy import TranslationPolicy
+
+
+NO_RESULTS_ANSWER = 'Не найдено релевантной информации в документах.'
+
+# Версии промптов: входят в ключ сохраненных результатов LLM (см. RAG/artifacts.py).
+# Увеличивайте при изменении соответствующих промптов, чтобы старые результаты не использовались
+SUMMARY_PROMPT_VERSION = "2"
+REFERAT_PROMPT_VERSION = "1"
 
 
 class RAGManager:
@@ -22,6 +41,10 @@ class RAGManager:
         self.document_processor = DocumentProcessor()
         self.language_detector = get_language_detector()
         self._llm = None
+        self._reranker = None
+        self.translation_policy = TranslationPolicy()
+        # Фоновые задачи обогащения документов (см. enrich_document)
+        self._background_tasks = set()
         print("[RAG_MANAGER] RAGManager initialized with auto language detection")
         
     async def initialize(self):
@@ -30,25 +53,45 @@ class RAGManager:
         print("[RAG_MANAGER] Vector store connected")
         self.embedding_model.load()
         print("[RAG_MANAGER] Embedding model loaded")
+        await asyncio.to_thread(self.language_detector.load)
+        print("[RAG_MANAGER] Language detector loaded")
+        if settings.rerank_enabled:
+            await asyncio.to_thread(self._get_reranker().load)
+            print("[RAG_MANAGER] Reranker loaded")
         print("[RAG_MANAGER] Initialization complete")
         
     async def close(self):
         print("[RAG_MANAGER] Closing connections...")
+        for task in list(self._background_tasks):
+            task.cancel()
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
         await self.vector_store.close()
+        if self._reranker is not None:
+            self._reranker.close()
+        await asyncio.to_thread(self.translation_policy.close)
+        await asyncio.to_thread(self.language_detector.close)
         print("[RAG_MANAGER] Closed successfully")
         
+    def _get_reranker(self) -> Reranker:
+        if self._reranker is None:
+            self._reranker = Reranker()
+        return self._reranker
+    
     def _get_llm(self):
         if self._llm is None:
             print("[RAG_MANAGER] Loading LLM manager...")
             from llm_factory import get_llm_manager
-            self._llm = get_llm_manager()
-            print(f"[RAG_MANAGER] LLM manager loaded: {self._llm.__class__.__name__}")
+            # Фоновые вызовы (обогащение после загрузки) уступают интерактивным
+            self._llm = PrioritizedLLM(get_llm_manager(), settings.background_llm_concurrency)
+            print(f"[RAG_MANAGER] LLM manager loaded: {self._llm.wrapped.__class__.__name__}")
         return self._llm
         
-    async def add_document(self, file_path: str, filename: str) -> int:
+    async def add_document(self, file_path: str, filename: str, collection_id: Optional[int] = None) -> int:
         print(f"\n[RAG_MANAGER] ========== ADD DOCUMENT START ==========")
         print(f"[RAG_MANAGER] File: {filename}")
         print(f"[RAG_MANAGER] Path: {file_path}")
+        print(f"[RAG_MANAGER] Collection: {collection_id or 'default'}")
         
         text = await self.document_processor.extract_text_from_file(file_path, filename)
         print(f"[RAG_MANAGER] Extracted text: {len(text)} characters")
@@ -56,9 +99,12 @@ class RAGManager:
         chunks = self.document_processor.split_text_into_chunks(text)
         print(f"[RAG_MANAGER] Split into {len(chunks)} chunks")
         
-        # Автоматическое определение языка документа
-        document_lang = self.language_detector.detect_document_language(chunks)
-        print(f"[RAG_MANAGER] Auto-detected document language: {document_lang or 'unknown'}")
+        # Язык каждого чанка (одним пакетом); язык документа - наиболее частый из них
+        chunk_languages = [lang for lang, _ in self.language_detector.detect_languages(chunks)]
+        document_lang = self.language_detector.majority_language(chunk_languages)
+        # Слишком короткие чанки наследуют язык документа
+        chunk_languages = [lang or document_lang for lang in chunk_languages]
+        print(f"[RAG_MANAGER] Auto-detected document language: {document_lang or 'unknown'}, chunk languages: {sorted(set(filter(None, chunk_languages)))}")
         
         embeddings = self.embedding_model.encode_batch(chunks)
         print(f"[RAG_MANAGER] Generated {len(embeddings)} embeddings")
@@ -70,71 +116,247 @@ class RAGManager:
             metadata={
                 'chunks_count': len(chunks),
                 'language': document_lang  # Сохраняем язык в метаданных
-            }
+            },
+            collection_id=collection_id
         )
         print(f"[RAG_MANAGER] Created document record: ID={document_id}")
         
-        prepared_chunks = self.document_processor.prepare_chunks_for_storage(chunks, embeddings)
+        prepared_chunks = self.document_processor.prepare_chunks_for_storage(chunks, embeddings, chunk_languages)
         await self.vector_store.add_chunks(document_id, prepared_chunks)
         print(f"[RAG_MANAGER] Stored {len(prepared_chunks)} chunks in database")
+        
+        if settings.ingest_enrichment:
+            task = asyncio.create_task(self.enrich_document(document_id))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+            print(f"[RAG_MANAGER] Scheduled background enrichment")
         print(f"[RAG_MANAGER] ========== ADD DOCUMENT COMPLETE: ID={document_id} ==========\n")
         
         return document_id
+    
+    async def enrich_document(self, document_id: int):
+        """
+        Фоновое обогащение документа после загрузки: краткое содержание.
+        
+        Краткое содержание сохраняется так же, как при вызове /api/summarize, поэтому
+        потом возвращается мгновенно. Вызовы LLM идут с фоновым приоритетом и не
+        конкурируют с чатом. Вектор документа считается сразу при записи чанков
+        (VectorStore.add_chunks).
+        """
+        print(f"[RAG_MANAGER] Background enrichment for document ID={document_id} started")
+        try:
+            with background_priority():
+                await self.summarize_document(document_id)
+            print(f"[RAG_MANAGER] Background enrichment for document ID={document_id} complete")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Документ уже доступен для поиска; обогащение можно повторить позже
+            print(f"[RAG_MANAGER] Background enrichment for document ID={document_id} failed: {e}")
+        
+    async def search(
+        self,
+        query: str,
+        document_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        min_similarity: Optional[float] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None,
+        collection_id: Optional[int] = None,
+        query_embedding: Optional[List[float]] = None,
+        neighbor_window: Optional[int] = None,
+        mmr_lambda: Optional[float] = None,
+        rerank: Optional[bool] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Поиск фрагментов.
         
-    async def search(self, query: str, document_id: Optional[int] = None, limit: Optional[int] = None, min_similarity: Optional[float] = None) -> List[Dict[str, Any]]:
+        Args:
+            query: текст запроса
+            document_id: искать только в этом документе
+            limit: количество результатов
+            min_similarity: минимальный порог схожести (для векторных результатов)
+            filters: структурированный фильтр (document_ids, language, uploaded_after,
+                uploaded_before, filename_prefix, metadata), применяется в SQL до отбора top-k
+            mode: режим поиска (по умолчанию settings.search_mode):
+                vector - семантический поиск по эмбеддингам;
+                hybrid - полнотекстовый и векторный поиск параллельно, слияние через RRF,
+                    запросы-коды обслуживаются только полнотекстовым поиском;
+                lexical - только полнотекстовый поиск;
+                hierarchical - сначала отбор документов по вектору документа
+                    (settings.hierarchical_top_documents), затем точный поиск чанков только в них
+            collection_id: искать только в коллекции (по ее собственному векторному индексу)
+            query_embedding: готовый эмбеддинг запроса (например, из пакетной векторизации)
+            neighbor_window: дополнить каждый фрагмент соседними чанками ±k по chunk_index
+                (по умолчанию settings.neighbor_window, 0 - без расширения)
+            mmr_lambda: диверсификация результатов методом MMR (по умолчанию settings.mmr_lambda):
+                1.0 - только релевантность, 0.0 - только разнообразие, None - без MMR
+            rerank: переранжировать top settings.rerank_top_n кандидатов кросс-энкодером
+                (по умолчанию settings.rerank_enabled); при превышении settings.rerank_timeout_ms
+                остается исходный порядок
+        """
         limit = limit if limit is not None else settings.search_limit
-        min_similarity = min_similarity if min_similarity is not None else settings.min_similarity
-        print(f"[RAG_MANAGER] Search query: '{query[:100]}...' | doc_id: {document_id} | limit: {limit}")
+        mmr_lambda = mmr_lambda if mmr_lambda is not None else settings.mmr_lambda
+        if mmr_lambda is not None and not 0.0 <= mmr_lambda <= 1.0:
+            raise ValueError(f"mmr_lambda должен быть в диапазоне [0, 1]: {mmr_lambda}")
         
-        # Автоматическое определение языка запроса
-        query_lang = self.language_detector.detect_language(query)
-        print(f"[RAG_MANAGER] Auto-detected query language: {query_lang or 'unknown'}")
+        rerank = rerank if rerank is not None else settings.rerank_enabled
+        # При переранжировании отбирается больше кандидатов, чем нужно результатов
+        pool = max(limit, settings.rerank_top_n) if rerank else limit
         
-        # Получаем язык документа(ов) если задан конкретный документ
-        document_lang = None
-        if document_id:
-            doc = await self.vector_store.get_document(document_id)
-            if doc and doc.get('metadata'):
-                document_lang = doc['metadata'].get('language')
-                print(f"[RAG_MANAGER] Document language: {document_lang or 'unknown'}")
-        
-        # Определяем, нужен ли перевод для улучшения поиска
-        queries_to_search = [query]  # Всегда ищем по оригинальному запросу
-        
-        if query_lang and document_lang and query_lang != document_lang:
-            # Кросс-языковой запрос обнаружен - пробуем перевести
-            print(f"[RAG_MANAGER] Cross-lingual search detected ({query_lang} -> {document_lang})")
-            translated_query = self.language_detector.translate_text(query, document_lang)
-            
-            if translated_query and translated_query != query:
-                queries_to_search.append(translated_query)
-                print(f"[RAG_MANAGER] Will search with {len(queries_to_search)} query variants")
+        if mmr_lambda is None:
+            results = await self._retrieve(
+                query, document_id, pool, min_similarity, filters, mode, collection_id, query_embedding
+            )
+        else:
+            if query_embedding is None:
+                query_embedding = await asyncio.to_thread(self.embedding_model.encode, query)
+            # Берем больше кандидатов вместе с их векторами и отбираем из них разнообразный top-k
+            candidates = await self._retrieve(
+                query, document_id, pool * settings.mmr_candidates_factor, min_similarity, filters,
+                mode, collection_id, query_embedding, with_embeddings=True
+            )
+            results = await self._diversify(candidates, query_embedding, pool, mmr_lambda)
+        
+        if rerank and results:
+            reranked = await self._get_reranker().rerank(query, results, settings.rerank_timeout_ms / 1000)
+            if reranked is not None:
+                results = reranked
+        results = results[:limit]
+        
+        neighbor_window = neighbor_window if neighbor_window is not None else settings.neighbor_window
+        if neighbor_window > 0 and results:
+            results = await self._expand_neighbors(results, neighbor_window)
+        return results
+    
+    async def _diversify(
+        self,
+        candidates: List[Dict[str, Any]],
+        query_embedding: List[float],
+        limit: int,
+        mmr_lambda: float
+    ) -> List[Dict[str, Any]]:
+        """Отбирает limit разнообразных кандидатов методом MMR (см. retrieval.mmr_select)."""
+        if len(candidates) <= 1:
+            for candidate in candidates:
+                candidate.pop('embedding', None)
+            return candidates
+        
+        # Кандидаты полнотекстового поиска приходят без векторов - дочитываем одним запросом
+        missing = [c['id'] for c in candidates if c.get('embedding') is None]
+        if missing:
+            fetched = await self.vector_store.get_chunk_embeddings(missing)
+            for candidate in candidates:
+                if candidate.get('embedding') is None:
+                    candidate['embedding'] = fetched.get(candidate['id'])
+            candidates = [c for c in candidates if c.get('embedding') is not None]
+        
+        embeddings = np.stack([candidate.pop('embedding') for candidate in candidates])
+        selected = mmr_select(np.asarray(query_embedding, dtype=np.float32), embeddings, limit, mmr_lambda)
+        print(f"[RAG_MANAGER] MMR (lambda={mmr_lambda}): {len(candidates)} candidates → {len(selected)} results")
+        return [candidates[index] for index in selected]
+    
+    async def _expand_neighbors(self, results: List[Dict[str, Any]], window: int) -> List[Dict[str, Any]]:
+        """
+        Добавляет к каждому фрагменту соседние чанки (±window) одним запросом к базе.
         
-        # Выполняем поиск по всем вариантам запроса
-        all_results = []
-        seen_chunks = set()  # Для дедупликации
+        Соседи идут сразу после своего фрагмента, наследуют его similarity и
+        помечаются полем neighbor_of (id фрагмента); дубликаты не добавляются.
+        """
+        window_chunks = await self.vector_store.get_chunk_windows(results, window)
+        by_position = {(chunk['document_id'], chunk['chunk_index']): chunk for chunk in window_chunks}
+        
+        seen = {(result['document_id'], result['chunk_index']) for result in results}
+        expanded = []
+        for result in results:
+            expanded.append(result)
+            for offset in range(-window, window + 1):
+                position = (result['document_id'], result['chunk_index'] + offset)
+                if position in seen or position not in by_position:
+                    continue
+                seen.add(position)
+                neighbor = {**by_position[position], 'neighbor_of': result['id']}
+                for score in ('similarity', 'rrf_score', 'lexical_score'):
+                    if score in result:
+                        neighbor[score] = result[score]
+                expanded.append(neighbor)
+        
+        print(f"[RAG_MANAGER] Neighbor expansion (±{window}): {len(results)} → {len(expanded)} chunks")
+        return expanded
+    
+    async def _retrieve(
+        self,
+        query: str,
+        document_id: Optional[int],
+        limit: Optional[int],
+        min_similarity: Optional[float],
+        filters: Optional[Dict[str, Any]],
+        mode: Optional[str],
+        collection_id: Optional[int],
+        query_embedding: Optional[List[float]],
+        with_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Поиск фрагментов в выбранном режиме (см. search).
         
-        for i, search_query in enumerate(queries_to_search):
-            print(f"[RAG_MANAGER] Searching with query variant {i+1}/{len(queries_to_search)}")
-            
-            query_embedding = self.embedding_model.encode(search_query)
-            print(f"[RAG_MANAGER] Generated query embedding: {len(query_embedding)} dimensions")
-            
-            results = await self.vector_store.search_similar(
-                query_embedding=query_embedding,
-                document_id=document_id,
-                limit=limit * 2
+        with_embeddings - векторные результаты возвращаются с полем embedding.
+        """
+        if collection_id is not None:
+            filters = {**(filters or {}), 'collection_id': collection_id}
+        limit = limit if limit is not None else settings.search_limit
+        min_similarity = min_similarity if min_similarity is not None else settings.min_similarity
+        mode = mode or settings.search_mode
+        print(f"[RAG_MANAGER] Search query: '{query[:100]}...' | doc_id: {document_id} | limit: {limit} | mode: {mode} | filters: {filters or {}}")
+        
+        if mode not in ('vector', 'hybrid', 'lexical', 'hierarchical'):
+            raise ValueError(f"Неизвестный режим поиска: {mode}")
+        
+        exact = False
+        if mode == 'hierarchical':
+            if query_embedding is None:
+                query_embedding = await asyncio.to_thread(self.embedding_model.encode, query)
+            document_ids = None
+            if not document_id:
+                document_ids = await self.vector_store.search_documents(
+                    query_embedding, limit=settings.hierarchical_top_documents, filters=filters
+                )
+            if document_ids:
+                # Вторая стадия: чанки только из отобранных документов, точным перебором
+                print(f"[RAG_MANAGER] Hierarchical search: chunk search within {len(document_ids)} documents")
+                filters = {**(filters or {}), 'document_ids': document_ids}
+                exact = True
+            else:
+                # Поиск в одном документе или векторы документов еще не посчитаны
+                print(f"[RAG_MANAGER] Hierarchical search: no document vectors, using vector search")
+            mode = 'vector'
+        
+        # Быстрый путь: поиск по ключевым словам без векторизации запроса
+        if mode == 'lexical' or (mode == 'hybrid' and is_keyword_query(query)):
+            lexical_results = await self.vector_store.search_lexical(
+                query, document_id=document_id, limit=limit, filters=filters
             )
-            
-            # Добавляем результаты, избегая дубликатов
-            for result in results:
-                chunk_id = result.get('id')
-                if chunk_id not in seen_chunks:
-                    seen_chunks.add(chunk_id)
-                    all_results.append(result)
-        
-        # Сортируем все результаты по similarity
-        all_results.sort(key=lambda x: x.get('similarity', 0), reverse=True)
+            if lexical_results or mode == 'lexical':
+                print(f"[RAG_MANAGER] Lexical search results: {len(lexical_results)}")
+                return lexical_results[:limit]
+            print(f"[RAG_MANAGER] No exact keyword matches, falling back to hybrid search")
+        
+        if mode == 'hybrid':
+            vector_results, lexical_results = await asyncio.gather(
+                self._vector_search(query, document_id, limit, filters, query_embedding, with_embeddings=with_embeddings),
+                self.vector_store.search_lexical(
+                    query, document_id=document_id, limit=limit * 2, filters=filters, match_all=False
+                )
+            )
+            vector_results = [r for r in vector_results if r.get('similarity', 0) >= min_similarity]
+            fused_results = reciprocal_rank_fusion([vector_results, lexical_results], k=settings.rrf_k)
+            print(f"[RAG_MANAGER] Hybrid search: {len(vector_results)} vector + {len(lexical_results)} lexical → {len(fused_results)} fused")
+            for i, result in enumerate(fused_results[:limit], 1):
+                print(f"[RAG_MANAGER]   Top {i}: {result['filename']} (rrf: {result['rrf_score']:.4f}, similarity: {result['similarity']:.2%})")
+            return fused_results[:limit]
+        
+        all_results = await self._vector_search(
+            query, document_id, limit, filters, query_embedding, exact, with_embeddings
+        )
         
         # Фильтруем по минимальной similarity
         filtered_results = [
@@ -147,8 +369,318 @@ class RAGManager:
             print(f"[RAG_MANAGER]   Top {i}: {result['filename']} (similarity: {result['similarity']:.2%})")
         
         return filtered_results[:limit]
+    
+    async def _vector_search(
+        self,
+        query: str,
+        document_id: Optional[int],
+        limit: int,
+        filters: Optional[Dict[str, Any]],
+        query_embedding: Optional[List[float]] = None,
+        exact: bool = False,
+        with_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Векторный поиск с кросс-языковым расширением запроса.
+        
+        Поиск по оригинальному запросу начинается сразу; определение языков идет
+        параллельно с ним. Целевые языки перевода - язык документа (при поиске в
+        документе или с фильтром language) либо все языки корпуса (document_languages):
+        тогда запрос переводится один раз на каждый язык, и перевод ищется только в
+        документах этого языка. Перевод на язык выполняется, только если лучший результат
+        первого прохода не прошел порог пары языков (см. RAG/translation_policy.py).
+        Переводы и поиски по ним идут параллельно, их результаты добавляются, если успели
+        за settings.translation_deadline_ms. Решения о переводе (по одному на целевой
+        язык) возвращаются в поле translation каждого результата.
         
-    async def generate_answer(self, query: str, document_id: Optional[int] = None, context_limit: Optional[int] = None) -> Dict[str, Any]:
+        exact - точный перебор чанков (см. VectorStore.search_similar).
+        
+        Returns:
+            Результаты по всем вариантам запроса без дубликатов, по убыванию similarity
+        """
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        
+        async def timed(step: str, awaitable):
+            step_started = time.perf_counter()
+            try:
+                return await awaitable
+            finally:
+                timings[step] = round((time.perf_counter() - step_started) * 1000, 1)
+        
+        async def search_variant(prefix: str, search_query: str, embedding, variant_filters) -> List[Dict[str, Any]]:
+            if embedding is None:
+                # Векторизация - CPU-работа, выносим из event loop
+                embedding = await timed(f"{prefix}embed", asyncio.to_thread(self.embedding_model.encode, search_query))
+            return await timed(f"{prefix}search", self.vector_store.search_similar(
+                query_embedding=embedding,
+                document_id=document_id,
+                limit=limit * 2,
+                filters=variant_filters,
+                exact=exact,
+                with_embeddings=with_embeddings
+            ))
+        
+        async def target_languages() -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+            """Целевые языки перевода и фильтры поиска по переводу на каждый из них."""
+            if document_id or (filters and filters.get('language')):
+                document_lang = await self._document_language(document_id, filters)
+                return [(document_lang, filters)] if document_lang else []
+            # Поиск по корпусу: перевод на каждый язык ищется только в документах этого языка
+            languages = await self.vector_store.get_corpus_languages(filters)
+            return [
+                (lang, {**(filters or {}), 'language_partition': lang})
+                for lang in languages[:settings.cross_lingual_max_languages]
+            ]
+        
+        async def translated_variants() -> Dict[str, List[Dict[str, Any]]]:
+            # Язык запроса и целевые языки определяются параллельно
+            query_lang, targets = await asyncio.gather(
+                timed("detect", asyncio.to_thread(self.language_detector.detect_language, query)),
+                timed("target_languages", target_languages())
+            )
+            targets = [(lang, variant_filters) for lang, variant_filters in targets if query_lang and lang != query_lang]
+            print(f"[RAG_MANAGER] Auto-detected query language: {query_lang or 'unknown'}, target languages: {[lang for lang, _ in targets]}")
+            if not targets:
+                return {}
+            
+            # Кросс-языковой запрос - переводим только на языки, где первый проход неуверенный
+            original_results = await original_task
+            top_similarity = max((r.get('similarity', 0) for r in original_results), default=0.0)
+            to_translate = []
+            for lang, variant_filters in targets:
+                pair = self.translation_policy.pair(query_lang, lang)
+                translate, threshold = self.translation_policy.decide(pair, top_similarity)
+                decisions[lang] = {
+                    'pair': pair,
+                    'top_similarity': round(top_similarity, 4),
+                    'threshold': threshold,
+                    'decision': 'translated' if translate else 'skipped'
+                }
+                print(f"[RAG_MANAGER] Cross-lingual search ({pair}), top similarity {top_similarity:.2%}, threshold {threshold}: {decisions[lang]['decision']}")
+                if translate:
+                    to_translate.append((lang, variant_filters))
+            if not to_translate:
+                return {}
+            
+            # Один перевод на язык, все языки параллельно
+            translations = await timed("translate", self.language_detector.translator.translate_many(
+                query, query_lang, [lang for lang, _ in to_translate]
+            ))
+            searches = {}
+            for lang, variant_filters in to_translate:
+                translated_query = translations.get(lang)
+                if not translated_query or translated_query == query:
+                    decisions[lang]['decision'] = 'failed'
+                    continue
+                searches[lang] = search_variant(f"translated_{lang}_", translated_query, None, variant_filters)
+            results = await asyncio.gather(*searches.values())
+            return dict(zip(searches, results))
+        
+        # Решения о переводе по целевым языкам (см. RAG/translation_policy.py)
+        decisions: Dict[str, Dict[str, Any]] = {}
+        
+        # Поиск по оригинальному запросу начинается сразу, не дожидаясь определения языка и перевода
+        original_task = asyncio.ensure_future(search_variant("", query, query_embedding, filters))
+        translated_task = asyncio.ensure_future(translated_variants())
+        translated: Dict[str, List[Dict[str, Any]]] = {}
+        try:
+            original = await original_task
+            deadline = settings.translation_deadline_ms / 1000 - (time.perf_counter() - started)
+            try:
+                # Результаты перевода добавляются, только если успели к сроку
+                translated = await asyncio.wait_for(asyncio.shield(translated_task), max(deadline, 0))
+            except asyncio.TimeoutError:
+                for decision in decisions.values():
+                    if decision['decision'] == 'translated':
+                        decision['decision'] = 'timeout'
+                print(f"[RAG_MANAGER] Translated query variants missed the {settings.translation_deadline_ms}ms deadline, using original query only")
+            except Exception as e:
+                print(f"[RAG_MANAGER] Translated query variants failed: {e}")
+        finally:
+            translated_task.cancel()
+            original_task.cancel()
+        
+        # Объединяем результаты вариантов запроса без дубликатов
+        variants = [original, *translated.values()]
+        all_results = []
+        seen_chunks = set()
+        for results in variants:
+            for result in results:
+                chunk_id = result.get('id')
+                if chunk_id not in seen_chunks:
+                    seen_chunks.add(chunk_id)
+                    all_results.append(result)
+        
+        all_results.sort(key=lambda x: x.get('similarity', 0), reverse=True)
+        # Помог ли перевод на язык: есть ли в итоговом top-k его фрагменты, которых не нашел исходный запрос
+        original_ids = {result.get('id') for result in original}
+        top_ids = {result.get('id') for result in all_results[:limit]}
+        for lang, results in translated.items():
+            decision = decisions[lang]
+            helped = any(result.get('id') in top_ids and result.get('id') not in original_ids for result in results)
+            decision['helped'] = helped
+            self.translation_policy.record(decision['pair'], decision['top_similarity'], helped)
+        if decisions:
+            for decision in decisions.values():
+                decision['translation_ms'] = timings.get('translate')
+            translation = list(decisions.values())
+            for result in all_results:
+                result['translation'] = translation
+        
+        timings['total'] = round((time.perf_counter() - started) * 1000, 1)
+        print(f"[RAG_MANAGER] Vector search: {len(variants)} query variants, timings (ms): {timings}")
+        return all_results
+    
+    async def _document_language(self, document_id: Optional[int], filters: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Язык документа(ов), в которых идет поиск, если он известен."""
+        if document_id:
+            doc_meta = await self.vector_store.get_document_meta(document_id)
+            return doc_meta.get('language') if doc_meta else None
+        if filters and filters.get('language'):
+            # Фильтр по языку однозначно задает язык найденных документов
+            return filters['language']
+        return None
+        
+    async def search_many_iter(
+        self,
+        queries: List[str],
+        document_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        min_similarity: Optional[float] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None,
+        collection_id: Optional[int] = None,
+        concurrency: Optional[int] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Пакетный поиск: все запросы векторизуются одним вызовом модели,
+        поиск выполняется параллельно с ограничением concurrency.
+        
+        Yields:
+            Dict с полями index, query и results (или error) - по мере готовности,
+            не в порядке запросов
+        """
+        concurrency = concurrency or settings.batch_search_concurrency
+        mode = mode or settings.search_mode
+        print(f"[RAG_MANAGER] Batch search: {len(queries)} queries, concurrency={concurrency}, mode={mode}")
+        
+        embeddings: List[Optional[List[float]]] = [None] * len(queries)
+        if queries and mode != 'lexical':
+            embeddings = await asyncio.to_thread(self.embedding_model.encode_batch, list(queries))
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def run(index: int) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    results = await self.search(
+                        queries[index],
+                        document_id=document_id,
+                        limit=limit,
+                        min_similarity=min_similarity,
+                        filters=filters,
+                        mode=mode,
+                        collection_id=collection_id,
+                        query_embedding=embeddings[index]
+                    )
+                    return {'index': index, 'query': queries[index], 'results': results}
+                except Exception as e:
+                    print(f"[RAG_MANAGER] Batch search error for query {index}: {e}")
+                    return {'index': index, 'query': queries[index], 'error': str(e)}
+        
+        tasks = [asyncio.create_task(run(index)) for index in range(len(queries))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Клиент отключился или итерацию прервали - не продолжаем поиск впустую
+            for task in tasks:
+                task.cancel()
+    
+    async def search_many(self, queries: List[str], **kwargs) -> List[List[Dict[str, Any]]]:
+        """
+        Пакетный поиск с результатами в порядке запросов (параметры как у search_many_iter).
+        Ошибка любого запроса прерывает весь пакет.
+        """
+        results: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        async with aclosing(self.search_many_iter(queries, **kwargs)) as batch:
+            async for item in batch:
+                if 'error' in item:
+                    raise RuntimeError(f"Ошибка поиска для запроса {item['index']}: {item['error']}")
+                results[item['index']] = item['results']
+        return results
+    
+    async def generate_answers_many_iter(
+        self,
+        queries: List[str],
+        document_id: Optional[int] = None,
+        context_limit: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        search_mode: Optional[str] = None,
+        collection_id: Optional[int] = None,
+        llm_concurrency: Optional[int] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Пакетная генерация ответов: поиск как в search_many_iter, вызовы LLM
+        идут по мере готовности поиска, не более llm_concurrency одновременно.
+        
+        Yields:
+            Dict с полями index, query и answer/sources/context (или error) по мере готовности
+        """
+        llm_concurrency = llm_concurrency or settings.batch_llm_concurrency
+        context_limit = context_limit if context_limit is not None else settings.search_limit
+        llm_semaphore = asyncio.Semaphore(llm_concurrency)
+        
+        async def answer(item: Dict[str, Any]) -> Dict[str, Any]:
+            if 'error' in item:
+                return item
+            async with llm_semaphore:
+                try:
+                    result = await self._answer_from_results(item['query'], item['results'])
+                    return {'index': item['index'], 'query': item['query'], **result}
+                except Exception as e:
+                    print(f"[RAG_MANAGER] Batch answer error for query {item['index']}: {e}")
+                    return {'index': item['index'], 'query': item['query'], 'error': str(e)}
+        
+        pending = set()
+        try:
+            async with aclosing(self.search_many_iter(
+                queries,
+                document_id=document_id,
+                limit=context_limit,
+                filters=filters,
+                mode=search_mode,
+                collection_id=collection_id
+            )) as batch:
+                async for item in batch:
+                    pending.add(asyncio.create_task(answer(item)))
+                    finished = {task for task in pending if task.done()}
+                    pending -= finished
+                    for task in finished:
+                        yield task.result()
+            
+            while pending:
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        
+    async def generate_answer(
+        self,
+        query: str,
+        document_id: Optional[int] = None,
+        context_limit: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        search_mode: Optional[str] = None,
+        collection_id: Optional[int] = None,
+        neighbor_window: Optional[int] = None,
+        mmr_lambda: Optional[float] = None,
+        rerank: Optional[bool] = None,
+        compression_ratio: Optional[float] = None
+    ) -> Dict[str, Any]:
         context_limit = context_limit if context_limit is not None else settings.search_limit
         print(f"\n{'='*80}")
         print(f"[RAG_MANAGER] ========== GENERATE ANSWER START ==========")
@@ -157,22 +689,104 @@ class RAGManager:
         print(f"[RAG_MANAGER] Context limit: {context_limit}")
         print(f"{'='*80}")
         
-        search_results = await self.search(query, document_id, limit=context_limit)
-        
+        search_results = await self.search(
+            query, document_id, limit=context_limit, filters=filters, mode=search_mode,
+            collection_id=collection_id, neighbor_window=neighbor_window, mmr_lambda=mmr_lambda,
+            rerank=rerank
+        )
+        return await self._answer_from_results(query, search_results, compression_ratio)
+    
+    async def _answer_from_results(
+        self,
+        query: str,
+        search_results: List[Dict[str, Any]],
+        compression_ratio: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Генерирует ответ LLM по уже найденным фрагментам."""
+        compression_ratio = self._compression_ratio(compression_ratio)
         if not search_results:
             print(f"[RAG_MANAGER] WARNING: No relevant documents found")
             return {
-                'answer': 'Не найдено релевантной информации в документах.',
+                'answer': NO_RESULTS_ANSWER,
                 'sources': [],
                 'context': []
             }
         
-        print(f"[RAG_MANAGER] Found {len(search_results)} relevant chunks:")
+        passages = self._pack_context(search_results)
+        passages = await self._compress_context(query, passages, compression_ratio)
+        prompt = self._build_answer_prompt(query, passages)
+        
+        llm = self._get_llm()
+        print(f"[RAG_MANAGER] Calling LLM: {llm.wrapped.__class__.__name__}")
+        answer = await llm.get_response("", prompt)
+        
+        self._log_answer(answer)
+        
+        return {
+            'answer': answer,
+            'sources': self._build_sources(self._passage_chunks(passages)),
+            'context': [passage['content'] for passage in passages]
+        }
+    
+    def _pack_context(self, search_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Склеивает соседние фрагменты в отрывки и отбирает их в бюджет токенов (см. RAG/context_packer.py)."""
+        if not search_results:
+            return []
+        token_budget = settings.answer_context_tokens
+        passages = pack_context(search_results, token_budget)
+        used_tokens = sum(passage['tokens'] for passage in passages)
+        print(f"[RAG_MANAGER] Context packed: {len(search_results)} chunks → {len(passages)} passages, ~{used_tokens}/{token_budget} tokens")
+        return passages
+    
+    @staticmethod
+    def _compression_ratio(compression_ratio: Optional[float]) -> Optional[float]:
+        compression_ratio = compression_ratio if compression_ratio is not None else settings.context_compression_ratio
+        if compression_ratio is not None and not 0.0 < compression_ratio <= 1.0:
+            raise ValueError(f"compression_ratio должен быть в диапазоне (0, 1]: {compression_ratio}")
+        return compression_ratio
+    
+    async def _compress_context(
+        self,
+        query: str,
+        passages: List[Dict[str, Any]],
+        compression_ratio: Optional[float]
+    ) -> List[Dict[str, Any]]:
+        """
+        Оставляет в отрывках предложения, близкие к запросу (см. RAG/context_compressor.py).
+        
+        Запрос и все предложения векторизуются одним пакетом.
+        """
+        if not passages or compression_ratio is None or compression_ratio >= 1.0:
+            return passages
+        passage_sentences = [split_sentences(passage['content']) for passage in passages]
+        sentences = [sentence for group in passage_sentences for sentence in group]
+        if not sentences:
+            return passages
+        
+        embeddings = np.asarray(
+            await asyncio.to_thread(self.embedding_model.encode_batch, [query] + sentences), dtype=np.float32
+        )
+        compressed = compress_passages(passages, passage_sentences, embeddings[0], embeddings[1:], compression_ratio)
+        before = sum(passage['tokens'] for passage in passages)
+        after = sum(passage['tokens'] for passage in compressed)
+        print(f"[RAG_MANAGER] Context compressed (ratio={compression_ratio}): {len(sentences)} sentences, ~{before} → ~{after} tokens")
+        return compressed
+    
+    @staticmethod
+    def _passage_chunks(passages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Фрагменты, попавшие в контекст, в порядке следования отрывков."""
+        return [chunk for passage in passages for chunk in passage['chunks']]
+    
+    def _build_answer_prompt(self, query: str, passages: List[Dict[str, Any]]) -> str:
+        print(f"[RAG_MANAGER] Context passages:")
         context_parts = []
-        for idx, result in enumerate(search_results, 1):
-            similarity = result.get('similarity', 0)
-            print(f"[RAG_MANAGER]   Chunk {idx}: {result['filename']} (similarity: {similarity:.2%}, index: {result['chunk_index']})")
-            context_parts.append(f"[Источник {idx} - {result['filename']}]:\n{result['content']}")
+        for idx, passage in enumerate(passages, 1):
+            if passage['chunk_start'] == passage['chunk_end']:
+                chunk_range = f"index: {passage['chunk_start']}"
+            else:
+                chunk_range = f"index: {passage['chunk_start']}-{passage['chunk_end']}"
+            print(f"[RAG_MANAGER]   Passage {idx}: {passage['filename']} ({chunk_range}, ~{passage['tokens']} tokens)")
+            context_parts.append(f"[Источник {idx} - {passage['filename']}]:\n{passage['content']}")
         
         context = '\n\n'.join(context_parts)
         print(f"[RAG_MANAGER] Total context: {len(context)} chars, {len(context.split())} words")
@@ -202,11 +816,9 @@ class RAGManager:
         print(f"[RAG_MANAGER] {'-'*80}")
         print(f"[RAG_MANAGER] Prompt length: {len(prompt)} chars")
         print(f"[RAG_MANAGER] {'='*80}\n")
-        
-        llm = self._get_llm()
-        print(f"[RAG_MANAGER] Calling LLM: {llm.__class__.__name__}")
-        answer = await llm.get_response("", prompt)
-        
+        return prompt
+    
+    def _log_answer(self, answer: str):
         print(f"\n[RAG_MANAGER] {'='*80}")
         print(f"[RAG_MANAGER] FULL LLM RESPONSE:")
         print(f"[RAG_MANAGER] {'-'*80}")
@@ -214,8 +826,10 @@ class RAGManager:
         print(f"[RAG_MANAGER] {'-'*80}")
         print(f"[RAG_MANAGER] Answer length: {len(answer)} chars, {len(answer.split())} words")
         print(f"[RAG_MANAGER] {'='*80}\n")
-        
-        sources = [
+    
+    @staticmethod
+    def _build_sources(search_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [
             {
                 'filename': result['filename'],
                 'document_id': result['document_id'],
@@ -224,15 +838,118 @@ class RAGManager:
             }
             for result in search_results
         ]
+    
+    async def _stream_llm(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Потоково получает ответ LLM.
         
-        return {
-            'answer': answer,
-            'sources': sources,
-            'context': [result['content'] for result in search_results]
+        Если провайдер умеет отдавать токены (метод stream_response - async
+        генератор фрагментов), фрагменты отдаются по мере поступления. Иначе
+        ответ запрашивается целиком через get_response и отдается одним куском.
+        """
+        llm = self._get_llm()
+        stream = getattr(llm, 'stream_response', None)
+        if stream is None:
+            print(f"[RAG_MANAGER] {llm.wrapped.__class__.__name__} does not support streaming, using buffered response")
+            yield await llm.get_response("", prompt)
+            return
+        
+        print(f"[RAG_MANAGER] Streaming from LLM: {llm.wrapped.__class__.__name__}")
+        async with llm.interactive():
+            async with aclosing(stream("", prompt)) as tokens:
+                async for token in tokens:
+                    if token:
+                        yield token
+    
+    async def stream_answer(
+        self,
+        query: str,
+        document_id: Optional[int] = None,
+        context_limit: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        search_mode: Optional[str] = None,
+        collection_id: Optional[int] = None,
+        neighbor_window: Optional[int] = None,
+        mmr_lambda: Optional[float] = None,
+        rerank: Optional[bool] = None,
+        compression_ratio: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковый вариант generate_answer.
+        
+        Сначала, сразу после поиска, отдается событие sources, затем события
+        token с фрагментами ответа LLM и в конце done с полным ответом.
+        
+        Yields:
+            {'event': 'sources', 'sources': [...], 'context': [...]}
+            {'event': 'token', 'text': str}
+            {'event': 'done', 'answer': str}
+        """
+        context_limit = context_limit if context_limit is not None else settings.search_limit
+        print(f"[RAG_MANAGER] Streaming answer for query: {query}")
+        compression_ratio = self._compression_ratio(compression_ratio)
+        
+        search_results = await self.search(
+            query, document_id, limit=context_limit, filters=filters, mode=search_mode,
+            collection_id=collection_id, neighbor_window=neighbor_window, mmr_lambda=mmr_lambda,
+            rerank=rerank
+        )
+        passages = self._pack_context(search_results)
+        passages = await self._compress_context(query, passages, compression_ratio)
+        yield {
+            'event': 'sources',
+            'sources': self._build_sources(self._passage_chunks(passages)),
+            'context': [passage['content'] for passage in passages]
         }
         
+        if not search_results:
+            print(f"[RAG_MANAGER] WARNING: No relevant documents found")
+            yield {'event': 'token', 'text': NO_RESULTS_ANSWER}
+            yield {'event': 'done', 'answer': NO_RESULTS_ANSWER}
+            return
+        
+        prompt = self._build_answer_prompt(query, passages)
+        
+        answer_parts = []
+        async with aclosing(self._stream_llm(prompt)) as tokens:
+            async for token in tokens:
+                answer_parts.append(token)
+                yield {'event': 'token', 'text': token}
+        
+        answer = ''.join(answer_parts)
+        self._log_answer(answer)
+        yield {'event': 'done', 'answer': answer}
+        
     async def get_documents(self) -> List[Dict[str, Any]]:
         return await self.vector_store.get_documents()
+    
+    async def list_documents(
+        self,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        filename_prefix: Optional[str] = None,
+        language: Optional[str] = None,
+        collection_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        return await self.vector_store.list_documents(
+            limit=limit,
+            cursor=cursor,
+            filename_prefix=filename_prefix,
+            language=language,
+            collection_id=collection_id
+        )
+    
+    async def create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return await self.vector_store.create_collection(name, metadata)
+    
+    async def list_collections(self) -> List[Dict[str, Any]]:
+        return await self.vector_store.list_collections()
+    
+    async def get_collection(self, collection_id: int) -> Optional[Dict[str, Any]]:
+        return await self.vector_store.get_collection(collection_id)
+    
+    async def drop_collection(self, collection_id: int) -> List[str]:
+        return await self.vector_store.drop_collection(collection_id)
         
     async def get_document(self, document_id: int) -> Optional[Dict[str, Any]]:
         return await self.vector_store.get_document(document_id)
@@ -240,15 +957,21 @@ class RAGManager:
     async def delete_document(self, document_id: int):
         await self.vector_store.delete_document(document_id)
     
-    async def summarize_document(self, document_id: int) -> Dict[str, Any]:
+    async def summarize_document(self, document_id: int, force: bool = False) -> Dict[str, Any]:
         """
         Генерирует краткое содержание (суммаризацию) указанного документа.
         
+        Длинный документ суммаризируется целиком по схеме map-reduce (SUMMARY_MODE):
+        разделы размером под контекст LLM, затем свертка кратких содержаний.
+        Результат сохраняется (см. RAG/artifacts.py), повторный запрос бесплатен.
+        
         Args:
             document_id: ID документа для суммаризации
+            force: не использовать сохраненный результат, посчитать заново
             
         Returns:
-            Dict с полями: summary, document_id, filename, chunk_count
+            Dict с полями: summary, document_id, filename, chunk_count,
+            cached (результат взят из сохраненных без вызова LLM)
         """
         print(f"\n{'='*80}")
         print(f"[RAG_MANAGER] ========== SUMMARIZE DOCUMENT START ==========")
@@ -263,33 +986,105 @@ class RAGManager:
         print(f"[RAG_MANAGER] Document: {document['filename']}")
         print(f"[RAG_MANAGER] Chunk count: {document['chunk_count']}")
         
-        # Получаем все чанки документа
-        chunks = await self.vector_store.get_document_chunks(document_id)
-        print(f"[RAG_MANAGER] Retrieved {len(chunks)} chunks")
-        
-        if not chunks:
+        llm = self._get_llm()
+        section_chars = settings.summary_section_chars
+        # Разбиение на разделы зависит от режима и размера контекста - они входят в ключ
+        checkpoint = LLMCheckpoint(
+            self.vector_store, document_id, 'summary',
+            f"{SUMMARY_PROMPT_VERSION}:{settings.summary_mode}:{section_chars}", llm_model_id(llm)
+        )
+        await checkpoint.load(force=force)
+        summary = checkpoint.get('final')
+        if summary is not None:
+            print(f"[RAG_MANAGER] Using saved summary (no LLM calls)")
             return {
-                'summary': 'Документ не содержит текстовых данных для суммаризации.',
+                'summary': summary,
                 'document_id': document_id,
                 'filename': document['filename'],
-                'chunk_count': 0
+                'chunk_count': document['chunk_count'],
+                'cached': True
             }
         
-        # Объединяем чанки в текст (сортируем по chunk_index)
-        sorted_chunks = sorted(chunks, key=lambda x: x.get('chunk_index', 0))
-        full_text = '\n\n'.join([chunk['content'] for chunk in sorted_chunks])
+        # Документ читается потоково разделами размером под контекст LLM.
+        # Если он помещается в один раздел - один вызов LLM, иначе map-reduce:
+        # разделы суммаризируются параллельно по мере чтения, затем сворачиваются
+        stats = {'chunks': 0, 'chars': 0, 'words': 0}
+        semaphore = asyncio.Semaphore(settings.summary_llm_concurrency)
+        section_tasks = []
+        
+        async with aclosing(self._iter_document_parts(document_id, section_chars, stats)) as sections_stream:
+            section = await anext(sections_stream, None)
+            if section is None:
+                return {
+                    'summary': 'Документ не содержит текстовых данных для суммаризации.',
+                    'document_id': document_id,
+                    'filename': document['filename'],
+                    'chunk_count': 0
+                }
+            next_section = await anext(sections_stream, None)
+            
+            if next_section is not None and settings.summary_mode == 'map_reduce':
+                async def start_section(text: str):
+                    # Не больше summary_llm_concurrency разделов в работе: остальные еще не прочитаны
+                    await self._wait_for_slot(section_tasks, settings.summary_llm_concurrency)
+                    section_tasks.append(asyncio.create_task(self._summarize_section(
+                        llm, semaphore, checkpoint, document['filename'], len(section_tasks) + 1, text
+                    )))
+                
+                try:
+                    await start_section(section)
+                    await start_section(next_section)
+                    async for section_text in sections_stream:
+                        await start_section(section_text)
+                    section_summaries = await asyncio.gather(*section_tasks)
+                finally:
+                    for task in section_tasks:
+                        task.cancel()
+        
+        print(f"[RAG_MANAGER] Read {stats['chunks']} chunks: {stats['chars']} chars, {stats['words']} words")
+        
+        if section_tasks:
+            print(f"[RAG_MANAGER] Map stage: {len(section_summaries)} sections (~{section_chars} chars each)")
+            summary = await self._reduce_summaries(
+                llm, semaphore, checkpoint, document['filename'], section_summaries, section_chars
+            )
+        else:
+            if next_section is not None:
+                # Режим truncate: суммаризируется только первый раздел
+                print(f"[RAG_MANAGER] Text too long, truncating to {len(section)} chars")
+                text_for_summary = section + "\n\n[... текст обрезан ...]"
+            else:
+                text_for_summary = section
+            
+            prompt = self._build_summary_prompt(document['filename'], text_for_summary)
+            print(f"[RAG_MANAGER] Prompt length: {len(prompt)} chars")
+            
+            # Получаем ответ от LLM
+            print(f"[RAG_MANAGER] Calling LLM: {llm.wrapped.__class__.__name__}")
+            summary = await llm.get_response("", prompt)
+        
+        await checkpoint.save('final', summary)
         
-        print(f"[RAG_MANAGER] Full text length: {len(full_text)} chars, {len(full_text.split())} words")
+        print(f"\n[RAG_MANAGER] {'='*80}")
+        print(f"[RAG_MANAGER] SUMMARY GENERATED:")
+        print(f"[RAG_MANAGER] {'-'*80}")
+        print(summary)
+        print(f"[RAG_MANAGER] {'-'*80}")
+        print(f"[RAG_MANAGER] Summary length: {len(summary)} chars, {len(summary.split())} words")
+        print(f"[RAG_MANAGER] {'='*80}\n")
         
-        # Если текст слишком большой, берем первые N символов для суммаризации
-        max_chars = 15000  # Ограничение для LLM
-        if len(full_text) > max_chars:
-            print(f"[RAG_MANAGER] Text too long, truncating to {max_chars} chars")
-            text_for_summary = full_text[:max_chars] + "\n\n[... текст обрезан ...]"
-        else:
-            text_for_summary = full_text
+        print(f"[RAG_MANAGER] ========== SUMMARIZE DOCUMENT COMPLETE ==========\n")
         
-        # Создаем промпт для суммаризации
+        return {
+            'summary': summary,
+            'document_id': document_id,
+            'filename': document['filename'],
+            'chunk_count': document['chunk_count'],
+            'cached': False
+        }
+    
+    def _build_summary_prompt(self, filename: str, text_for_summary: str) -> str:
+        """Строит промпт суммаризации документа, помещающегося в один вызов LLM."""
         prompt = f"""Создай краткое содержание (суммаризацию) следующего документа.
 
 ТРЕБОВАНИЯ К СУММАРИЗАЦИИ:
@@ -302,126 +1097,152 @@ class RAGManager:
 7. Укажи ключевые выводы или заключения, если они есть
 8. Не добавляй информацию, которой нет в тексте
 
-ДОКУМЕНТ: {document['filename']}
+ДОКУМЕНТ: {filename}
 
 ТЕКСТ ДОКУМЕНТА:
 {text_for_summary}
 
 КРАТКОЕ СОДЕРЖАНИЕ:"""
+        return prompt
+    
+    async def _summarize_section(
+        self, llm, semaphore: asyncio.Semaphore, checkpoint: LLMCheckpoint, filename: str, i: int, section: str
+    ) -> str:
+        """Краткое содержание одного раздела документа (этап map)."""
+        step = f"section:{i}"
+        cached = checkpoint.get(step)
+        if cached is not None:
+            print(f"[RAG_MANAGER] Section {i}: using saved summary")
+            return cached
+        
+        prompt = f"""Создай краткое содержание раздела {i} документа. Это часть большого документа:
+краткие содержания всех разделов затем будут объединены в общее.
+
+ТРЕБОВАНИЯ:
+1. Сохрани все ключевые темы, факты, цифры, определения и выводы раздела
+2. Используй маркированные списки для перечисления ключевых пунктов
+3. Выдели важные термины и понятия жирным шрифтом (**термин**)
+4. Сохрани последовательность изложения как в оригинале
+5. Не добавляй информацию, которой нет в тексте
+
+ДОКУМЕНТ: {filename}
+
+ТЕКСТ РАЗДЕЛА {i}:
+{section}
+
+КРАТКОЕ СОДЕРЖАНИЕ РАЗДЕЛА {i}:"""
         
-        print(f"[RAG_MANAGER] Prompt length: {len(prompt)} chars")
-        
-        # Получаем ответ от LLM
-        llm = self._get_llm()
-        print(f"[RAG_MANAGER] Calling LLM: {llm.__class__.__name__}")
-        summary = await llm.get_response("", prompt)
-        
-        print(f"\n[RAG_MANAGER] {'='*80}")
-        print(f"[RAG_MANAGER] SUMMARY GENERATED:")
-        print(f"[RAG_MANAGER] {'-'*80}")
-        print(summary)
-        print(f"[RAG_MANAGER] {'-'*80}")
-        print(f"[RAG_MANAGER] Summary length: {len(summary)} chars, {len(summary.split())} words")
-        print(f"[RAG_MANAGER] {'='*80}\n")
-        
-        print(f"[RAG_MANAGER] ========== SUMMARIZE DOCUMENT COMPLETE ==========\n")
+        async with semaphore:
+            print(f"[RAG_MANAGER] Summarizing section {i} ({len(section)} chars)")
+            summary = await llm.get_response("", prompt)
         
-        return {
-            'summary': summary,
-            'document_id': document_id,
-            'filename': document['filename'],
-            'chunk_count': len(chunks)
-        }
+        await checkpoint.save(step, summary)
+        return summary
     
-    async def create_referat(self, document_id: int, output_dir: str = "referats") -> Dict[str, Any]:
+    async def _reduce_summaries(
+        self,
+        llm,
+        semaphore: asyncio.Semaphore,
+        checkpoint: LLMCheckpoint,
+        filename: str,
+        summaries: List[str],
+        max_chars: int
+    ) -> str:
         """
-        Создает реферативный перевод документа.
-        Реферативный перевод - это подробный анализ документа с сохранением
-        всех ключевых положений, но значительно сокращенный по объему.
+        Сворачивает краткие содержания разделов в одно (этап reduce).
         
-        Args:
-            document_id: ID документа
-            output_dir: директория для сохранения PDF
-            
-        Returns:
-            Dict с полями: referat, document_id, filename, chunk_count, pdf_url, pdf_path
+        Пока объединенный текст не помещается в один вызов LLM, соседние
+        краткие содержания сворачиваются группами параллельно.
         """
-        print(f"\n{'='*80}")
-        print(f"[RAG_MANAGER] ========== CREATE REFERAT START ==========")
-        print(f"[RAG_MANAGER] Document ID: {document_id}")
-        print(f"{'='*80}")
-        
-        # Получаем информацию о документе
-        document = await self.vector_store.get_document(document_id)
-        if not document:
-            raise ValueError(f"Документ с ID {document_id} не найден")
-        
-        print(f"[RAG_MANAGER] Document: {document['filename']}")
-        print(f"[RAG_MANAGER] Chunk count: {document['chunk_count']}")
-        
-        # Получаем все чанки документа
-        chunks = await self.vector_store.get_document_chunks(document_id)
-        print(f"[RAG_MANAGER] Retrieved {len(chunks)} chunks")
-        
-        if not chunks:
-            return {
-                'referat': 'Документ не содержит текстовых данных для создания реферата.',
-                'document_id': document_id,
-                'filename': document['filename'],
-                'chunk_count': 0,
-                'pdf_url': '',
-                'pdf_path': ''
-            }
-        
-        # Сортируем чанки по порядку
-        sorted_chunks = sorted(chunks, key=lambda x: x.get('chunk_index', 0))
-        
-        # Разбиваем документ на части для обработки
-        # Каждая часть ~10000 символов для качественного анализа
-        chunk_size_for_referat = 10000
-        parts = []
-        current_part = []
-        current_length = 0
-        
-        for chunk in sorted_chunks:
-            chunk_text = chunk['content']
-            chunk_len = len(chunk_text)
+        level = 1
+        while sum(len(summary) for summary in summaries) > max_chars and len(summaries) > 2:
+            # Жадно собираем соседние части в группы, помещающиеся в max_chars (минимум по 2)
+            groups = [[]]
+            group_length = 0
+            for summary in summaries:
+                if len(groups[-1]) >= 2 and group_length + len(summary) > max_chars:
+                    groups.append([])
+                    group_length = 0
+                groups[-1].append(summary)
+                group_length += len(summary)
             
-            if current_length + chunk_len > chunk_size_for_referat and current_part:
-                # Сохраняем текущую часть и начинаем новую
-                parts.append('\n\n'.join(current_part))
-                current_part = [chunk_text]
-                current_length = chunk_len
-            else:
-                current_part.append(chunk_text)
-                current_length += chunk_len
-        
-        # Добавляем последнюю часть
-        if current_part:
-            parts.append('\n\n'.join(current_part))
-        
-        print(f"[RAG_MANAGER] Document split into {len(parts)} parts for analysis")
+            print(f"[RAG_MANAGER] Reduce level {level}: {len(summaries)} summaries -> {len(groups)} groups")
+            summaries = await self._gather_cancelling([
+                self._reduce_summary_group(llm, semaphore, checkpoint, filename, f"reduce:{level}:{j}", group, final=False)
+                for j, group in enumerate(groups, 1)
+            ])
+            level += 1
+        
+        print(f"[RAG_MANAGER] Final reduce of {len(summaries)} summaries")
+        return await self._reduce_summary_group(llm, semaphore, checkpoint, filename, None, summaries, final=True)
+    
+    async def _reduce_summary_group(
+        self,
+        llm,
+        semaphore: asyncio.Semaphore,
+        checkpoint: LLMCheckpoint,
+        filename: str,
+        step: Optional[str],
+        group: List[str],
+        final: bool
+    ) -> str:
+        if len(group) == 1 and not final:
+            return group[0]
+        if step is not None:
+            cached = checkpoint.get(step)
+            if cached is not None:
+                return cached
+        
+        combined = '\n\n---\n\n'.join(
+            f"### Часть {j}\n{summary}" for j, summary in enumerate(group, 1)
+        )
+        if final:
+            task = """Объедини их в единое краткое содержание всего документа.
+
+ТРЕБОВАНИЯ К СУММАРИЗАЦИИ:
+1. Начни с общего описания в 2-3 предложениях
+2. Выдели основные темы и разделы документа
+3. Используй маркированные списки для перечисления ключевых пунктов
+4. Выдели важные термины и понятия жирным шрифтом (**термин**)
+5. Структурируй информацию с использованием заголовков
+6. Сохрани последовательность изложения как в оригинале
+7. Укажи ключевые выводы или заключения, если они есть
+8. Не добавляй информацию, которой нет в тексте"""
+        else:
+            task = """Объедини их в одно краткое содержание этой части документа.
+
+ТРЕБОВАНИЯ:
+1. Сохрани все ключевые темы, факты, определения и выводы
+2. Убери повторы между частями
+3. Сохрани последовательность изложения как в оригинале
+4. Не добавляй информацию, которой нет в тексте"""
+        
+        prompt = f"""Ниже краткие содержания последовательных частей документа.
+{task}
+
+ДОКУМЕНТ: {filename}
+
+КРАТКИЕ СОДЕРЖАНИЯ ЧАСТЕЙ:
+{combined}
+
+КРАТКОЕ СОДЕРЖАНИЕ:"""
         
-        # Обрабатываем каждую часть
-        llm = self._get_llm()
-        referat_parts = []
+        async with semaphore:
+            summary = await llm.get_response("", prompt)
         
-        for i, part in enumerate(parts, 1):
-            print(f"[RAG_MANAGER] Processing part {i}/{len(parts)}")
-            
-            # Создаем промпт для реферативного перевода части
-            if len(parts) == 1:
-                part_info = "весь документ"
-            else:
-                part_info = f"часть {i} из {len(parts)}"
-            
-            # Вычисляем целевой размер реферата (35% от оригинала)
-            part_word_count = len(part.split())
-            target_word_count = int(part_word_count * 0.35)
-            min_word_count = int(part_word_count * 0.30)
-            max_word_count = int(part_word_count * 0.45)
-            
-            prompt = f"""Создай ПОДРОБНЫЙ РЕФЕРАТИВНЫЙ ПЕРЕВОД следующей части документа ({part_info}).
+        if step is not None:
+            await checkpoint.save(step, summary)
+        return summary
+    
+    def _build_referat_part_prompt(self, part: str, part_info: str) -> str:
+        """Строит промпт реферативного перевода одной части документа."""
+        # Вычисляем целевой размер реферата (35% от оригинала)
+        part_word_count = len(part.split())
+        target_word_count = int(part_word_count * 0.35)
+        min_word_count = int(part_word_count * 0.30)
+        max_word_count = int(part_word_count * 0.45)
+        
+        prompt = f"""Создай ПОДРОБНЫЙ РЕФЕРАТИВНЫЙ ПЕРЕВОД следующей части документа ({part_info}).
 
 ⚠️ СТРОГИЕ ТРЕБОВАНИЯ К ОБЪЕМУ (ОБЯЗАТЕЛЬНО ВЫПОЛНИ):
 📊 Исходный текст: ~{part_word_count} слов
@@ -462,59 +1283,110 @@ class RAGManager:
 {part}
 
 СОЗДАЙ ПОДРОБНЫЙ РЕФЕРАТИВНЫЙ ПЕРЕВОД (минимум {min_word_count} слов):"""
-            
+        return prompt
+    
+    @staticmethod
+    async def _wait_for_slot(tasks: List[asyncio.Task], limit: int):
+        """
+        Ждет, пока незавершенных задач станет меньше limit.
+        
+        Обратное давление для потокового чтения документа: следующая часть читается
+        только когда есть свободный слот, поэтому в памяти не больше limit частей.
+        Ошибка завершившейся задачи пробрасывается сразу.
+        """
+        pending = [task for task in tasks if not task.done()]
+        while len(pending) >= limit:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+    
+    @staticmethod
+    async def _gather_cancelling(coros: List[Any]) -> List[Any]:
+        """asyncio.gather, который при ошибке одной задачи отменяет остальные."""
+        tasks = [asyncio.create_task(coro) for coro in coros]
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _referat_part(
+        self, llm, semaphore: asyncio.Semaphore, checkpoint: LLMCheckpoint, i: int, part: str, part_info: str
+    ) -> str:
+        """Реферативный перевод одной части документа (этап map)."""
+        step = f"part:{i}"
+        cached = checkpoint.get(step)
+        if cached is not None:
+            print(f"[RAG_MANAGER] Part {i}: using saved result")
+            return cached
+        
+        part_word_count = len(part.split())
+        min_word_count = int(part_word_count * 0.30)
+        prompt = self._build_referat_part_prompt(part, part_info)
+        
+        async with semaphore:
+            print(f"[RAG_MANAGER] Processing part {i}")
+            started = time.perf_counter()
             part_referat = await llm.get_response("", prompt)
-            referat_parts.append(part_referat)
-            
-            # Логирование с проверкой объема
-            referat_words = len(part_referat.split())
-            compression_ratio = (referat_words / part_word_count * 100) if part_word_count > 0 else 0
-            print(f"[RAG_MANAGER] Part {i} processed:")
-            print(f"  - Input: {part_word_count} words, {len(part)} chars")
-            print(f"  - Output: {referat_words} words, {len(part_referat)} chars")
-            print(f"  - Compression: {compression_ratio:.1f}% (target: 30-45%)")
-            
-            if referat_words < min_word_count:
-                print(f"  ⚠️  WARNING: Output is below minimum ({referat_words} < {min_word_count})")
         
-        # Если частей больше одной, создаем общую структуру
-        if len(referat_parts) > 1:
-            print(f"[RAG_MANAGER] Starting hierarchical merging of {len(referat_parts)} parts")
-            
-            # Иерархическое объединение: объединяем части группами по 8
-            # Это позволяет обработать большие документы не упираясь в лимит контекста
-            def chunk_list(lst, n):
-                """Разбивает список на группы по n элементов"""
-                for i in range(0, len(lst), n):
-                    yield lst[i:i + n]
-            
-            current_parts = referat_parts
-            level = 1
-            
-            # Объединяем пока не останется одна часть
-            while len(current_parts) > 1:
-                print(f"[RAG_MANAGER] Merging level {level}: {len(current_parts)} parts")
-                next_parts = []
-                
-                # Разбиваем на группы по 8 частей
-                groups = list(chunk_list(current_parts, 8))
-                
-                for i, group in enumerate(groups, 1):
-                    if len(group) == 1:
-                        # Если в группе одна часть, просто добавляем её
-                        next_parts.append(group[0])
-                        continue
-                    
-                    print(f"[RAG_MANAGER]   Merging group {i}/{len(groups)} ({len(group)} parts)")
-                    
-                    # Объединяем части группы
-                    combined_group = '\n\n---\n\n'.join(group)
-                    
-                    # Подсчитываем общее количество слов в частях
-                    total_words = sum(len(part.split()) for part in group)
-                    min_expected_words = int(total_words * 0.85)  # Минимум 85% от суммы частей
-                    
-                    merge_prompt = f"""У тебя есть {len(group)} частей реферативного перевода документа.
+        # Логирование с проверкой объема
+        referat_words = len(part_referat.split())
+        compression_ratio = (referat_words / part_word_count * 100) if part_word_count > 0 else 0
+        print(f"[RAG_MANAGER] Part {i} processed in {time.perf_counter() - started:.1f}s:")
+        print(f"  - Input: {part_word_count} words, {len(part)} chars")
+        print(f"  - Output: {referat_words} words, {len(part_referat)} chars")
+        print(f"  - Compression: {compression_ratio:.1f}% (target: 30-45%)")
+        
+        if referat_words < min_word_count:
+            print(f"  ⚠️  WARNING: Output is below minimum ({referat_words} < {min_word_count})")
+        
+        await checkpoint.save(step, part_referat)
+        return part_referat
+    
+    async def _merge_referat_group(
+        self, llm, semaphore: asyncio.Semaphore, checkpoint: LLMCheckpoint,
+        level: int, i: int, group_count: int, group: List[str]
+    ) -> str:
+        """Объединяет группу рефератов частей в один связный текст."""
+        if len(group) == 1:
+            # Если в группе одна часть, просто возвращаем её
+            return group[0]
+        
+        step = f"merge:{level}:{i}"
+        cached = checkpoint.get(step)
+        if cached is not None:
+            print(f"[RAG_MANAGER]   Group {i}: using saved result")
+            return cached
+        
+        # Подсчитываем общее количество слов в частях
+        total_words = sum(len(part.split()) for part in group)
+        min_expected_words = int(total_words * 0.85)  # Минимум 85% от суммы частей
+        merge_prompt = self._build_referat_merge_prompt(group, total_words, min_expected_words)
+        
+        async with semaphore:
+            print(f"[RAG_MANAGER]   Merging group {i}/{group_count} ({len(group)} parts)")
+            merged = await llm.get_response("", merge_prompt)
+        
+        # Логирование объединения
+        merged_words = len(merged.split())
+        retention_ratio = (merged_words / total_words * 100) if total_words > 0 else 0
+        print(f"[RAG_MANAGER]   Group {i} merged:")
+        print(f"    - Input: {total_words} words (from {len(group)} parts)")
+        print(f"    - Output: {merged_words} words")
+        print(f"    - Retention: {retention_ratio:.1f}% (target: 85%+)")
+        
+        if merged_words < min_expected_words:
+            print(f"    ⚠️  WARNING: Merged output is too short ({merged_words} < {min_expected_words})")
+        
+        await checkpoint.save(step, merged)
+        return merged
+    
+    def _build_referat_merge_prompt(self, group: List[str], total_words: int, min_expected_words: int) -> str:
+        """Строит промпт объединения группы рефератов частей."""
+        # Объединяем части группы
+        combined_group = '\n\n---\n\n'.join(group)
+        
+        merge_prompt = f"""У тебя есть {len(group)} частей реферативного перевода документа.
 Твоя задача - объединить их в ЕДИНЫЙ СВЯЗНЫЙ текст БЕЗ СОКРАЩЕНИЯ содержания.
 
 ⚠️ СТРОГИЕ ТРЕБОВАНИЯ К ОБЪЕМУ:
@@ -548,32 +1420,13 @@ class RAGManager:
 {combined_group}
 
 ОБЪЕДИНИ В СВЯЗНЫЙ ТЕКСТ (минимум {min_expected_words} слов, сохрани все детали):"""
-                    
-                    merged = await llm.get_response("", merge_prompt)
-                    next_parts.append(merged)
-                    
-                    # Логирование объединения
-                    merged_words = len(merged.split())
-                    retention_ratio = (merged_words / total_words * 100) if total_words > 0 else 0
-                    print(f"[RAG_MANAGER]   Group {i} merged:")
-                    print(f"    - Input: {total_words} words (from {len(group)} parts)")
-                    print(f"    - Output: {merged_words} words")
-                    print(f"    - Retention: {retention_ratio:.1f}% (target: 85%+)")
-                    
-                    if merged_words < min_expected_words:
-                        print(f"    ⚠️  WARNING: Merged output is too short ({merged_words} < {min_expected_words})")
-                
-                current_parts = next_parts
-                level += 1
-            
-            # Финальная часть - добавляем введение и заключение
-            base_referat = current_parts[0]
-            
-            # Подсчитываем слова в базовом реферате
-            base_words = len(base_referat.split())
-            min_final_words = base_words + 100  # Минимум: базовый текст + введение + заключение
-            
-            final_prompt = f"""У тебя есть ПОЛНЫЙ реферативный перевод документа.
+        return merge_prompt
+    
+    def _build_referat_final_prompt(self, base_referat: str, min_final_words: int) -> str:
+        """Строит промпт добавления введения и заключения к объединенному реферату."""
+        base_words = len(base_referat.split())
+        
+        final_prompt = f"""У тебя есть ПОЛНЫЙ реферативный перевод документа.
 Твоя задача - добавить ВВЕДЕНИЕ в начало и ЗАКЛЮЧЕНИЕ в конец.
 
 ⚠️ СТРОГОЕ ТРЕБОВАНИЕ К ОБЪЕМУ:
@@ -603,9 +1456,145 @@ class RAGManager:
 {base_referat}
 
 ДОБАВЬ ВВЕДЕНИЕ И ЗАКЛЮЧЕНИЕ (итого минимум {min_final_words} слов):"""
+        return final_prompt
+    
+    async def _iter_document_parts(self, document_id: int, part_size: int, stats: Dict[str, int]) -> AsyncIterator[str]:
+        """
+        Потоково собирает текст документа в части по ~part_size символов.
+        
+        Args:
+            document_id: ID документа
+            part_size: целевой размер части в символах
+            stats: словарь, в котором накапливаются chunks/chars/words прочитанного текста
+            
+        Yields:
+            str: текст очередной части (чанки, склеенные через пустую строку)
+        """
+        current_part = []
+        current_length = 0
+        
+        async with aclosing(self.vector_store.iter_document_chunks(document_id)) as chunk_stream:
+            async for chunk in chunk_stream:
+                chunk_text = chunk['content']
+                chunk_len = len(chunk_text)
+                stats['chunks'] += 1
+                stats['chars'] += chunk_len
+                stats['words'] += len(chunk_text.split())
+                
+                if current_length + chunk_len > part_size and current_part:
+                    # Отдаем текущую часть и начинаем новую
+                    yield '\n\n'.join(current_part)
+                    current_part = [chunk_text]
+                    current_length = chunk_len
+                else:
+                    current_part.append(chunk_text)
+                    current_length += chunk_len
+        
+        # Отдаем последнюю часть
+        if current_part:
+            yield '\n\n'.join(current_part)
+    
+    async def _generate_referat(
+        self,
+        document_id: int,
+        llm,
+        checkpoint: LLMCheckpoint,
+        stats: Dict[str, int],
+        timings: Dict[str, float]
+    ) -> Optional[str]:
+        """
+        Конвейер реферата: рефераты частей, иерархическое объединение, введение и заключение.
+        
+        Готовые шаги берутся из checkpoint, новые сохраняются в него сразу после выполнения.
+        
+        Returns:
+            Итоговый текст реферата или None, если в документе нет текста
+        """
+        # Разбиваем документ на части для обработки
+        # Каждая часть ~10000 символов для качественного анализа.
+        # Чанки читаются потоково: первая часть уходит в LLM раньше,
+        # чем с сервера прочитан весь документ
+        chunk_size_for_referat = 10000
+        stage_start = time.perf_counter()
+        
+        async with aclosing(self._iter_document_parts(document_id, chunk_size_for_referat, stats)) as parts_stream:
+            part = await anext(parts_stream, None)
+            
+            if part is None:
+                return None
+            
+            # Части отправляются в LLM по мере чтения, не дожидаясь предыдущих:
+            # одновременно выполняется не более referat_llm_concurrency вызовов, и
+            # следующая часть читается только когда освободится слот
+            semaphore = asyncio.Semaphore(settings.referat_llm_concurrency)
+            part_tasks = []
+            i = 0
+            
+            try:
+                while part is not None:
+                    await self._wait_for_slot(part_tasks, settings.referat_llm_concurrency)
+                    # Читаем следующую часть заранее, чтобы знать, последняя ли текущая
+                    next_part = await anext(parts_stream, None)
+                    i += 1
+                    
+                    if i == 1 and next_part is None:
+                        part_info = "весь документ"
+                    elif next_part is None:
+                        part_info = f"часть {i} из {i}"
+                    else:
+                        part_info = f"часть {i}"
+                    
+                    part_tasks.append(asyncio.create_task(
+                        self._referat_part(llm, semaphore, checkpoint, i, part, part_info)
+                    ))
+                    part = next_part
+                
+                # gather сохраняет порядок частей независимо от порядка завершения
+                referat_parts = await asyncio.gather(*part_tasks)
+            finally:
+                for task in part_tasks:
+                    task.cancel()
+        
+        timings['map'] = time.perf_counter() - stage_start
+        print(f"[RAG_MANAGER] Map stage: {len(referat_parts)} parts in {timings['map']:.1f}s")
+        
+        # Если частей больше одной, создаем общую структуру
+        if len(referat_parts) > 1:
+            print(f"[RAG_MANAGER] Starting hierarchical merging of {len(referat_parts)} parts")
+            stage_start = time.perf_counter()
+            
+            # Иерархическое объединение: объединяем части группами по 8
+            # Это позволяет обработать большие документы не упираясь в лимит контекста.
+            # Группы одного уровня независимы и объединяются параллельно
+            current_parts = referat_parts
+            level = 1
+            
+            # Объединяем пока не останется одна часть
+            while len(current_parts) > 1:
+                print(f"[RAG_MANAGER] Merging level {level}: {len(current_parts)} parts")
+                groups = [current_parts[j:j + 8] for j in range(0, len(current_parts), 8)]
+                current_parts = await self._gather_cancelling([
+                    self._merge_referat_group(llm, semaphore, checkpoint, level, j, len(groups), group)
+                    for j, group in enumerate(groups, 1)
+                ])
+                level += 1
+            
+            timings['merge'] = time.perf_counter() - stage_start
+            print(f"[RAG_MANAGER] Merge stage: {level - 1} levels in {timings['merge']:.1f}s")
+            
+            # Финальная часть - добавляем введение и заключение
+            stage_start = time.perf_counter()
+            base_referat = current_parts[0]
+            
+            # Подсчитываем слова в базовом реферате
+            base_words = len(base_referat.split())
+            min_final_words = base_words + 100  # Минимум: базовый текст + введение + заключение
+            final_prompt = self._build_referat_final_prompt(base_referat, min_final_words)
             
             print(f"[RAG_MANAGER] Adding introduction and conclusion")
             final_referat = await llm.get_response("", final_prompt)
+            await checkpoint.save('final', final_referat)
+            timings['final'] = time.perf_counter() - stage_start
             
             # Логирование финального этапа
             final_words = len(final_referat.split())
@@ -619,25 +1608,86 @@ class RAGManager:
         else:
             final_referat = referat_parts[0]
             final_words = len(final_referat.split())
+            await checkpoint.save('final', final_referat)
             print(f"[RAG_MANAGER] Single-part referat (no merging needed)")
         
         # Итоговая статистика
-        total_chars = sum(len(chunk['content']) for chunk in chunks)
-        total_input_words = sum(len(chunk['content'].split()) for chunk in chunks)
+        total_chars = stats['chars']
+        total_input_words = stats['words']
         final_compression = (final_words / total_input_words * 100) if total_input_words > 0 else 0
         
         print(f"\n[RAG_MANAGER] ========== REFERAT STATISTICS ==========")
         print(f"Original document:")
         print(f"  - Total chars: {total_chars}")
         print(f"  - Total words: {total_input_words}")
-        print(f"  - Chunks: {len(chunks)}")
+        print(f"  - Chunks: {stats['chunks']}")
         print(f"Referat:")
         print(f"  - Total chars: {len(final_referat)}")
         print(f"  - Total words: {final_words}")
         print(f"  - Compression ratio: {final_compression:.1f}% (target: 30-40%)")
         print(f"==========================================")
         
+        return final_referat
+    
+    async def create_referat(self, document_id: int, output_dir: str = "referats", force: bool = False) -> Dict[str, Any]:
+        """
+        Создает реферативный перевод документа.
+        Реферативный перевод - это подробный анализ документа с сохранением
+        всех ключевых положений, но значительно сокращенный по объему.
+        
+        Args:
+            document_id: ID документа
+            output_dir: директория для сохранения PDF
+            force: не использовать сохраненные результаты шагов, посчитать заново
+            
+        Returns:
+            Dict с полями: referat, document_id, filename, chunk_count, pdf_url, pdf_path,
+            timings (длительность этапов map/merge/final/pdf/total в секундах),
+            cached (итог взят из сохраненных результатов без вызовов LLM)
+        """
+        print(f"\n{'='*80}")
+        print(f"[RAG_MANAGER] ========== CREATE REFERAT START ==========")
+        print(f"[RAG_MANAGER] Document ID: {document_id}")
+        print(f"{'='*80}")
+        
+        # Получаем информацию о документе
+        document = await self.vector_store.get_document(document_id)
+        if not document:
+            raise ValueError(f"Документ с ID {document_id} не найден")
+        
+        print(f"[RAG_MANAGER] Document: {document['filename']}")
+        print(f"[RAG_MANAGER] Chunk count: {document['chunk_count']}")
+        
+        timings: Dict[str, float] = {}
+        total_start = time.perf_counter()
+        stats = {'chunks': 0, 'chars': 0, 'words': 0}
+        
+        llm = self._get_llm()
+        checkpoint = LLMCheckpoint(
+            self.vector_store, document_id, 'referat', REFERAT_PROMPT_VERSION, llm_model_id(llm)
+        )
+        await checkpoint.load(force=force)
+        
+        final_referat = checkpoint.get('final')
+        cached = final_referat is not None
+        if cached:
+            # Документ не менялся: итог уже посчитан, вызовы LLM не нужны
+            print(f"[RAG_MANAGER] Using saved referat (no LLM calls)")
+            stats['chunks'] = document['chunk_count']
+        else:
+            final_referat = await self._generate_referat(document_id, llm, checkpoint, stats, timings)
+            if final_referat is None:
+                return {
+                    'referat': 'Документ не содержит текстовых данных для создания реферата.',
+                    'document_id': document_id,
+                    'filename': document['filename'],
+                    'chunk_count': 0,
+                    'pdf_url': '',
+                    'pdf_path': ''
+                }
+        
         # Генерируем PDF
+        stage_start = time.perf_counter()
         pdf_generator = get_pdf_generator()
         
         # Создаем URL-безопасное имя файла для PDF
@@ -656,23 +1706,28 @@ class RAGManager:
             filename=pdf_filename,
             output_path=output_dir,
             original_filename=document['filename'],
-            chunk_count=len(chunks),
+            chunk_count=stats['chunks'],
             metadata=document.get('metadata', {})
         )
         
         # Формируем URL для скачивания
         pdf_url = f"/referats/{pdf_filename}"
+        timings['pdf'] = time.perf_counter() - stage_start
+        timings['total'] = time.perf_counter() - total_start
         
         print(f"[RAG_MANAGER] PDF generated: {pdf_path}")
         print(f"[RAG_MANAGER] PDF URL: {pdf_url}")
+        print(f"[RAG_MANAGER] Timings: " + ", ".join(f"{stage}={seconds:.1f}s" for stage, seconds in timings.items()))
         print(f"[RAG_MANAGER] ========== CREATE REFERAT COMPLETE ==========\n")
         
         return {
             'referat': final_referat,
             'document_id': document_id,
             'filename': document['filename'],
-            'chunk_count': len(chunks),
+            'chunk_count': stats['chunks'],
             'pdf_url': pdf_url,
-            'pdf_path': pdf_path
+            'pdf_path': pdf_path,
+            'timings': {stage: round(seconds, 3) for stage, seconds in timings.items()},
+            'cached': cached
         }
 
@@ -0,0 +1,90 @@
+"""
+Переранжирование результатов поиска кросс-энкодером.
+
+Кросс-энкодер оценивает пары (запрос, фрагмент) точнее, чем сравнение
+эмбеддингов, но дороже, поэтому применяется только к top-N кандидатам:
+пакетно, на CPU, в ограниченном пуле потоков и с жестким лимитом времени.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+from .config import settings
+
+
+class Reranker:
+    def __init__(self, model_name: Optional[str] = None):
+        self.model_name = model_name or settings.rerank_model
+        self.model = None
+        # Отдельный ограниченный пул: переранжирование не занимает потоки
+        # asyncio.to_thread, в которых идет векторизация запросов
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.rerank_threads, thread_name_prefix="reranker", initializer=self._init_thread
+        )
+        print(f"[RERANKER] Reranker initialized: {self.model_name}")
+
+    @staticmethod
+    def _init_thread():
+        # torch.set_num_threads действует на весь процесс (и на модель эмбеддингов),
+        # поэтому по умолчанию (0) настройка torch не меняется
+        if settings.rerank_torch_threads > 0:
+            import torch
+            torch.set_num_threads(settings.rerank_torch_threads)
+
+    def load(self):
+        if self.model is None:
+            from sentence_transformers import CrossEncoder
+            print(f"[RERANKER] Loading cross-encoder: {self.model_name}")
+            self.model = CrossEncoder(self.model_name, device="cpu")
+            print(f"[RERANKER] Model loaded successfully")
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        """Оценки релевантности пар (query, text), пакетами по settings.rerank_batch_size."""
+        self.load()
+        scores = self.model.predict(
+            [(query, text) for text in texts],
+            batch_size=settings.rerank_batch_size,
+            show_progress_bar=False
+        )
+        return [float(score) for score in scores]
+
+    async def rerank(
+        self,
+        query: str,
+        results: List[Dict[str, Any]],
+        timeout: float
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Переупорядочивает результаты по оценке кросс-энкодера.
+
+        Args:
+            query: текст запроса
+            results: кандидаты (нужно поле content)
+            timeout: лимит времени в секундах
+
+        Returns:
+            Результаты по убыванию rerank_score или None, если лимит времени превышен
+        """
+        if not results:
+            return results
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._executor, self.score, query, [result['content'] for result in results]
+        )
+        try:
+            scores = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            # Вычисление в потоке не прерывается, но ответ его не ждет
+            print(f"[RERANKER] Time budget {timeout * 1000:.0f}ms exceeded, keeping vector order")
+            return None
+
+        reranked = [{**result, 'rerank_score': score} for result, score in zip(results, scores)]
+        reranked.sort(key=lambda x: x['rerank_score'], reverse=True)
+        print(f"[RERANKER] Reranked {len(results)} candidates in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return reranked
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,120 @@
+"""
+Вспомогательные функции ранжирования результатов поиска.
+"""
+
+import re
+from typing import List, Dict, Any
+
+import numpy as np
+
+
+# Запрос целиком - код/артикул/идентификатор без пробелов: буквы вместе с цифрами
+# (например "AB-1234", "v2.1", "ISO9001") или snake_case ("x_id")
+_CODE_TOKEN_RE = re.compile(r'(?=[\w./-]*\d)(?=[\w./-]*[^\W\d_])[\w./-]+|[^\W\d_]\w*_\w+')
+
+
+def is_keyword_query(query: str) -> bool:
+    """
+    Эвристика: запрос явно является поиском по ключевым словам.
+
+    Такие запросы (коды, номера деталей, фразы в кавычках) лучше обслуживает
+    полнотекстовый поиск, векторизация для них не нужна. Обычные вопросы
+    с аббревиатурами или сокращениями ("what is RAG", "e.g. apples") сюда
+    не относятся.
+
+    Args:
+        query: текст запроса
+
+    Returns:
+        True если запрос целиком - точная фраза в кавычках или один код
+    """
+    query = query.strip()
+    if not query:
+        return False
+
+    # Точная фраза в кавычках
+    if re.fullmatch(r'"[^"]+"|«[^«»]+»', query):
+        return True
+
+    return _CODE_TOKEN_RE.fullmatch(query) is not None
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int = 60) -> List[Dict[str, Any]]:
+    """
+    Объединяет несколько ранжированных списков методом Reciprocal Rank Fusion.
+
+    Score чанка = сумма 1 / (k + rank) по всем спискам, где он встретился.
+    Результаты дедуплицируются по id чанка; поля первого вхождения сохраняются,
+    в каждый результат добавляется rrf_score.
+
+    Args:
+        result_lists: списки результатов, каждый отсортирован по убыванию релевантности
+        k: сглаживающая константа RRF
+
+    Returns:
+        Объединенный список, отсортированный по убыванию rrf_score
+    """
+    fused: Dict[Any, Dict[str, Any]] = {}
+
+    for results in result_lists:
+        for rank, result in enumerate(results, 1):
+            chunk_id = result.get('id')
+            if chunk_id not in fused:
+                fused[chunk_id] = {**result, 'rrf_score': 0.0}
+            else:
+                # Дополняем полями, которых не было в первом вхождении (например similarity)
+                for key, value in result.items():
+                    fused[chunk_id].setdefault(key, value)
+            fused[chunk_id]['rrf_score'] += 1.0 / (k + rank)
+
+    return sorted(fused.values(), key=lambda x: x['rrf_score'], reverse=True)
+
+
+def mmr_select(
+    query_embedding: np.ndarray,
+    candidate_embeddings: np.ndarray,
+    k: int,
+    lambda_mult: float
+) -> List[int]:
+    """
+    Maximal Marginal Relevance: отбор k разнообразных кандидатов.
+
+    На каждом шаге выбирается кандидат с максимальным
+    lambda * sim(query, c) - (1 - lambda) * max sim(c, выбранные).
+    Матрица попарных сходств считается один раз, шаг отбора векторизован.
+
+    Args:
+        query_embedding: вектор запроса (d,)
+        candidate_embeddings: векторы кандидатов (n, d)
+        k: сколько кандидатов отобрать
+        lambda_mult: 1.0 - только релевантность, 0.0 - только разнообразие
+
+    Returns:
+        Индексы отобранных кандидатов в порядке отбора
+    """
+    n = len(candidate_embeddings)
+    if n == 0 or k <= 0:
+        return []
+
+    candidates = candidate_embeddings / np.maximum(
+        np.linalg.norm(candidate_embeddings, axis=1, keepdims=True), 1e-12
+    )
+    query = query_embedding / max(np.linalg.norm(query_embedding), 1e-12)
+
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+
+    selected: List[int] = []
+    available = np.ones(n, dtype=bool)
+    # Максимальное сходство каждого кандидата с уже выбранными
+    redundancy = np.zeros(n, dtype=np.float32)
+
+    for _ in range(min(k, n)):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+
+    return selected
@@ -0,0 +1,155 @@
+"""
+Адаптивный пропуск перевода запроса при кросс-языковом поиске.
+
+Многоязычная модель эмбеддингов часто находит нужные фрагменты и по
+исходному запросу. Если лучший результат первого прохода уверенно проходит
+порог для пары языков, перевод и второй поиск не выполняются.
+
+Порог для каждой пары языков подбирается по журналу исходов: каждый раз,
+когда перевод выполнялся, записывается лучшая similarity первого прохода и
+то, добавил ли перевод в top-k новые фрагменты. Порог - наименьшая similarity,
+начиная с которой перевод почти никогда не помогал. Небольшая доля запросов
+выше порога все равно переводится, чтобы журнал не устаревал. Журнал
+сохраняется в файл пакетами, в отдельном потоке, и при закрытии.
+"""
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from .config import settings
+
+
+class TranslationPolicy:
+    # Журнал записывается в файл после _SAVE_EVERY новых исходов или через _SAVE_INTERVAL секунд
+    _SAVE_EVERY = 20
+    _SAVE_INTERVAL = 60.0
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        default_threshold: Optional[float] = None,
+        min_samples: Optional[int] = None,
+        max_help_rate: Optional[float] = None,
+        explore_rate: Optional[float] = None,
+        history_size: int = 500
+    ):
+        self.path = path if path is not None else settings.translation_policy_path
+        self.default_threshold = default_threshold if default_threshold is not None else settings.translation_skip_similarity
+        self.min_samples = min_samples if min_samples is not None else settings.translation_policy_min_samples
+        self.max_help_rate = max_help_rate if max_help_rate is not None else settings.translation_policy_max_help_rate
+        self.explore_rate = explore_rate if explore_rate is not None else settings.translation_explore_rate
+        self.history_size = history_size
+        # Пара языков "ru->en" -> журнал (лучшая similarity первого прохода, помог ли перевод)
+        self._outcomes: Dict[str, deque] = {}
+        self._thresholds: Dict[str, Optional[float]] = {}
+        self._lock = threading.Lock()
+        # Последовательная запись файла: более старый снимок не перезапишет новый
+        self._save_lock = threading.Lock()
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+        self._save_task: Optional[asyncio.Future] = None
+        self._load()
+
+    @staticmethod
+    def pair(source: str, target: str) -> str:
+        return f"{source}->{target}"
+
+    def threshold(self, pair: str) -> Optional[float]:
+        """Порог similarity для пропуска перевода (None - переводить всегда)."""
+        if pair not in self._thresholds:
+            self._thresholds[pair] = self._fit(self._outcomes.get(pair, ()))
+        return self._thresholds[pair]
+
+    def decide(self, pair: str, top_similarity: float) -> Tuple[bool, Optional[float]]:
+        """
+        Нужно ли переводить запрос.
+
+        Returns:
+            (переводить ли, использованный порог)
+        """
+        threshold = self.threshold(pair)
+        if threshold is None or top_similarity < threshold:
+            return True, threshold
+        # Изредка переводим и выше порога, чтобы проверять, что порог еще верен
+        return random.random() < self.explore_rate, threshold
+
+    def record(self, pair: str, top_similarity: float, helped: bool):
+        """Записывает исход выполненного перевода и пересчитывает порог пары."""
+        with self._lock:
+            outcomes = self._outcomes.setdefault(pair, deque(maxlen=self.history_size))
+            outcomes.append((round(float(top_similarity), 4), bool(helped)))
+            self._thresholds.pop(pair, None)
+            self._unsaved += 1
+            due = self._unsaved >= self._SAVE_EVERY or time.monotonic() - self._saved_at >= self._SAVE_INTERVAL
+        if due and (self._save_task is None or self._save_task.done()):
+            self._schedule_save()
+
+    def save(self):
+        """Записывает журнал в файл, если есть несохраненные исходы."""
+        with self._save_lock:
+            with self._lock:
+                if not self._unsaved:
+                    return
+                data = {pair: list(outcomes) for pair, outcomes in self._outcomes.items()}
+                self._unsaved = 0
+                self._saved_at = time.monotonic()
+            self._write(data)
+
+    def close(self):
+        self.save()
+
+    def _schedule_save(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вызов вне event loop: можно писать сразу
+            self.save()
+            return
+        self._save_task = loop.create_task(asyncio.to_thread(self.save))
+
+    def _fit(self, outcomes) -> Optional[float]:
+        """
+        Наименьший порог, выше которого перевод помогал не чаще max_help_rate
+        (и наблюдений не меньше min_samples). До накопления журнала - порог по умолчанию.
+        """
+        if len(outcomes) < self.min_samples:
+            return self.default_threshold
+        threshold = None
+        helped = 0
+        ordered = sorted(outcomes, key=lambda outcome: outcome[0], reverse=True)
+        for count, (similarity, outcome_helped) in enumerate(ordered, 1):
+            helped += outcome_helped
+            if count >= self.min_samples and helped / count <= self.max_help_rate:
+                threshold = similarity
+        return threshold
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for pair, outcomes in data.items():
+                self._outcomes[pair] = deque(
+                    ((similarity, helped) for similarity, helped in outcomes), maxlen=self.history_size
+                )
+            print(f"[TRANSLATION_POLICY] Loaded outcomes for {len(self._outcomes)} language pairs")
+        except (OSError, ValueError) as e:
+            print(f"[TRANSLATION_POLICY] Failed to load {self.path}: {e}")
+
+    def _write(self, data: Dict[str, list]):
+        if not self.path:
+            return
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[TRANSLATION_POLICY] Failed to save {self.path}: {e}")
@@ -0,0 +1,235 @@
+"""
+Асинхронный перевод запросов с кешем.
+
+Сетевой вызов переводчика выполняется в отдельном пуле потоков и не блокирует
+event loop; ожидание ограничено settings.translation_timeout_ms. Переводы
+хранятся в LRU-кеше по ключу (текст, исходный язык, целевой язык), который
+сохраняется в файл (в отдельном потоке и при закрытии) и переживает перезапуск.
+Перевод, не успевший к сроку, все равно попадает в кеш, когда завершится.
+
+Бэкенд выбирается настройкой TRANSLATOR: google (deep-translator) или stub -
+локальная заглушка без сети для тестов.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from .config import settings
+
+
+class GoogleTranslatorBackend:
+    """Перевод через deep-translator (Google Translate)."""
+
+    def __init__(self):
+        self._translator = None
+
+    def _load(self):
+        if self._translator is None:
+            try:
+                from deep_translator import GoogleTranslator
+                self._translator = GoogleTranslator
+                print("[TRANSLATOR] Translator loaded (deep-translator)")
+            except ImportError:
+                print("[TRANSLATOR] WARNING: deep-translator not installed")
+                print("[TRANSLATOR] Install with: pip install deep-translator")
+                self._translator = False
+        return self._translator if self._translator else None
+
+    def translate(self, text: str, source: Optional[str], target: str) -> Optional[str]:
+        translator_class = self._load()
+        if not translator_class:
+            return None
+        return translator_class(source=source or 'auto', target=target).translate(text)
+
+
+class StubTranslatorBackend:
+    """
+    Локальный переводчик без сети для тестов: возвращает заданные переводы
+    или текст с пометкой целевого языка.
+    """
+
+    def __init__(self, translations: Optional[Dict[Tuple[str, str], str]] = None):
+        # (текст, целевой язык) -> перевод
+        self.translations = translations or {}
+        self.calls = 0
+
+    def translate(self, text: str, source: Optional[str], target: str) -> Optional[str]:
+        self.calls += 1
+        return self.translations.get((text, target), f"[{target}] {text}")
+
+
+class TranslationCache:
+    """Потокобезопасный LRU-кеш переводов с сохранением в JSON-файл."""
+
+    # Сколько новых переводов накапливается перед записью файла
+    _SAVE_EVERY = 20
+
+    def __init__(self, max_size: int, path: Optional[str] = None):
+        self.max_size = max_size
+        self.path = path
+        self._items: OrderedDict = OrderedDict()
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        # Последовательная запись файла: более старый снимок не перезапишет новый
+        self._save_lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def _key(text: str, source: Optional[str], target: str) -> str:
+        return json.dumps([text, source, target], ensure_ascii=False)
+
+    def get(self, text: str, source: Optional[str], target: str) -> Optional[str]:
+        key = self._key(text, source, target)
+        with self._lock:
+            translation = self._items.get(key)
+            if translation is not None:
+                self._items.move_to_end(key)
+            return translation
+
+    def put(self, text: str, source: Optional[str], target: str, translation: str):
+        key = self._key(text, source, target)
+        with self._lock:
+            self._items[key] = translation
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            self._unsaved += 1
+
+    @property
+    def save_due(self) -> bool:
+        """Накопилось достаточно новых переводов для записи файла."""
+        return self._unsaved >= self._SAVE_EVERY
+
+    def save(self):
+        """Записывает кеш в файл, если есть несохраненные переводы (блокирующая запись)."""
+        with self._save_lock:
+            with self._lock:
+                if not self._unsaved:
+                    return
+                items = list(self._items.items())
+                self._unsaved = 0
+            self._write(items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+            # Файл хранит записи от давно использованных к недавним
+            for key, translation in items[-self.max_size:]:
+                self._items[key] = translation
+            print(f"[TRANSLATOR] Loaded {len(self._items)} cached translations")
+        except (OSError, ValueError) as e:
+            print(f"[TRANSLATOR] Failed to load translation cache {self.path}: {e}")
+
+    def _write(self, items: List[Tuple[str, str]]):
+        if not self.path:
+            return
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(items, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[TRANSLATOR] Failed to save translation cache {self.path}: {e}")
+
+
+class AsyncTranslator:
+    """Неблокирующий перевод с тайм-аутом, кешем и объединением одинаковых запросов."""
+
+    def __init__(self, backend=None, cache: Optional[TranslationCache] = None, timeout: Optional[float] = None):
+        self.backend = backend if backend is not None else _create_backend(settings.translator)
+        self.cache = cache if cache is not None else TranslationCache(
+            settings.translation_cache_size, settings.translation_cache_path or None
+        )
+        self.timeout = timeout if timeout is not None else settings.translation_timeout_ms / 1000
+        self._executor = ThreadPoolExecutor(max_workers=settings.translation_threads, thread_name_prefix="translator")
+        # Переводы в процессе: одинаковые одновременные запросы ждут один вызов переводчика
+        self._pending: Dict[Tuple[str, Optional[str], str], asyncio.Future] = {}
+        self._save_future: Optional[asyncio.Future] = None
+        print(f"[TRANSLATOR] AsyncTranslator initialized: {self.backend.__class__.__name__}")
+
+    def translate_sync(self, text: str, source: Optional[str], target: str) -> Optional[str]:
+        """Синхронный перевод через кеш (для вызовов вне event loop)."""
+        cached = self.cache.get(text, source, target)
+        if cached is not None:
+            return cached
+        translation = self.backend.translate(text, source, target)
+        if translation:
+            self.cache.put(text, source, target, translation)
+            if self.cache.save_due:
+                self.cache.save()
+        return translation
+
+    async def translate(self, text: str, source: Optional[str], target: str) -> Optional[str]:
+        """
+        Переводит текст, не блокируя event loop.
+
+        Returns:
+            Перевод или None, если переводчик недоступен, вернул ошибку или не уложился в тайм-аут
+        """
+        if source == target:
+            return text
+        cached = self.cache.get(text, source, target)
+        if cached is not None:
+            print(f"[TRANSLATOR] Cache hit ({source} -> {target})")
+            return cached
+
+        key = (text, source, target)
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, self.backend.translate, text, source, target
+            )
+            self._pending[key] = future
+            future.add_done_callback(lambda done: self._on_translated(key, done))
+        try:
+            # shield: при тайм-ауте перевод продолжается и попадает в кеш
+            translation = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            print(f"[TRANSLATOR] Translation timed out after {self.timeout * 1000:.0f}ms ({source} -> {target})")
+            return None
+        except Exception as e:
+            print(f"[TRANSLATOR] Translation error: {e}")
+            return None
+        if translation:
+            print(f"[TRANSLATOR] Translated from {source} to {target}: {text[:100]} -> {translation[:100]}")
+        return translation
+
+    async def translate_many(self, text: str, source: Optional[str], targets: List[str]) -> Dict[str, Optional[str]]:
+        """Переводит текст на несколько языков параллельно."""
+        targets = list(dict.fromkeys(targets))
+        translations = await asyncio.gather(*(self.translate(text, source, target) for target in targets))
+        return dict(zip(targets, translations))
+
+    def _on_translated(self, key: Tuple[str, Optional[str], str], future: asyncio.Future):
+        self._pending.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        translation = future.result()
+        if translation:
+            self.cache.put(*key, translation)
+            if self.cache.save_due and (self._save_future is None or self._save_future.done()):
+                # Запись файла в пуле потоков по умолчанию, чтобы не задерживать event loop
+                self._save_future = asyncio.get_running_loop().run_in_executor(None, self.cache.save)
+
+    def close(self):
+        self.cache.save()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _create_backend(name: str):
+    if name == 'stub':
+        return StubTranslatorBackend()
+    if name == 'google':
+        return GoogleTranslatorBackend()
+    raise ValueError(f"Неизвестный переводчик: {name}")
@@ -1,13 +1,42 @@
 import asyncpg
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 import numpy as np
 import json
+import time
+import base64
+from datetime import datetime, timezone
 from .config import settings
 
 
+# Коллекция, создаваемая схемой (scripts/init.sql): в нее попадают документы без явной коллекции
+DEFAULT_COLLECTION_ID = 1
+
+
 class VectorStore:
     def __init__(self):
         self.pool: Optional[asyncpg.Pool] = None
+        # Пулы реплик только для чтения (пусто - все запросы идут в self.pool)
+        self.read_pools: List[asyncpg.Pool] = []
+        self._read_pool_index = 0
+        # Время последней записи: по документам и по корпусу в целом (time.monotonic)
+        self._document_writes: Dict[int, float] = {}
+        self._last_write_at: Optional[float] = None
+        # Раскладка схемы (определяется при подключении): эмбеддинги в отдельной
+        # узкой таблице chunk_embeddings вместо колонки chunks.embedding
+        self.split_embeddings = False
+        # Секционирование векторной таблицы: None, 'hash' (по document_id,
+        # 005_partition_chunks.sql) или 'collection' (007_partition_by_collection.sql)
+        self.partitioning: Optional[str] = None
+        # Есть ли таблица llm_artifacts (008_llm_artifacts.sql)
+        self.has_artifacts = False
+        # Есть ли колонка documents.embedding (009_document_embeddings.sql)
+        self.has_document_embeddings = False
+        # Есть ли таблица document_languages (011_document_languages.sql)
+        self.has_document_languages = False
+        # Поддерживает ли pgvector итеративный обход индекса (>= 0.8)
+        self.has_iterative_scan = False
+        # Кеш get_corpus_languages: ключ фильтров -> (время истечения, языки)
+        self._corpus_languages: Dict[str, Tuple[float, List[str]]] = {}
         print("[VECTOR_STORE] VectorStore initialized")
         
     async def connect(self):
@@ -22,136 +51,940 @@ class VectorStore:
             database=settings.postgres_db,
             host=settings.postgres_host,
             port=settings.postgres_port,
-            min_size=2,
-            max_size=10
+            min_size=settings.postgres_pool_min_size,
+            max_size=settings.postgres_pool_max_size
         )
-        print(f"[VECTOR_STORE] Connection pool created (min_size=2, max_size=10)")
+        print(f"[VECTOR_STORE] Connection pool created (min_size={settings.postgres_pool_min_size}, max_size={settings.postgres_pool_max_size})")
+        
+        for dsn in settings.replica_dsns:
+            try:
+                read_pool = await asyncpg.create_pool(
+                    dsn=dsn,
+                    min_size=settings.postgres_read_pool_min_size,
+                    max_size=settings.postgres_read_pool_max_size
+                )
+                self.read_pools.append(read_pool)
+            except Exception as e:
+                # Недоступная реплика не должна мешать старту: ее запросы обслужит основной сервер
+                print(f"[VECTOR_STORE] WARNING: Failed to connect to read replica: {e}")
+        if self.read_pools:
+            print(f"[VECTOR_STORE] Read pools created: {len(self.read_pools)} replica(s)")
+        
+        await self._detect_schema()
+    
+    async def _detect_schema(self):
+        """Определяет раскладку схемы, выбранную миграциями (см. docs/MIGRATIONS.md)."""
+        async with self.pool.acquire() as conn:
+            has_inline_embedding = await conn.fetchval(
+                """
+                SELECT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_schema = current_schema()
+                      AND table_name = 'chunks' AND column_name = 'embedding'
+                )
+                """
+            )
+            vector_table = 'chunks' if has_inline_embedding else 'chunk_embeddings'
+            strategy = await conn.fetchval(
+                """
+                SELECT pt.partstrat FROM pg_partitioned_table pt
+                JOIN pg_class c ON c.oid = pt.partrelid
+                WHERE c.relname = $1 AND c.relnamespace = current_schema()::regnamespace
+                """,
+                vector_table
+            )
+            has_artifacts = await conn.fetchval("SELECT to_regclass('llm_artifacts') IS NOT NULL")
+            has_document_languages = await conn.fetchval("SELECT to_regclass('document_languages') IS NOT NULL")
+            pgvector_version = await conn.fetchval("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            has_document_embeddings = await conn.fetchval(
+                """
+                SELECT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_schema = current_schema()
+                      AND table_name = 'documents' AND column_name = 'embedding'
+                )
+                """
+            )
+        self.split_embeddings = not has_inline_embedding
+        self.has_artifacts = has_artifacts
+        self.has_document_embeddings = has_document_embeddings
+        self.has_document_languages = has_document_languages
+        self.has_iterative_scan = self._version_tuple(pgvector_version) >= (0, 8)
+        self.partitioning = {'h': 'hash', 'l': 'collection'}.get(strategy)
+        print(f"[VECTOR_STORE] Embedding layout: {'split (chunk_embeddings)' if self.split_embeddings else 'inline (chunks.embedding)'}")
+        if self.partitioning:
+            print(f"[VECTOR_STORE] Vector table '{vector_table}' is partitioned by {self.partitioning}")
+        if not self.has_artifacts:
+            print("[VECTOR_STORE] Table llm_artifacts not found, LLM results will not be cached")
+        if not self.has_iterative_scan and settings.vector_iterative_scan != 'off':
+            print(f"[VECTOR_STORE] pgvector {pgvector_version} has no iterative index scan (needs >= 0.8), VECTOR_ITERATIVE_SCAN ignored")
+    
+    @staticmethod
+    def _version_tuple(version: Optional[str]) -> Tuple[int, ...]:
+        """'0.8.0' -> (0, 8, 0); нечисловые части отбрасываются."""
+        parts = []
+        for part in (version or '').split('.'):
+            if not part.isdigit():
+                break
+            parts.append(int(part))
+        return tuple(parts)
+    
+    @property
+    def vector_table(self) -> str:
+        """Таблица, в которой хранятся эмбеддинги (зависит от раскладки схемы)."""
+        return 'chunk_embeddings' if self.split_embeddings else 'chunks'
         
     async def close(self):
+        for read_pool in self.read_pools:
+            await read_pool.close()
+        self.read_pools = []
         if self.pool:
             print("[VECTOR_STORE] Closing connection pool...")
             await self.pool.close()
             print("[VECTOR_STORE] Connection pool closed")
+    
+    def _mark_written(self, document_id: Optional[int] = None):
+        """Запоминает момент записи для read-your-writes маршрутизации."""
+        now = time.monotonic()
+        self._last_write_at = now
+        if document_id is not None:
+            self._document_writes[document_id] = now
+        # Чистим устаревшие отметки, чтобы словарь не рос при массовой загрузке
+        window = settings.read_your_writes_window
+        if len(self._document_writes) > 1024:
+            self._document_writes = {
+                doc_id: written_at for doc_id, written_at in self._document_writes.items()
+                if now - written_at < window
+            }
+    
+    def _recently_written(self, document_id: Optional[int] = None) -> bool:
+        written_at = self._document_writes.get(document_id) if document_id is not None else self._last_write_at
+        return written_at is not None and time.monotonic() - written_at < settings.read_your_writes_window
+    
+    def _read_pool(self, document_id: Optional[int] = None, sticky: bool = False) -> asyncpg.Pool:
+        """
+        Выбирает пул для читающего запроса.
+        
+        Args:
+            document_id: документ, к которому относится чтение (read-your-writes по документу)
+            sticky: учитывать любую недавнюю запись (для списков документов)
             
-    async def create_document(self, filename: str, file_size: int, metadata: Optional[Dict[str, Any]] = None) -> int:
-        print(f"[VECTOR_STORE] Creating document: {filename} ({file_size} bytes)")
+        Returns:
+            Пул реплики (round-robin) или основной пул
+        """
+        if not self.read_pools:
+            return self.pool
+        if document_id is not None and self._recently_written(document_id):
+            return self.pool
+        if sticky and self._recently_written():
+            return self.pool
+        self._read_pool_index = (self._read_pool_index + 1) % len(self.read_pools)
+        return self.read_pools[self._read_pool_index]
+            
+    async def create_document(
+        self,
+        filename: str,
+        file_size: int,
+        metadata: Optional[Dict[str, Any]] = None,
+        collection_id: Optional[int] = None
+    ) -> int:
+        print(f"[VECTOR_STORE] Creating document: {filename} ({file_size} bytes), collection={collection_id or DEFAULT_COLLECTION_ID}")
         async with self.pool.acquire() as conn:
             row = await conn.fetchrow(
                 """
-                INSERT INTO documents (filename, file_size, metadata)
-                VALUES ($1, $2, $3)
+                INSERT INTO documents (filename, file_size, metadata, collection_id)
+                VALUES ($1, $2, $3, $4)
                 RETURNING id
                 """,
-                filename, file_size, json.dumps(metadata or {})
+                filename, file_size, json.dumps(metadata or {}), collection_id or DEFAULT_COLLECTION_ID
             )
             doc_id = row['id']
+            self._mark_written(doc_id)
             print(f"[VECTOR_STORE] Document created: ID={doc_id}")
             return doc_id
             
     async def add_chunks(self, document_id: int, chunks: List[Dict[str, Any]]):
         print(f"[VECTOR_STORE] Adding {len(chunks)} chunks for document ID={document_id}")
         async with self.pool.acquire() as conn:
-            await conn.executemany(
-                """
-                INSERT INTO chunks (document_id, content, embedding, chunk_index, metadata)
-                VALUES ($1, $2, $3::vector, $4, $5)
-                """,
-                [
-                    (
-                        document_id,
-                        chunk['content'],
-                        json.dumps(chunk['embedding']),
-                        chunk['chunk_index'],
-                        json.dumps(chunk.get('metadata', {}))
+            async with conn.transaction():
+                # Чанки наследуют коллекцию документа (по ней секционируется/индексируется векторная таблица)
+                collection_id = await conn.fetchval(
+                    "SELECT collection_id FROM documents WHERE id = $1", document_id
+                )
+                if self.split_embeddings:
+                    await self._insert_split_chunks(conn, document_id, collection_id, chunks)
+                else:
+                    await conn.executemany(
+                        """
+                        INSERT INTO chunks (document_id, collection_id, content, embedding, chunk_index, metadata)
+                        VALUES ($1, $2, $3, $4::vector, $5, $6)
+                        """,
+                        [
+                            (
+                                document_id,
+                                collection_id,
+                                chunk['content'],
+                                json.dumps(chunk['embedding']),
+                                chunk['chunk_index'],
+                                json.dumps(chunk.get('metadata', {}))
+                            )
+                            for chunk in chunks
+                        ]
                     )
-                    for chunk in chunks
-                ]
+                if self.has_document_languages:
+                    await self._add_document_languages(conn, document_id, collection_id, chunks)
+                # Статистика документа обновляется в той же транзакции, что и чанки
+                await conn.execute(
+                    """
+                    UPDATE documents
+                    SET chunk_count = chunk_count + $2,
+                        total_chars = total_chars + $3
+                    WHERE id = $1
+                    """,
+                    document_id, len(chunks), sum(len(chunk['content']) for chunk in chunks)
+                )
+                # Вектор документа тоже: иначе новый документ не попадет в иерархический поиск
+                if self.has_document_embeddings:
+                    await self._update_document_embedding(conn, document_id)
+        self._corpus_languages.clear()
+        self._mark_written(document_id)
+    
+    @staticmethod
+    async def _add_document_languages(conn, document_id: int, collection_id: int, chunks: List[Dict[str, Any]]):
+        """Учитывает языки чанков (metadata.language) в наборе языков документа."""
+        counts: Dict[str, int] = {}
+        for chunk in chunks:
+            language = (chunk.get('metadata') or {}).get('language')
+            if language:
+                counts[language] = counts.get(language, 0) + 1
+        if not counts:
+            return
+        await conn.execute(
+            """
+            INSERT INTO document_languages (document_id, collection_id, language, chunk_count)
+            SELECT $1, $2, t.language, t.chunk_count
+            FROM unnest($3::text[], $4::int[]) AS t(language, chunk_count)
+            ON CONFLICT (language, document_id)
+            DO UPDATE SET chunk_count = document_languages.chunk_count + EXCLUDED.chunk_count
+            """,
+            document_id, collection_id, list(counts), list(counts.values())
+        )
+    
+    @staticmethod
+    async def _insert_split_chunks(conn, document_id: int, collection_id: int, chunks: List[Dict[str, Any]]):
+        """Запись чанков при раскладке split: текст в chunks, вектор в chunk_embeddings."""
+        rows = await conn.fetch(
+            """
+            INSERT INTO chunks (document_id, collection_id, content, chunk_index, metadata)
+            SELECT $1, $2, t.content, t.chunk_index, t.metadata::jsonb
+            FROM unnest($3::text[], $4::int[], $5::text[]) AS t(content, chunk_index, metadata)
+            RETURNING id, chunk_index
+            """,
+            document_id,
+            collection_id,
+            [chunk['content'] for chunk in chunks],
+            [chunk['chunk_index'] for chunk in chunks],
+            [json.dumps(chunk.get('metadata', {})) for chunk in chunks]
+        )
+        chunk_ids = {row['chunk_index']: row['id'] for row in rows}
+        await conn.executemany(
+            """
+            INSERT INTO chunk_embeddings (chunk_id, document_id, collection_id, embedding)
+            VALUES ($1, $2, $3, $4::vector)
+            """,
+            [
+                (chunk_ids[chunk['chunk_index']], document_id, collection_id, json.dumps(chunk['embedding']))
+                for chunk in chunks
+            ]
+        )
+            
+    @staticmethod
+    def _like_prefix(prefix: str) -> str:
+        """Шаблон LIKE для поиска по префиксу (спецсимволы экранируются)."""
+        escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return escaped + '%'
+    
+    @staticmethod
+    def _filters_need_documents(filters: Optional[Dict[str, Any]]) -> bool:
+        filters = filters or {}
+        return any(filters.get(key) for key in ('language', 'uploaded_after', 'uploaded_before', 'filename_prefix'))
+    
+    @staticmethod
+    def _filters_need_chunks(filters: Optional[Dict[str, Any]]) -> bool:
+        return bool((filters or {}).get('metadata'))
+    
+    @classmethod
+    def _build_filter_conditions(
+        cls,
+        filters: Optional[Dict[str, Any]],
+        args: List[Any],
+        document_id: Optional[int] = None,
+        alias: str = "c"
+    ) -> List[str]:
+        """
+        Компилирует структурированный фильтр поиска в SQL-предикаты (c - chunks, d - documents).
+        
+        Поддерживаемые ключи filters:
+            collection_id: ID коллекции
+            document_ids: список ID документов
+            language: язык документа (documents.metadata->>'language')
+            language_partition: только документы, в которых есть чанки на этом языке
+                (document_languages, 011_document_languages.sql)
+            uploaded_after / uploaded_before: диапазон даты загрузки (datetime; с часовым
+                поясом приводится к UTC, так как upload_date - TIMESTAMP без пояса)
+            filename_prefix: начало имени файла
+            metadata: словарь значений метаданных чанка (containment, @>)
+        
+        Параметры добавляются в args, плейсхолдеры нумеруются по его длине.
+        alias - псевдоним таблицы, по которой идет поиск (chunks или chunk_embeddings):
+        по ней фильтруются document_id и collection_id.
+        """
+        conditions = []
+        filters = filters or {}
+        
+        if document_id:
+            args.append(document_id)
+            conditions.append(f"{alias}.document_id = ${len(args)}")
+        if filters.get('document_ids'):
+            args.append(list(filters['document_ids']))
+            conditions.append(f"{alias}.document_id = ANY(${len(args)}::int[])")
+        if filters.get('collection_id') is not None:
+            # Литерал, а не параметр: планировщик должен видеть значение, чтобы выбрать
+            # частичный индекс коллекции или отсечь лишние секции
+            conditions.append(f"{alias}.collection_id = {int(filters['collection_id'])}")
+        if filters.get('language'):
+            args.append(filters['language'])
+            conditions.append(f"d.metadata->>'language' = ${len(args)}")
+        if filters.get('language_partition'):
+            args.append(filters['language_partition'])
+            conditions.append(
+                f"{alias}.document_id IN (SELECT document_id FROM document_languages WHERE language = ${len(args)})"
             )
+        if filters.get('uploaded_after'):
+            args.append(cls._naive_utc(filters['uploaded_after']))
+            conditions.append(f"d.upload_date >= ${len(args)}")
+        if filters.get('uploaded_before'):
+            args.append(cls._naive_utc(filters['uploaded_before']))
+            conditions.append(f"d.upload_date < ${len(args)}")
+        if filters.get('filename_prefix'):
+            args.append(cls._like_prefix(filters['filename_prefix']))
+            conditions.append(f"d.filename LIKE ${len(args)}")
+        if filters.get('metadata'):
+            args.append(json.dumps(filters['metadata']))
+            conditions.append(f"c.metadata @> ${len(args)}::jsonb")
+        return conditions
+    
+    @staticmethod
+    def _naive_utc(value: datetime) -> datetime:
+        """Дата с часовым поясом -> UTC без пояса (asyncpg не сравнивает aware datetime с TIMESTAMP)."""
+        if value.tzinfo is None:
+            return value
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    
+    @staticmethod
+    def _parse_vector(text: str) -> np.ndarray:
+        """Текстовое представление pgvector ('[0.1,0.2,...]') в np.ndarray."""
+        return np.array(json.loads(text), dtype=np.float32)
+    
+    async def get_chunk_embeddings(self, chunk_ids: List[int]) -> Dict[int, np.ndarray]:
+        """Векторы чанков по id одним запросом (для результатов, пришедших без векторов)."""
+        if not chunk_ids:
+            return {}
+        id_column = 'chunk_id' if self.split_embeddings else 'id'
+        async with self._read_pool().acquire() as conn:
+            rows = await conn.fetch(
+                f"""
+                SELECT {id_column} AS id, embedding::text AS embedding
+                FROM {self.vector_table}
+                WHERE {id_column} = ANY($1::int[])
+                """,
+                list(chunk_ids)
+            )
+        return {row['id']: self._parse_vector(row['embedding']) for row in rows}
+    
+    async def _enable_iterative_scan(self, conn):
+        """
+        Включает итеративный обход векторного индекса (pgvector >= 0.8) в текущей транзакции:
+        при фильтрации индекс продолжает выдавать кандидатов, пока не наберется полный top-k.
+        На более старом pgvector (версия проверяется при подключении) ничего не делает.
+        """
+        mode = settings.vector_iterative_scan
+        if not self.has_iterative_scan or mode not in ('relaxed_order', 'strict_order'):
+            return
+        await conn.execute(f"SET LOCAL ivfflat.iterative_scan = {mode}")
+        await conn.execute(f"SET LOCAL hnsw.iterative_scan = {mode}")
             
-    async def search_similar(self, query_embedding: List[float], document_id: Optional[int] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    async def search_similar(
+        self,
+        query_embedding: List[float],
+        document_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        exact: bool = False,
+        with_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Поиск ближайших чанков.
+        
+        exact=True - точный перебор без векторного индекса: расстояния считаются для
+        всех чанков, прошедших фильтр. Используется, когда фильтр заранее сузил поиск
+        до небольшого набора документов (document_ids), и индекс там только мешает.
+        
+        with_embeddings=True - вернуть в поле embedding вектор чанка (np.ndarray),
+        например для диверсификации результатов (MMR) без повторного запроса.
+        """
         limit = limit if limit is not None else settings.search_limit
-        print(f"[VECTOR_STORE] Searching similar chunks: doc_id={document_id}, limit={limit}")
+        print(f"[VECTOR_STORE] Searching similar chunks: doc_id={document_id}, limit={limit}, filters={filters or {}}, exact={exact}")
         query_vector = json.dumps(query_embedding)
         
-        async with self.pool.acquire() as conn:
-            if document_id:
-                rows = await conn.fetch(
-                    """
-                    SELECT c.id, c.content, c.chunk_index, c.metadata,
-                           d.filename, d.id as document_id,
-                           1 - (c.embedding <=> $1::vector) as similarity
-                    FROM chunks c
-                    JOIN documents d ON c.document_id = d.id
-                    WHERE c.document_id = $2
-                    ORDER BY c.embedding <=> $1::vector
-                    LIMIT $3
-                    """,
-                    query_vector, document_id, limit
+        args: List[Any] = [query_vector]
+        if self.split_embeddings:
+            conditions = self._build_filter_conditions(filters, args, document_id, alias="e")
+        else:
+            conditions = self._build_filter_conditions(filters, args, document_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        args.append(limit)
+        
+        if exact:
+            # Расстояния для всех отфильтрованных чанков, сортировка без индекса
+            alias = "e" if self.split_embeddings else "c"
+            joins = []
+            if self.split_embeddings and self._filters_need_chunks(filters):
+                joins.append("JOIN chunks c ON c.id = e.chunk_id")
+            if self._filters_need_documents(filters):
+                joins.append(f"JOIN documents d ON d.id = {alias}.document_id")
+            sql = f"""
+                WITH candidates AS MATERIALIZED (
+                    SELECT {alias}.{'chunk_id' if self.split_embeddings else 'id'} AS chunk_id,
+                           {alias}.embedding <=> $1::vector AS distance
+                    FROM {self.vector_table} {alias}
+                    {' '.join(joins)}
+                    {where}
                 )
-            else:
-                rows = await conn.fetch(
-                    """
-                    SELECT c.id, c.content, c.chunk_index, c.metadata,
-                           d.filename, d.id as document_id,
-                           1 - (c.embedding <=> $1::vector) as similarity
-                    FROM chunks c
-                    JOIN documents d ON c.document_id = d.id
-                    ORDER BY c.embedding <=> $1::vector
-                    LIMIT $2
-                    """,
-                    query_vector, limit
+                SELECT c.id, c.content, c.chunk_index, c.metadata,
+                       d.filename, d.id as document_id,
+                       1 - n.distance as similarity
+                       {", v.embedding::text AS embedding" if with_embeddings else ""}
+                FROM (SELECT * FROM candidates ORDER BY distance LIMIT ${len(args)}) n
+                JOIN chunks c ON c.id = n.chunk_id
+                JOIN documents d ON c.document_id = d.id
+                {f"JOIN {self.vector_table} v ON v.{'chunk_id' if self.split_embeddings else 'id'} = n.chunk_id" if with_embeddings else ""}
+                """
+        elif self.split_embeddings:
+            # ANN идет по узкой таблице векторов; текст чанков читается только для top-k
+            joins = []
+            if self._filters_need_chunks(filters):
+                joins.append("JOIN chunks c ON c.id = e.chunk_id")
+            if self._filters_need_documents(filters):
+                joins.append("JOIN documents d ON d.id = e.document_id")
+            sql = f"""
+                WITH nearest AS MATERIALIZED (
+                    SELECT e.chunk_id, e.embedding <=> $1::vector AS distance
+                           {", e.embedding" if with_embeddings else ""}
+                    FROM chunk_embeddings e
+                    {' '.join(joins)}
+                    {where}
+                    ORDER BY e.embedding <=> $1::vector
+                    LIMIT ${len(args)}
                 )
+                SELECT c.id, c.content, c.chunk_index, c.metadata,
+                       d.filename, d.id as document_id,
+                       1 - n.distance as similarity
+                       {", n.embedding::text AS embedding" if with_embeddings else ""}
+                FROM nearest n
+                JOIN chunks c ON c.id = n.chunk_id
+                JOIN documents d ON c.document_id = d.id
+                """
+        else:
+            sql = f"""
+                SELECT c.id, c.content, c.chunk_index, c.metadata,
+                       d.filename, d.id as document_id,
+                       1 - (c.embedding <=> $1::vector) as similarity
+                       {", c.embedding::text AS embedding" if with_embeddings else ""}
+                FROM chunks c
+                JOIN documents d ON c.document_id = d.id
+                {where}
+                ORDER BY c.embedding <=> $1::vector
+                LIMIT ${len(args)}
+                """
+        
+        read_document_id = document_id
+        if not read_document_id and filters and len(filters.get('document_ids') or []) == 1:
+            read_document_id = filters['document_ids'][0]
+        
+        async with self._read_pool(read_document_id).acquire() as conn:
+            async with conn.transaction(readonly=True):
+                if filters and not exact:
+                    await self._enable_iterative_scan(conn)
+                rows = await conn.fetch(sql, *args)
             
             results = [dict(row) for row in rows]
+            if with_embeddings:
+                for result in results:
+                    result['embedding'] = self._parse_vector(result['embedding'])
+            # relaxed_order может вернуть кандидатов не строго по расстоянию
+            results.sort(key=lambda x: x['similarity'], reverse=True)
             print(f"[VECTOR_STORE] Found {len(results)} similar chunks")
             if results:
                 print(f"[VECTOR_STORE]   Best match: {results[0]['filename']} (similarity: {results[0]['similarity']:.2%})")
             return results
             
-    async def get_documents(self) -> List[Dict[str, Any]]:
-        async with self.pool.acquire() as conn:
+    async def get_chunk_windows(
+        self,
+        hits: List[Dict[str, Any]],
+        window: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Соседние чанки для найденных фрагментов: chunk_index в пределах ±window.
+        
+        Все окна читаются одним запросом по (document_id, chunk_index)
+        (индекс chunks_document_chunk_idx), без запроса на каждый фрагмент.
+        
+        Args:
+            hits: найденные фрагменты (нужны document_id и chunk_index)
+            window: радиус окна в чанках
+            
+        Returns:
+            Чанки окон (включая сами фрагменты) с полями id, content, chunk_index,
+            metadata, filename, document_id, по порядку document_id, chunk_index
+        """
+        if not hits or window <= 0:
+            return []
+        document_ids = [hit['document_id'] for hit in hits]
+        chunk_indexes = [hit['chunk_index'] for hit in hits]
+        read_document_id = document_ids[0] if len(set(document_ids)) == 1 else None
+        
+        async with self._read_pool(read_document_id).acquire() as conn:
             rows = await conn.fetch(
                 """
-                SELECT d.id, d.filename, d.file_size, d.upload_date, d.metadata,
-                       COUNT(c.id) as chunk_count
+                SELECT DISTINCT ON (c.document_id, c.chunk_index)
+                       c.id, c.content, c.chunk_index, c.metadata,
+                       d.filename, c.document_id
+                FROM unnest($1::int[], $2::int[]) AS h(document_id, chunk_index)
+                JOIN chunks c ON c.document_id = h.document_id
+                             AND c.chunk_index BETWEEN h.chunk_index - $3 AND h.chunk_index + $3
+                JOIN documents d ON d.id = c.document_id
+                ORDER BY c.document_id, c.chunk_index
+                """,
+                document_ids, chunk_indexes, window
+            )
+        print(f"[VECTOR_STORE] Fetched {len(rows)} window chunks for {len(hits)} hits (±{window})")
+        return [dict(row) for row in rows]
+    
+    async def get_corpus_languages(self, filters: Optional[Dict[str, Any]] = None) -> List[str]:
+        """
+        Языки чанков документов, подходящих под фильтр (уровня документа), по убыванию числа чанков.
+        
+        Пустой список, если таблицы document_languages нет. Результат кешируется на
+        settings.corpus_languages_cache_ttl секунд; кеш сбрасывается при загрузке и удалении.
+        """
+        if not self.has_document_languages:
+            return []
+        # Фильтр по метаданным чанков к набору языков документов не применим
+        document_filters = {key: value for key, value in (filters or {}).items() if key != 'metadata'}
+        cache_key = json.dumps(document_filters, sort_keys=True, default=str)
+        cached = self._corpus_languages.get(cache_key)
+        if cached is not None and cached[0] > time.monotonic():
+            return list(cached[1])
+        args: List[Any] = []
+        conditions = self._build_filter_conditions(document_filters, args, alias="l")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        join = "JOIN documents d ON d.id = l.document_id" if self._filters_need_documents(document_filters) else ""
+        async with self._read_pool(sticky=True).acquire() as conn:
+            rows = await conn.fetch(
+                f"""
+                SELECT l.language
+                FROM document_languages l
+                {join}
+                {where}
+                GROUP BY l.language
+                ORDER BY SUM(l.chunk_count) DESC
+                """,
+                *args
+            )
+        languages = [row['language'] for row in rows]
+        if len(self._corpus_languages) >= 256:
+            self._corpus_languages.clear()
+        self._corpus_languages[cache_key] = (time.monotonic() + settings.corpus_languages_cache_ttl, languages)
+        return list(languages)
+    
+    async def search_documents(
+        self,
+        query_embedding: List[float],
+        limit: int,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[int]:
+        """
+        Ранжирует документы по вектору документа (documents.embedding).
+        
+        Первая стадия иерархического поиска: из фильтров применяются только
+        условия уровня документа (коллекция, document_ids, язык, дата, имя файла),
+        фильтр по метаданным чанков применяется на второй стадии.
+        
+        Returns:
+            ID документов по убыванию близости к запросу
+        """
+        if not self.has_document_embeddings:
+            return []
+        filters = filters or {}
+        args: List[Any] = [json.dumps(query_embedding)]
+        document_filters = {key: value for key, value in filters.items() if key not in ('document_ids', 'metadata')}
+        conditions = ["d.embedding IS NOT NULL"]
+        conditions += self._build_filter_conditions(document_filters, args, alias="d")
+        if filters.get('document_ids'):
+            args.append(list(filters['document_ids']))
+            conditions.append(f"d.id = ANY(${len(args)}::int[])")
+        args.append(limit)
+        
+        async with self._read_pool().acquire() as conn:
+            async with conn.transaction(readonly=True):
+                if len(conditions) > 1:
+                    await self._enable_iterative_scan(conn)
+                rows = await conn.fetch(
+                    f"""
+                    SELECT d.id
+                    FROM documents d
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY d.embedding <=> $1::vector
+                    LIMIT ${len(args)}
+                    """,
+                    *args
+                )
+        document_ids = [row['id'] for row in rows]
+        print(f"[VECTOR_STORE] Document-level search: {len(document_ids)} documents")
+        return document_ids
+    
+    async def search_lexical(
+        self,
+        query: str,
+        document_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        match_all: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        Полнотекстовый поиск по GIN-индексу chunks.content_tsv.
+        
+        Ранжирование ts_rank_cd с нормализацией по длине фрагмента (в духе BM25),
+        score приведен к диапазону 0..1 и возвращается в полях lexical_score и similarity.
+        
+        Args:
+            query: текст запроса
+            document_id: искать только в этом документе
+            limit: количество результатов
+            filters: структурированный фильтр, как в search_similar
+            match_all: True - все слова запроса (websearch-синтаксис, фразы в кавычках),
+                False - любое из слов (для смешивания с векторным поиском)
+        """
+        limit = limit if limit is not None else settings.search_limit
+        print(f"[VECTOR_STORE] Full-text search: doc_id={document_id}, limit={limit}, match_all={match_all}")
+        
+        if match_all:
+            tsquery = "websearch_to_tsquery('simple', $1)"
+        else:
+            tsquery = "replace(plainto_tsquery('simple', $1)::text, ' & ', ' | ')::tsquery"
+        
+        args: List[Any] = [query]
+        conditions = ["c.content_tsv @@ q.query"] + self._build_filter_conditions(filters, args, document_id)
+        args.append(limit)
+        
+        async with self._read_pool(document_id).acquire() as conn:
+            rows = await conn.fetch(
+                f"""
+                SELECT c.id, c.content, c.chunk_index, c.metadata,
+                       d.filename, d.id as document_id,
+                       ts_rank_cd(c.content_tsv, q.query, 1 | 32) as lexical_score
+                FROM chunks c
+                JOIN documents d ON c.document_id = d.id
+                CROSS JOIN (SELECT {tsquery} AS query) q
+                WHERE {' AND '.join(conditions)}
+                ORDER BY lexical_score DESC
+                LIMIT ${len(args)}
+                """,
+                *args
+            )
+        
+        results = [{**dict(row), 'similarity': float(row['lexical_score'])} for row in rows]
+        print(f"[VECTOR_STORE] Full-text search found {len(results)} chunks")
+        return results
+            
+    @staticmethod
+    def _row_to_dict(row) -> Dict[str, Any]:
+        result = dict(row)
+        result['metadata'] = json.loads(result['metadata']) if isinstance(result['metadata'], str) else result['metadata']
+        return result
+    
+    @staticmethod
+    def _encode_cursor(document: Dict[str, Any]) -> str:
+        raw = f"{document['upload_date'].isoformat()}|{document['id']}"
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+    
+    @staticmethod
+    def _decode_cursor(cursor: str):
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+            upload_date, doc_id = raw.rsplit('|', 1)
+            return datetime.fromisoformat(upload_date), int(doc_id)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise ValueError(f"Некорректный курсор пагинации: {cursor}") from e
+            
+    async def list_documents(
+        self,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        filename_prefix: Optional[str] = None,
+        language: Optional[str] = None,
+        collection_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Постраничный список документов (новые первыми) с keyset-пагинацией.
+        
+        Читает только таблицу documents: chunk_count хранится в строке документа,
+        поэтому таблица chunks не сканируется.
+        
+        Args:
+            limit: размер страницы (None - все документы)
+            cursor: курсор из next_cursor предыдущей страницы
+            filename_prefix: фильтр по началу имени файла
+            language: фильтр по языку документа (ISO 639-1)
+            collection_id: только документы коллекции
+            
+        Returns:
+            Dict с полями: documents, next_cursor (None на последней странице)
+        """
+        conditions = []
+        args: List[Any] = []
+        
+        if cursor:
+            cursor_date, cursor_id = self._decode_cursor(cursor)
+            args.extend([cursor_date, cursor_id])
+            conditions.append(f"(d.upload_date, d.id) < (${len(args) - 1}, ${len(args)})")
+        if filename_prefix:
+            args.append(self._like_prefix(filename_prefix))
+            conditions.append(f"d.filename LIKE ${len(args)}")
+        if language:
+            args.append(language)
+            conditions.append(f"d.metadata->>'language' = ${len(args)}")
+        if collection_id is not None:
+            args.append(collection_id)
+            conditions.append(f"d.collection_id = ${len(args)}")
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        limit_clause = ""
+        if limit is not None:
+            # Берем на одну строку больше, чтобы понять, есть ли следующая страница
+            args.append(limit + 1)
+            limit_clause = f"LIMIT ${len(args)}"
+        
+        async with self._read_pool(sticky=True).acquire() as conn:
+            rows = await conn.fetch(
+                f"""
+                SELECT d.id, d.filename, d.file_size, d.upload_date, d.metadata, d.chunk_count, d.collection_id
                 FROM documents d
-                LEFT JOIN chunks c ON d.id = c.document_id
-                GROUP BY d.id, d.filename, d.file_size, d.upload_date, d.metadata
-                ORDER BY d.upload_date DESC
-                """
+                {where}
+                ORDER BY d.upload_date DESC, d.id DESC
+                {limit_clause}
+                """,
+                *args
             )
-            return [
-                {
-                    **dict(row),
-                    'metadata': json.loads(row['metadata']) if isinstance(row['metadata'], str) else row['metadata']
-                }
-                for row in rows
-            ]
+        
+        documents = [self._row_to_dict(row) for row in rows]
+        next_cursor = None
+        if limit is not None and len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = self._encode_cursor(documents[-1])
+        return {'documents': documents, 'next_cursor': next_cursor}
+            
+    async def get_documents(self) -> List[Dict[str, Any]]:
+        result = await self.list_documents()
+        return result['documents']
             
     async def get_document(self, document_id: int) -> Optional[Dict[str, Any]]:
-        async with self.pool.acquire() as conn:
+        async with self._read_pool(document_id).acquire() as conn:
             row = await conn.fetchrow(
                 """
-                SELECT d.id, d.filename, d.file_size, d.upload_date, d.metadata,
-                       COUNT(c.id) as chunk_count
+                SELECT d.id, d.filename, d.file_size, d.upload_date, d.metadata, d.chunk_count, d.collection_id
                 FROM documents d
-                LEFT JOIN chunks c ON d.id = c.document_id
                 WHERE d.id = $1
-                GROUP BY d.id, d.filename, d.file_size, d.upload_date, d.metadata
                 """,
                 document_id
             )
             if row:
-                result = dict(row)
-                result['metadata'] = json.loads(result['metadata']) if isinstance(result['metadata'], str) else result['metadata']
-                return result
+                return self._row_to_dict(row)
             return None
+    
+    async def get_document_meta(self, document_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Быстрое чтение метаданных документа для пути поиска (только строка documents по PK).
+        
+        Returns:
+            Dict с полями: id, filename, language или None
+        """
+        async with self._read_pool(document_id).acquire() as conn:
+            row = await conn.fetchrow(
+                """
+                SELECT id, filename, metadata->>'language' AS language
+                FROM documents
+                WHERE id = $1
+                """,
+                document_id
+            )
+            return dict(row) if row else None
+            
+    async def create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Создает коллекцию с собственным векторным индексом.
+        
+        При секционировании по коллекциям создается секция векторной таблицы
+        (индексы наследуются от родительской таблицы), иначе - частичный
+        HNSW-индекс по строкам коллекции (см. _create_collection_index). Индекс
+        строится CONCURRENTLY после фиксации строки коллекции и не блокирует
+        загрузку в другие коллекции; если построить его не удалось, коллекция удаляется.
+        
+        Args:
+            name: уникальное имя коллекции
+            metadata: произвольные метаданные
             
+        Returns:
+            Dict с полями: id, name, created_at, metadata
+        """
+        print(f"[VECTOR_STORE] Creating collection: {name}")
+        table = self.vector_table
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow(
+                    """
+                    INSERT INTO collections (name, metadata)
+                    VALUES ($1, $2)
+                    RETURNING id, name, created_at, metadata
+                    """,
+                    name, json.dumps(metadata or {})
+                )
+                collection_id = row['id']
+                if self.partitioning == 'collection':
+                    await conn.execute(
+                        f"CREATE TABLE {table}_c{collection_id} PARTITION OF {table} FOR VALUES IN ({collection_id})"
+                    )
+            if self.partitioning != 'collection':
+                try:
+                    await self._create_collection_index(conn, collection_id)
+                except Exception as e:
+                    print(f"[VECTOR_STORE] Failed to build index for collection ID={collection_id}: {e}")
+                    try:
+                        await self._drop_collection_index(conn, collection_id)
+                    except Exception as cleanup_error:
+                        print(f"[VECTOR_STORE] Failed to drop index for collection ID={collection_id}: {cleanup_error}")
+                    finally:
+                        await conn.execute("DELETE FROM collections WHERE id = $1", collection_id)
+                    raise
+        self._mark_written()
+        print(f"[VECTOR_STORE] Collection created: ID={collection_id}")
+        return self._row_to_dict(row)
+    
+    async def _vector_partitions(self, conn) -> List[str]:
+        rows = await conn.fetch(
+            "SELECT inhrelid::regclass::text AS name FROM pg_inherits WHERE inhparent = $1::text::regclass ORDER BY 1",
+            self.vector_table
+        )
+        return [row['name'] for row in rows]
+    
+    async def _create_collection_index(self, conn, collection_id: int):
+        """
+        Частичный HNSW-индекс коллекции, построенный CONCURRENTLY (вне транзакции).
+        
+        HNSW, а не ivfflat: индекс создается на пустой коллекции и наполняется по мере
+        загрузки. Для секционированной по hash таблицы CONCURRENTLY недоступен: на
+        родителе создается пустой индекс ON ONLY, индексы секций строятся CONCURRENTLY
+        и присоединяются к нему.
+        """
+        table = self.vector_table
+        index = f"{table}_embedding_c{collection_id}_idx"
+        definition = f"USING hnsw (embedding vector_cosine_ops) WHERE collection_id = {collection_id}"
+        if self.partitioning != 'hash':
+            await conn.execute(f"CREATE INDEX CONCURRENTLY {index} ON {table} {definition}")
+            return
+        await conn.execute(f"CREATE INDEX {index} ON ONLY {table} {definition}")
+        for partition in await self._vector_partitions(conn):
+            partition_index = f"{partition}_embedding_c{collection_id}_idx"
+            await conn.execute(f"CREATE INDEX CONCURRENTLY {partition_index} ON {partition} {definition}")
+            await conn.execute(f"ALTER INDEX {index} ATTACH PARTITION {partition_index}")
+    
+    async def _drop_collection_index(self, conn, collection_id: int):
+        """Удаляет индекс коллекции, в том числе невалидный после прерванного CONCURRENTLY."""
+        table = self.vector_table
+        index = f"{table}_embedding_c{collection_id}_idx"
+        if self.partitioning != 'hash':
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index}")
+            return
+        # Индекс секционированной таблицы удаляется вместе с присоединенными индексами секций,
+        # не успевшие присоединиться удаляются по одному
+        await conn.execute(f"DROP INDEX IF EXISTS {index}")
+        for partition in await self._vector_partitions(conn):
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {partition}_embedding_c{collection_id}_idx")
+    
+    async def list_collections(self) -> List[Dict[str, Any]]:
+        async with self._read_pool(sticky=True).acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT c.id, c.name, c.created_at, COALESCE(c.metadata, '{}'::jsonb) AS metadata,
+                       COUNT(d.id) AS document_count,
+                       COALESCE(SUM(d.chunk_count), 0) AS chunk_count
+                FROM collections c
+                LEFT JOIN documents d ON d.collection_id = c.id
+                GROUP BY c.id, c.name, c.created_at, c.metadata
+                ORDER BY c.id
+                """
+            )
+            return [self._row_to_dict(row) for row in rows]
+    
+    async def get_collection(self, collection_id: int) -> Optional[Dict[str, Any]]:
+        async with self._read_pool(sticky=True).acquire() as conn:
+            row = await conn.fetchrow(
+                "SELECT id, name, created_at, COALESCE(metadata, '{}'::jsonb) AS metadata FROM collections WHERE id = $1",
+                collection_id
+            )
+            return self._row_to_dict(row) if row else None
+    
+    async def drop_collection(self, collection_id: int) -> List[str]:
+        """
+        Удаляет коллекцию вместе с документами и чанками.
+        
+        При секционировании по коллекциям секция векторной таблицы отсоединяется
+        и удаляется целиком (DROP TABLE без построчного DELETE и последующего VACUUM).
+        
+        Returns:
+            Имена файлов удаленных документов
+        """
+        if collection_id == DEFAULT_COLLECTION_ID:
+            raise ValueError("Коллекцию по умолчанию удалить нельзя")
+        
+        print(f"[VECTOR_STORE] Dropping collection ID={collection_id}")
+        table = self.vector_table
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if self.partitioning == 'collection':
+                    await conn.execute(f"ALTER TABLE {table} DETACH PARTITION {table}_c{collection_id}")
+                    await conn.execute(f"DROP TABLE {table}_c{collection_id}")
+                else:
+                    await conn.execute(f"DROP INDEX IF EXISTS {table}_embedding_c{collection_id}_idx")
+                rows = await conn.fetch(
+                    "DELETE FROM documents WHERE collection_id = $1 RETURNING id, filename",
+                    collection_id
+                )
+                await conn.execute("DELETE FROM collections WHERE id = $1", collection_id)
+        self._corpus_languages.clear()
+        for row in rows:
+            self._mark_written(row['id'])
+        print(f"[VECTOR_STORE] Collection ID={collection_id} dropped ({len(rows)} documents)")
+        return [row['filename'] for row in rows]
+    
     async def delete_document(self, document_id: int):
         print(f"[VECTOR_STORE] Deleting document ID={document_id}")
         async with self.pool.acquire() as conn:
             await conn.execute("DELETE FROM documents WHERE id = $1", document_id)
-            print(f"[VECTOR_STORE] Document ID={document_id} deleted (including all chunks)")
+        self._corpus_languages.clear()
+        self._mark_written(document_id)
+        print(f"[VECTOR_STORE] Document ID={document_id} deleted (including all chunks)")
     
     async def get_document_chunks(self, document_id: int) -> List[Dict[str, Any]]:
         """
@@ -164,7 +997,7 @@ class VectorStore:
             List[Dict]: Список чанков с полями: id, content, chunk_index, metadata
         """
         print(f"[VECTOR_STORE] Getting all chunks for document ID={document_id}")
-        async with self.pool.acquire() as conn:
+        async with self._read_pool(document_id).acquire() as conn:
             rows = await conn.fetch(
                 """
                 SELECT id, content, chunk_index, metadata
@@ -178,3 +1011,151 @@ class VectorStore:
             print(f"[VECTOR_STORE] Retrieved {len(chunks)} chunks")
             return chunks
 
+    
+    async def iter_document_chunks(self, document_id: int, fetch_size: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоково отдает чанки документа в порядке chunk_index через серверный курсор.
+        
+        В памяти одновременно держится не больше fetch_size строк, поэтому
+        потребление памяти не зависит от размера документа. Соединение и
+        транзакция удерживаются, пока итератор не исчерпан или не закрыт
+        (используйте contextlib.aclosing при досрочном выходе).
+        
+        Args:
+            document_id: ID документа
+            fetch_size: сколько строк забирать с сервера за раз (по умолчанию settings.chunk_fetch_size)
+            
+        Yields:
+            Dict: чанк с полями: id, content, chunk_index, metadata
+        """
+        fetch_size = fetch_size or settings.chunk_fetch_size
+        print(f"[VECTOR_STORE] Streaming chunks for document ID={document_id} (fetch_size={fetch_size})")
+        streamed = 0
+        async with self._read_pool(document_id).acquire() as conn:
+            async with conn.transaction(readonly=True):
+                async for row in conn.cursor(
+                    """
+                    SELECT id, content, chunk_index, metadata
+                    FROM chunks
+                    WHERE document_id = $1
+                    ORDER BY chunk_index
+                    """,
+                    document_id,
+                    prefetch=fetch_size
+                ):
+                    streamed += 1
+                    yield dict(row)
+        print(f"[VECTOR_STORE] Streamed {streamed} chunks")
+    
+    async def get_document_content_hash(self, document_id: int) -> Optional[str]:
+        """
+        MD5 текста документа (чанки по порядку chunk_index).
+        
+        Хеш считается на сервере, текст чанков по сети не передается.
+        
+        Returns:
+            Hex-строка из 32 символов или None, если у документа нет чанков
+        """
+        async with self._read_pool(document_id).acquire() as conn:
+            return await conn.fetchval(
+                """
+                SELECT md5(string_agg(content, E'\\n\\n' ORDER BY chunk_index))
+                FROM chunks
+                WHERE document_id = $1
+                """,
+                document_id
+            )
+    
+    async def get_artifacts(
+        self,
+        document_id: int,
+        kind: str,
+        content_hash: str,
+        prompt_version: str,
+        model: str
+    ) -> Dict[str, str]:
+        """
+        Сохраненные шаги LLM-конвейера для документа.
+        
+        Заодно удаляет результаты этого конвейера, посчитанные по старой версии
+        текста документа (другой content_hash).
+        
+        Returns:
+            Dict step -> content
+        """
+        if not self.has_artifacts:
+            return {}
+        # Только основной пул: шаги, записанные только что, должны быть видны при повторе
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                "DELETE FROM llm_artifacts WHERE document_id = $1 AND kind = $2 AND content_hash <> $3",
+                document_id, kind, content_hash
+            )
+            rows = await conn.fetch(
+                """
+                SELECT step, content FROM llm_artifacts
+                WHERE document_id = $1 AND kind = $2 AND content_hash = $3
+                  AND prompt_version = $4 AND model = $5
+                """,
+                document_id, kind, content_hash, prompt_version, model
+            )
+        return {row['step']: row['content'] for row in rows}
+    
+    async def save_artifact(
+        self,
+        document_id: int,
+        kind: str,
+        content_hash: str,
+        prompt_version: str,
+        model: str,
+        step: str,
+        content: str
+    ):
+        """Сохраняет (или перезаписывает) результат одного шага LLM-конвейера."""
+        if not self.has_artifacts:
+            return
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                """
+                INSERT INTO llm_artifacts (document_id, kind, content_hash, prompt_version, model, step, content)
+                VALUES ($1, $2, $3, $4, $5, $6, $7)
+                ON CONFLICT (document_id, kind, content_hash, prompt_version, model, step)
+                DO UPDATE SET content = EXCLUDED.content, created_at = CURRENT_TIMESTAMP
+                """,
+                document_id, kind, content_hash, prompt_version, model, step, content
+            )
+    
+    async def delete_artifacts(self, document_id: int, kind: Optional[str] = None):
+        """Удаляет сохраненные результаты LLM-конвейеров документа (все или одного вида)."""
+        if not self.has_artifacts:
+            return
+        async with self.pool.acquire() as conn:
+            if kind is None:
+                await conn.execute("DELETE FROM llm_artifacts WHERE document_id = $1", document_id)
+            else:
+                await conn.execute(
+                    "DELETE FROM llm_artifacts WHERE document_id = $1 AND kind = $2", document_id, kind
+                )
+    
+    async def update_document_embedding(self, document_id: int):
+        """
+        Пересчитывает вектор документа: центроид (avg) эмбеддингов его чанков.
+        
+        Считается на сервере одним запросом; без колонки documents.embedding ничего не делает.
+        """
+        if not self.has_document_embeddings:
+            return
+        async with self.pool.acquire() as conn:
+            await self._update_document_embedding(conn, document_id)
+        self._mark_written(document_id)
+        print(f"[VECTOR_STORE] Document ID={document_id} embedding updated")
+    
+    async def _update_document_embedding(self, conn, document_id: int):
+        await conn.execute(
+            f"""
+            UPDATE documents
+            SET embedding = (SELECT avg(embedding) FROM {self.vector_table} WHERE document_id = $1)
+            WHERE id = $1
+            """,
+            document_id
+        )
@@ -1,16 +1,18 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Query, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
-from typing import Optional, List
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from typing import Optional, List, AsyncIterator, Dict, Any
 import aiofiles
+import json
 import os
 from pathlib import Path
 from contextlib import asynccontextmanager
 
 from RAG import RAGManager
+from RAG.config import settings
 from RAG.web_search import get_web_search_manager
 from .models import (
-    QueryRequest, QueryResponse, DocumentResponse, 
+    QueryRequest, QueryResponse, BatchQueryRequest, DocumentResponse, CollectionRequest, CollectionResponse,
     SummaryRequest, SummaryResponse, ReferatRequest, ReferatResponse,
     WebSearchRequest, WebSearchResponse, WebSearchResult
 )
@@ -66,11 +68,15 @@ async def read_root():
 
 
 @app.post("/api/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), collection_id: Optional[int] = Form(None)):
     print(f"\n[API] ========== UPLOAD REQUEST ==========")
     print(f"[API] Filename: {file.filename}")
     print(f"[API] Content-Type: {file.content_type}")
+    print(f"[API] Collection ID: {collection_id or 'default'}")
     try:
+        if collection_id is not None and not await rag_manager.get_collection(collection_id):
+            raise HTTPException(status_code=404, detail="Коллекция не найдена")
+        
         file_path = UPLOAD_DIR / file.filename
         print(f"[API] Saving to: {file_path}")
         
@@ -80,7 +86,7 @@ async def upload_file(file: UploadFile = File(...)):
         file_size = os.path.getsize(file_path)
         print(f"[API] File saved: {file_size} bytes")
         
-        document_id = await rag_manager.add_document(str(file_path), file.filename)
+        document_id = await rag_manager.add_document(str(file_path), file.filename, collection_id=collection_id)
         
         print(f"[API] Upload successful: document_id={document_id}")
         print(f"[API] ========================================\n")
@@ -91,6 +97,8 @@ async def upload_file(file: UploadFile = File(...)):
             "message": f"Файл {file.filename} успешно загружен и обработан"
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         error_detail = f"Ошибка при загрузке файла: {str(e)}\n{traceback.format_exc()}"
@@ -99,10 +107,28 @@ async def upload_file(file: UploadFile = File(...)):
 
 
 @app.get("/api/documents", response_model=List[DocumentResponse])
-async def get_documents():
+async def get_documents(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    filename_prefix: Optional[str] = None,
+    language: Optional[str] = None,
+    collection_id: Optional[int] = None
+):
     try:
-        documents = await rag_manager.get_documents()
-        return documents
+        result = await rag_manager.list_documents(
+            limit=limit,
+            cursor=cursor,
+            filename_prefix=filename_prefix,
+            language=language,
+            collection_id=collection_id
+        )
+        # Курсор следующей страницы передаем в заголовке, чтобы формат ответа остался списком
+        if result['next_cursor']:
+            response.headers['X-Next-Cursor'] = result['next_cursor']
+        return result['documents']
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при получении списка документов: {str(e)}")
 
@@ -151,6 +177,58 @@ async def delete_document(document_id: int):
         raise HTTPException(status_code=500, detail=f"Ошибка при удалении документа: {str(e)}")
 
 
+@app.get("/api/collections", response_model=List[CollectionResponse])
+async def list_collections():
+    try:
+        return await rag_manager.list_collections()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении списка коллекций: {str(e)}")
+
+
+@app.post("/api/collections", response_model=CollectionResponse)
+async def create_collection(request: CollectionRequest):
+    print(f"\n[API] ========== CREATE COLLECTION REQUEST ==========")
+    print(f"[API] Name: {request.name}")
+    try:
+        if not request.name or not request.name.strip():
+            raise HTTPException(status_code=400, detail="Имя коллекции не может быть пустым")
+        return await rag_manager.create_collection(request.name.strip(), request.metadata)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка при создании коллекции: {str(e)}")
+
+
+@app.delete("/api/collections/{collection_id}")
+async def drop_collection(collection_id: int):
+    print(f"\n[API] ========== DROP COLLECTION REQUEST ==========")
+    print(f"[API] Collection ID: {collection_id}")
+    try:
+        collection = await rag_manager.get_collection(collection_id)
+        if not collection:
+            raise HTTPException(status_code=404, detail="Коллекция не найдена")
+        
+        filenames = await rag_manager.drop_collection(collection_id)
+        
+        for filename in filenames:
+            file_path = UPLOAD_DIR / filename
+            if file_path.exists():
+                os.remove(file_path)
+        
+        print(f"[API] Collection dropped: {len(filenames)} documents deleted")
+        print(f"[API] ========================================\n")
+        return JSONResponse({
+            "success": True,
+            "message": f"Коллекция {collection['name']} удалена (документов: {len(filenames)})"
+        })
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка при удалении коллекции: {str(e)}")
+
+
 @app.post("/api/chat", response_model=QueryResponse)
 async def chat(request: QueryRequest):
     print(f"\n[API] ========== CHAT REQUEST ==========")
@@ -165,7 +243,14 @@ async def chat(request: QueryRequest):
         result = await rag_manager.generate_answer(
             query=request.query,
             document_id=request.document_id,
-            context_limit=request.context_limit
+            context_limit=request.context_limit,
+            filters=request.filters_dict(),
+            search_mode=request.search_mode,
+            collection_id=request.collection_id,
+            neighbor_window=request.neighbor_window,
+            mmr_lambda=request.mmr_lambda,
+            rerank=request.rerank,
+            compression_ratio=request.compression_ratio
         )
         
         print(f"[API] Chat response generated successfully")
@@ -174,6 +259,8 @@ async def chat(request: QueryRequest):
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         import traceback
         error_detail = f"Ошибка при обработке запроса: {str(e)}\n{traceback.format_exc()}"
@@ -181,12 +268,55 @@ async def chat(request: QueryRequest):
         raise HTTPException(status_code=500, detail=f"Ошибка при обработке запроса: {str(e)}")
 
 
+async def _sse(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    try:
+        async for event in events:
+            name = event.pop('event')
+            yield f"event: {name}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+    except Exception as e:
+        print(f"[API] ERROR: Chat stream failed: {e}")
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: QueryRequest):
+    """
+    Потоковый чат (Server-Sent Events).
+    
+    События: sources (найденные фрагменты, сразу после поиска), token
+    (фрагмент ответа LLM), done (полный ответ), error.
+    """
+    print(f"\n[API] ========== CHAT STREAM REQUEST ==========")
+    print(f"[API] Query: {request.query}")
+    if not request.query or not request.query.strip():
+        raise HTTPException(status_code=400, detail="Вопрос не может быть пустым")
+    
+    events = rag_manager.stream_answer(
+        query=request.query,
+        document_id=request.document_id,
+        context_limit=request.context_limit,
+        filters=request.filters_dict(),
+        search_mode=request.search_mode,
+        collection_id=request.collection_id,
+        neighbor_window=request.neighbor_window,
+        mmr_lambda=request.mmr_lambda,
+        rerank=request.rerank,
+        compression_ratio=request.compression_ratio
+    )
+    return StreamingResponse(
+        _sse(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/api/search")
 async def search(request: QueryRequest):
     print(f"\n[API] ========== SEARCH REQUEST ==========")
     print(f"[API] Query: {request.query}")
     print(f"[API] Document ID: {request.document_id}")
     print(f"[API] Limit: {request.context_limit or 'default from settings'}")
+    print(f"[API] Filters: {request.filters_dict() or 'none'}")
     try:
         if not request.query or not request.query.strip():
             print(f"[API] ERROR: Empty query")
@@ -195,7 +325,13 @@ async def search(request: QueryRequest):
         results = await rag_manager.search(
             query=request.query,
             document_id=request.document_id,
-            limit=request.context_limit
+            limit=request.context_limit,
+            filters=request.filters_dict(),
+            mode=request.search_mode,
+            collection_id=request.collection_id,
+            neighbor_window=request.neighbor_window,
+            mmr_lambda=request.mmr_lambda,
+            rerank=request.rerank
         )
         
         print(f"[API] Search successful: {len(results)} results")
@@ -207,16 +343,71 @@ async def search(request: QueryRequest):
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при поиске: {str(e)}")
 
 
+def _validate_batch(request: BatchQueryRequest):
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="Список запросов не может быть пустым")
+    if len(request.queries) > settings.batch_max_queries:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком много запросов в пакете: {len(request.queries)} (максимум {settings.batch_max_queries})"
+        )
+    if any(not query or not query.strip() for query in request.queries):
+        raise HTTPException(status_code=400, detail="Запрос не может быть пустым")
+
+
+async def _ndjson(items: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    async for item in items:
+        yield json.dumps(item, ensure_ascii=False, default=str) + "\n"
+
+
+@app.post("/api/search/batch")
+async def search_batch(request: BatchQueryRequest):
+    """Пакетный поиск. Ответ - NDJSON, строки приходят по мере готовности (поле index - номер запроса)."""
+    print(f"\n[API] ========== BATCH SEARCH REQUEST ==========")
+    print(f"[API] Queries: {len(request.queries)}")
+    _validate_batch(request)
+    
+    items = rag_manager.search_many_iter(
+        request.queries,
+        document_id=request.document_id,
+        limit=request.context_limit,
+        filters=request.filters_dict(),
+        mode=request.search_mode,
+        collection_id=request.collection_id
+    )
+    return StreamingResponse(_ndjson(items), media_type="application/x-ndjson")
+
+
+@app.post("/api/chat/batch")
+async def chat_batch(request: BatchQueryRequest):
+    """Пакетный чат. Ответ - NDJSON, число одновременных вызовов LLM ограничено BATCH_LLM_CONCURRENCY."""
+    print(f"\n[API] ========== BATCH CHAT REQUEST ==========")
+    print(f"[API] Queries: {len(request.queries)}")
+    _validate_batch(request)
+    
+    items = rag_manager.generate_answers_many_iter(
+        request.queries,
+        document_id=request.document_id,
+        context_limit=request.context_limit,
+        filters=request.filters_dict(),
+        search_mode=request.search_mode,
+        collection_id=request.collection_id
+    )
+    return StreamingResponse(_ndjson(items), media_type="application/x-ndjson")
+
+
 @app.post("/api/summarize", response_model=SummaryResponse)
 async def summarize_document(request: SummaryRequest):
     print(f"\n[API] ========== SUMMARIZE REQUEST ==========")
     print(f"[API] Document ID: {request.document_id}")
     try:
-        result = await rag_manager.summarize_document(request.document_id)
+        result = await rag_manager.summarize_document(request.document_id, force=request.force)
         
         print(f"[API] Summarization successful")
         print(f"[API] ========================================\n")
@@ -239,7 +430,8 @@ async def create_referat(request: ReferatRequest):
     try:
         result = await rag_manager.create_referat(
             document_id=request.document_id,
-            output_dir="referats"
+            output_dir="referats",
+            force=request.force
         )
         
         print(f"[API] Referat created successfully")
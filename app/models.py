@@ -1,12 +1,47 @@
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime
 
 
+class SearchFilters(BaseModel):
+    document_ids: Optional[List[int]] = None
+    language: Optional[str] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+    filename_prefix: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None  # Совпадение по метаданным чанка
+
+
 class QueryRequest(BaseModel):
     query: str
     document_id: Optional[int] = None
     context_limit: Optional[int] = 7  # Увеличено для лучшего контекста
+    filters: Optional[SearchFilters] = None
+    collection_id: Optional[int] = None  # Искать только в коллекции
+    search_mode: Optional[Literal['vector', 'hybrid', 'lexical', 'hierarchical']] = None  # None - из настроек
+    neighbor_window: Optional[int] = None  # Соседние чанки ±k к каждому фрагменту, None - из настроек
+    mmr_lambda: Optional[float] = None  # Диверсификация MMR: 1.0 - релевантность, 0.0 - разнообразие
+    rerank: Optional[bool] = None  # Переранжирование кросс-энкодером, None - из настроек
+    compression_ratio: Optional[float] = None  # Доля контекста, сохраняемая сжатием (чат), None - из настроек
+
+    def filters_dict(self) -> Optional[Dict[str, Any]]:
+        if self.filters is None:
+            return None
+        return self.filters.model_dump(exclude_none=True) or None
+
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    document_id: Optional[int] = None
+    context_limit: Optional[int] = 7
+    filters: Optional[SearchFilters] = None
+    collection_id: Optional[int] = None
+    search_mode: Optional[Literal['vector', 'hybrid', 'lexical', 'hierarchical']] = None
+
+    def filters_dict(self) -> Optional[Dict[str, Any]]:
+        if self.filters is None:
+            return None
+        return self.filters.model_dump(exclude_none=True) or None
 
 
 class SourceInfo(BaseModel):
@@ -29,10 +64,26 @@ class DocumentResponse(BaseModel):
     upload_date: datetime
     metadata: Dict[str, Any]
     chunk_count: int
+    collection_id: Optional[int] = None
+
+
+class CollectionRequest(BaseModel):
+    name: str
+    metadata: Optional[Dict[str, Any]] = None
+
+
+class CollectionResponse(BaseModel):
+    id: int
+    name: str
+    created_at: datetime
+    metadata: Dict[str, Any]
+    document_count: int = 0
+    chunk_count: int = 0
 
 
 class SummaryRequest(BaseModel):
     document_id: int
+    force: bool = False  # Пересчитать, не используя сохраненный результат
 
 
 class SummaryResponse(BaseModel):
@@ -40,10 +91,12 @@ class SummaryResponse(BaseModel):
     document_id: int
     filename: str
     chunk_count: int
+    cached: bool = False  # Результат взят из сохраненных, без вызова LLM
 
 
 class ReferatRequest(BaseModel):
     document_id: int
+    force: bool = False  # Пересчитать все шаги заново
 
 
 class ReferatResponse(BaseModel):
@@ -52,6 +105,8 @@ class ReferatResponse(BaseModel):
     filename: str
     chunk_count: int
     pdf_url: str  # URL для скачивания PDF
+    timings: Optional[Dict[str, float]] = None  # Длительность этапов в секундах
+    cached: bool = False  # Итог взят из сохраненных результатов, без вызовов LLM
 
 
 class WebSearchRequest(BaseModel):
@@ -0,0 +1,132 @@
+"""
+Сравнение n-граммного определителя языка (RAG/language_id.py) с langdetect.
+
+Корпус берется из базы (случайные чанки, метка - язык документа из
+documents.metadata) или из файла TSV со строками "язык<TAB>текст".
+Выводит время загрузки моделей, затем (без него) время, скорость и точность
+по меткам для каждого движка и долю совпадений между ними.
+
+Запуск из корня проекта:
+    python scripts/benchmark_language_id.py --db --limit 2000
+    python scripts/benchmark_language_id.py --file corpus.tsv
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from RAG.config import settings
+from RAG.language_id import NgramLanguageIdentifier
+
+
+def load_file(path: str) -> List[Tuple[Optional[str], str]]:
+    corpus = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            label, _, text = line.rstrip('\n').partition('\t')
+            if text:
+                corpus.append((label or None, text))
+    return corpus
+
+
+async def load_db(limit: int) -> List[Tuple[Optional[str], str]]:
+    import asyncpg
+    conn = await asyncpg.connect(settings.database_url)
+    try:
+        rows = await conn.fetch(
+            """
+            SELECT d.metadata->>'language' AS language, c.content
+            FROM chunks c
+            JOIN documents d ON d.id = c.document_id
+            ORDER BY random()
+            LIMIT $1
+            """,
+            limit
+        )
+    finally:
+        await conn.close()
+    return [(row['language'], row['content']) for row in rows]
+
+
+def load_langdetect():
+    from langdetect import detect, DetectorFactory
+    DetectorFactory.seed = 0
+    # Профили langdetect загружаются при первом вызове
+    detect("warm up the language profiles")
+    return detect
+
+
+def run_langdetect(detect, texts: List[str]) -> List[Optional[str]]:
+    predictions = []
+    for text in texts:
+        try:
+            predictions.append(detect(text[:1000]))
+        except Exception:
+            predictions.append(None)
+    return predictions
+
+
+def load_ngram() -> NgramLanguageIdentifier:
+    # Без кеша: измеряется сама модель
+    identifier = NgramLanguageIdentifier(cache_size=0)
+    identifier.load()
+    return identifier
+
+
+def run_ngram(identifier: NgramLanguageIdentifier, texts: List[str], batch_size: int) -> List[Optional[str]]:
+    predictions = []
+    for start in range(0, len(texts), batch_size):
+        predictions.extend(lang for lang, _ in identifier.detect_batch(texts[start:start + batch_size]))
+    return predictions
+
+
+def report(name: str, elapsed: float, predictions: List[Optional[str]], labels: List[Optional[str]]):
+    labeled = [(p, l) for p, l in zip(predictions, labels) if l]
+    accuracy = sum(p == l for p, l in labeled) / len(labeled) if labeled else None
+    accuracy_text = f"{accuracy:.1%} on {len(labeled)} labeled" if accuracy is not None else "no labels"
+    print(f"{name:<10} {elapsed * 1000:9.1f} ms  {len(predictions) / elapsed:9.0f} texts/s  accuracy: {accuracy_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark n-gram language ID against langdetect")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--file', help="TSV file: language<TAB>text per line")
+    source.add_argument('--db', action='store_true', help="sample chunks from the database")
+    parser.add_argument('--limit', type=int, default=2000, help="number of chunks to sample with --db")
+    parser.add_argument('--batch-size', type=int, default=64, help="n-gram engine batch size")
+    args = parser.parse_args()
+
+    corpus = load_file(args.file) if args.file else asyncio.run(load_db(args.limit))
+    if not corpus:
+        print("Corpus is empty")
+        return
+    labels = [label for label, _ in corpus]
+    texts = [text for _, text in corpus]
+    print(f"Corpus: {len(texts)} texts, {sum(map(len, texts))} chars, labels: {sorted(set(filter(None, labels)))}")
+
+    started = time.perf_counter()
+    detect = load_langdetect()
+    print(f"langdetect profiles loaded in {(time.perf_counter() - started) * 1000:.0f} ms")
+    started = time.perf_counter()
+    identifier = load_ngram()
+    print(f"ngram model built in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    started = time.perf_counter()
+    langdetect_predictions = run_langdetect(detect, texts)
+    report('langdetect', time.perf_counter() - started, langdetect_predictions, labels)
+
+    started = time.perf_counter()
+    ngram_predictions = run_ngram(identifier, texts, args.batch_size)
+    report('ngram', time.perf_counter() - started, ngram_predictions, labels)
+
+    agreement = sum(a == b for a, b in zip(langdetect_predictions, ngram_predictions)) / len(texts)
+    print(f"Agreement between engines: {agreement:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,76 @@
 CREATE EXTENSION IF NOT EXISTS vector;
 
+CREATE TABLE IF NOT EXISTS collections (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    metadata JSONB
+);
+
+-- Коллекция по умолчанию (DEFAULT_COLLECTION_ID в RAG/vector_store.py)
+INSERT INTO collections (id, name, metadata) VALUES (1, 'default', '{}') ON CONFLICT (id) DO NOTHING;
+SELECT setval('collections_id_seq', GREATEST((SELECT MAX(id) FROM collections), 1));
+
 CREATE TABLE IF NOT EXISTS documents (
     id SERIAL PRIMARY KEY,
     filename VARCHAR(255) NOT NULL,
     file_size INTEGER NOT NULL,
     upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    metadata JSONB
+    metadata JSONB,
+    collection_id INTEGER NOT NULL DEFAULT 1 REFERENCES collections(id),
+    -- Денормализованная статистика, обновляется при записи чанков
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    total_chars BIGINT NOT NULL DEFAULT 0,
+    -- Вектор документа (центроид эмбеддингов чанков), считается при загрузке чанков
+    embedding vector(768)
 );
 
 CREATE TABLE IF NOT EXISTS chunks (
     id SERIAL PRIMARY KEY,
     document_id INTEGER REFERENCES documents(id) ON DELETE CASCADE,
+    collection_id INTEGER NOT NULL DEFAULT 1,
     content TEXT NOT NULL,
     embedding vector(768),
     chunk_index INTEGER NOT NULL,
-    metadata JSONB
+    metadata JSONB,
+    -- Полнотекстовый индекс для гибридного/лексического поиска
+    content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED
+);
+
+-- Промежуточные и итоговые результаты LLM-конвейеров (реферат, суммаризация)
+CREATE TABLE IF NOT EXISTS llm_artifacts (
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    kind VARCHAR(32) NOT NULL,
+    content_hash CHAR(32) NOT NULL,
+    prompt_version VARCHAR(32) NOT NULL,
+    model VARCHAR(255) NOT NULL,
+    step VARCHAR(64) NOT NULL,
+    content TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (document_id, kind, content_hash, prompt_version, model, step)
+);
+
+-- Языки документов (языки чанков и число чанков на каждом языке)
+CREATE TABLE IF NOT EXISTS document_languages (
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    collection_id INTEGER NOT NULL DEFAULT 1,
+    language VARCHAR(16) NOT NULL,
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (language, document_id)
 );
 
 CREATE INDEX IF NOT EXISTS chunks_embedding_idx ON chunks USING ivfflat (embedding vector_cosine_ops);
 CREATE INDEX IF NOT EXISTS chunks_document_id_idx ON chunks(document_id);
+-- Соседние чанки найденных фрагментов (окна ±k по chunk_index)
+CREATE INDEX IF NOT EXISTS chunks_document_chunk_idx ON chunks (document_id, chunk_index);
+CREATE INDEX IF NOT EXISTS document_languages_document_id_idx ON document_languages (document_id);
+CREATE INDEX IF NOT EXISTS chunks_collection_id_idx ON chunks (collection_id);
+CREATE INDEX IF NOT EXISTS chunks_metadata_idx ON chunks USING gin (metadata jsonb_path_ops);
+CREATE INDEX IF NOT EXISTS chunks_content_tsv_idx ON chunks USING gin (content_tsv);
 
+-- Постраничный вывод списка документов (keyset по upload_date, id) и фильтры
+CREATE INDEX IF NOT EXISTS documents_upload_date_id_idx ON documents (upload_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS documents_filename_pattern_idx ON documents (filename text_pattern_ops);
+CREATE INDEX IF NOT EXISTS documents_collection_id_idx ON documents (collection_id, upload_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS documents_embedding_idx ON documents USING hnsw (embedding vector_cosine_ops);
+CREATE INDEX IF NOT EXISTS documents_language_idx ON documents ((metadata->>'language'));
@@ -0,0 +1,21 @@
+-- Денормализованная статистика документов и индексы для постраничного списка.
+-- Применение к существующей базе:
+--   psql -h localhost -p 6432 -U rag_user -d rag_db -f scripts/migrations/001_document_stats.sql
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS chunk_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS total_chars BIGINT NOT NULL DEFAULT 0;
+
+-- Однократный пересчет статистики по уже загруженным чанкам
+UPDATE documents d
+SET chunk_count = s.chunk_count,
+    total_chars = s.total_chars
+FROM (
+    SELECT document_id, COUNT(*) AS chunk_count, COALESCE(SUM(LENGTH(content)), 0) AS total_chars
+    FROM chunks
+    GROUP BY document_id
+) s
+WHERE d.id = s.document_id;
+
+CREATE INDEX IF NOT EXISTS documents_upload_date_id_idx ON documents (upload_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS documents_filename_pattern_idx ON documents (filename text_pattern_ops);
+CREATE INDEX IF NOT EXISTS documents_language_idx ON documents ((metadata->>'language'));
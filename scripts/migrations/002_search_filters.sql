@@ -0,0 +1,8 @@
+-- Индексы для фильтров поиска (метаданные чанков, дата загрузки, имя файла, язык).
+-- Итеративный обход векторного индекса требует pgvector >= 0.8:
+--   ALTER EXTENSION vector UPDATE;
+
+CREATE INDEX IF NOT EXISTS chunks_metadata_idx ON chunks USING gin (metadata jsonb_path_ops);
+CREATE INDEX IF NOT EXISTS documents_upload_date_id_idx ON documents (upload_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS documents_filename_pattern_idx ON documents (filename text_pattern_ops);
+CREATE INDEX IF NOT EXISTS documents_language_idx ON documents ((metadata->>'language'));
@@ -0,0 +1,9 @@
+-- Полнотекстовый индекс по фрагментам для гибридного и лексического поиска.
+-- Конфигурация 'simple' (без стемминга и стоп-слов) одинаково работает
+-- для русского и английского текста и точно находит коды и номера.
+-- Добавление генерируемой колонки перезаписывает таблицу chunks.
+
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS content_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED;
+
+CREATE INDEX IF NOT EXISTS chunks_content_tsv_idx ON chunks USING gin (content_tsv);
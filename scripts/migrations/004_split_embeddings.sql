@@ -0,0 +1,68 @@
+-- Раскладка "split": эмбеддинги переносятся из chunks в узкую таблицу chunk_embeddings.
+--
+-- ANN-поиск (индексный и последовательный) читает только узкие строки
+-- (chunk_id, document_id, embedding) и не тянет через буферный кеш страницы
+-- с текстом и JSONB. Текст читается только для итогового top-k.
+-- Приложение определяет раскладку автоматически при подключении.
+-- Можно применять до или после 006_collections.sql: collection_id чанков
+-- и частичные индексы коллекций переносятся в chunk_embeddings.
+--
+-- Откат: 004_split_embeddings_down.sql
+
+BEGIN;
+
+-- Колонка из 006_collections.sql (ADD COLUMN с константным DEFAULT не переписывает таблицу)
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS collection_id INTEGER NOT NULL DEFAULT 1;
+
+CREATE TABLE IF NOT EXISTS chunk_embeddings (
+    chunk_id INTEGER PRIMARY KEY REFERENCES chunks(id) ON DELETE CASCADE,
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    collection_id INTEGER NOT NULL DEFAULT 1,
+    embedding vector(768) NOT NULL
+);
+ALTER TABLE chunk_embeddings ADD COLUMN IF NOT EXISTS collection_id INTEGER NOT NULL DEFAULT 1;
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'chunks' AND column_name = 'embedding'
+    ) THEN
+        INSERT INTO chunk_embeddings (chunk_id, document_id, collection_id, embedding)
+        SELECT id, document_id, collection_id, embedding
+        FROM chunks
+        WHERE embedding IS NOT NULL
+        ON CONFLICT (chunk_id) DO NOTHING;
+
+        DROP INDEX IF EXISTS chunks_embedding_idx;
+        ALTER TABLE chunks DROP COLUMN embedding;
+    END IF;
+END $$;
+
+-- Индекс строится после копирования данных, чтобы списки ivfflat отражали реальное распределение
+CREATE INDEX IF NOT EXISTS chunk_embeddings_embedding_idx ON chunk_embeddings USING ivfflat (embedding vector_cosine_ops);
+CREATE INDEX IF NOT EXISTS chunk_embeddings_document_id_idx ON chunk_embeddings(document_id);
+
+-- Частичные индексы коллекций (006_collections.sql, VectorStore.create_collection)
+-- строятся заново на новой векторной таблице
+DO $$
+DECLARE
+    collection RECORD;
+BEGIN
+    IF to_regclass('collections') IS NOT NULL THEN
+        FOR collection IN SELECT id FROM collections WHERE id <> 1 LOOP
+            EXECUTE format(
+                'CREATE INDEX IF NOT EXISTS %1$s_embedding_c%2$s_idx ON %1$s USING hnsw (embedding vector_cosine_ops) WHERE collection_id = %2$s',
+                'chunk_embeddings', collection.id
+            );
+        END LOOP;
+    END IF;
+END $$;
+
+COMMIT;
+
+-- DROP COLUMN не освобождает место в существующих страницах chunks.
+-- Чтобы строки chunks действительно стали уже, выполните в окно обслуживания:
+--   VACUUM FULL chunks;
+ANALYZE chunks;
+ANALYZE chunk_embeddings;
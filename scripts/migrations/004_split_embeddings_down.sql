@@ -0,0 +1,21 @@
+-- Откат раскладки "split": эмбеддинги возвращаются в колонку chunks.embedding.
+
+BEGIN;
+
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS embedding vector(768);
+
+DO $$
+BEGIN
+    IF to_regclass('chunk_embeddings') IS NOT NULL THEN
+        UPDATE chunks c
+        SET embedding = e.embedding
+        FROM chunk_embeddings e
+        WHERE e.chunk_id = c.id;
+
+        DROP TABLE chunk_embeddings;
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS chunks_embedding_idx ON chunks USING ivfflat (embedding vector_cosine_ops);
+
+COMMIT;
@@ -0,0 +1,123 @@
+-- Секционирование векторной таблицы по HASH(document_id).
+--
+-- Секционируется таблица, в которой хранятся эмбеддинги:
+--   - раскладка inline (по умолчанию): chunks;
+--   - раскладка split (004_split_embeddings.sql): chunk_embeddings.
+-- Каждая секция получает собственные индексы (векторный, полнотекстовый и т.д.),
+-- поэтому удаление большого документа, VACUUM и перестроение индексов
+-- затрагивают одну секцию, а не весь корпус. Поиск по документу
+-- (document_id = ... / document_id = ANY(...)) отсекает лишние секции.
+--
+-- Требует применения 001-003. Можно применять до или после 006_collections.sql
+-- и 010_chunk_windows.sql: collection_id, индексы этих миграций и частичные
+-- индексы коллекций создаются на новой таблице. Число секций задается константой partitions ниже
+-- и должно быть выбрано до миграции (16 секций хватает на десятки миллионов чанков).
+-- Миграция переписывает всю таблицу: выполняйте в окно обслуживания.
+
+BEGIN;
+
+DO $$
+DECLARE
+    partitions CONSTANT INTEGER := 16;
+    inline_layout BOOLEAN;
+    target TEXT;
+    collection RECORD;
+BEGIN
+    SELECT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'chunks' AND column_name = 'embedding'
+    ) INTO inline_layout;
+    target := CASE WHEN inline_layout THEN 'chunks' ELSE 'chunk_embeddings' END;
+
+    IF EXISTS (
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = target
+    ) THEN
+        RAISE NOTICE 'Table % is already partitioned, skipping', target;
+        RETURN;
+    END IF;
+
+    -- Колонка из 006_collections.sql (ADD COLUMN с константным DEFAULT не переписывает таблицу)
+    EXECUTE format('ALTER TABLE %I ADD COLUMN IF NOT EXISTS collection_id INTEGER NOT NULL DEFAULT 1', target);
+
+    IF inline_layout THEN
+        CREATE TABLE chunks_partitioned (
+            id INTEGER NOT NULL DEFAULT nextval('chunks_id_seq'),
+            document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+            collection_id INTEGER NOT NULL DEFAULT 1,
+            content TEXT NOT NULL,
+            embedding vector(768),
+            chunk_index INTEGER NOT NULL,
+            metadata JSONB,
+            content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED,
+            PRIMARY KEY (document_id, id)
+        ) PARTITION BY HASH (document_id);
+
+        FOR i IN 0..partitions - 1 LOOP
+            EXECUTE format(
+                'CREATE TABLE chunks_p%s PARTITION OF chunks_partitioned FOR VALUES WITH (MODULUS %s, REMAINDER %s)',
+                i, partitions, i
+            );
+        END LOOP;
+
+        INSERT INTO chunks_partitioned (id, document_id, collection_id, content, embedding, chunk_index, metadata)
+        SELECT id, document_id, collection_id, content, embedding, chunk_index, metadata
+        FROM chunks;
+
+        ALTER SEQUENCE chunks_id_seq OWNED BY NONE;
+        DROP TABLE chunks;
+        ALTER TABLE chunks_partitioned RENAME TO chunks;
+        ALTER SEQUENCE chunks_id_seq OWNED BY chunks.id;
+
+        -- Индексы на секционированной таблице создаются в каждой секции
+        CREATE INDEX chunks_embedding_idx ON chunks USING ivfflat (embedding vector_cosine_ops);
+        CREATE INDEX chunks_document_id_idx ON chunks (document_id);
+        CREATE INDEX chunks_metadata_idx ON chunks USING gin (metadata jsonb_path_ops);
+        CREATE INDEX chunks_content_tsv_idx ON chunks USING gin (content_tsv);
+        CREATE INDEX chunks_collection_id_idx ON chunks (collection_id);
+        CREATE INDEX chunks_document_chunk_idx ON chunks (document_id, chunk_index);
+    ELSE
+        CREATE TABLE chunk_embeddings_partitioned (
+            chunk_id INTEGER NOT NULL REFERENCES chunks(id) ON DELETE CASCADE,
+            document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+            collection_id INTEGER NOT NULL DEFAULT 1,
+            embedding vector(768) NOT NULL,
+            PRIMARY KEY (document_id, chunk_id)
+        ) PARTITION BY HASH (document_id);
+
+        FOR i IN 0..partitions - 1 LOOP
+            EXECUTE format(
+                'CREATE TABLE chunk_embeddings_p%s PARTITION OF chunk_embeddings_partitioned FOR VALUES WITH (MODULUS %s, REMAINDER %s)',
+                i, partitions, i
+            );
+        END LOOP;
+
+        INSERT INTO chunk_embeddings_partitioned (chunk_id, document_id, collection_id, embedding)
+        SELECT chunk_id, document_id, collection_id, embedding
+        FROM chunk_embeddings;
+
+        DROP TABLE chunk_embeddings;
+        ALTER TABLE chunk_embeddings_partitioned RENAME TO chunk_embeddings;
+
+        CREATE INDEX chunk_embeddings_embedding_idx ON chunk_embeddings USING ivfflat (embedding vector_cosine_ops);
+        CREATE INDEX chunk_embeddings_document_id_idx ON chunk_embeddings (document_id);
+        -- Для каскадного удаления по chunk_id
+        CREATE INDEX chunk_embeddings_chunk_id_idx ON chunk_embeddings (chunk_id);
+    END IF;
+
+    -- Частичные индексы коллекций (006_collections.sql, VectorStore.create_collection)
+    -- удалены вместе со старой таблицей; на секционированной создаются в каждой секции
+    IF to_regclass('collections') IS NOT NULL THEN
+        FOR collection IN SELECT id FROM collections WHERE id <> 1 LOOP
+            EXECUTE format(
+                'CREATE INDEX %1$s_embedding_c%2$s_idx ON %1$s USING hnsw (embedding vector_cosine_ops) WHERE collection_id = %2$s',
+                target, collection.id
+            );
+        END LOOP;
+    END IF;
+END $$;
+
+COMMIT;
+
+ANALYZE chunks;
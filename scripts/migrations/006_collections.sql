@@ -0,0 +1,34 @@
+-- Коллекции (пространства имен) документов.
+-- Документы и чанки получают collection_id; существующие данные попадают
+-- в коллекцию по умолчанию (id = 1). Новые коллекции создаются через API,
+-- каждая получает собственный частичный векторный индекс.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS collections (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    metadata JSONB
+);
+
+INSERT INTO collections (id, name, metadata) VALUES (1, 'default', '{}') ON CONFLICT (id) DO NOTHING;
+-- Коллекция по умолчанию, созданная ранними версиями миграции без метаданных
+UPDATE collections SET metadata = '{}' WHERE metadata IS NULL;
+SELECT setval('collections_id_seq', GREATEST((SELECT MAX(id) FROM collections), 1));
+
+-- ADD COLUMN с константным DEFAULT не переписывает таблицы
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS collection_id INTEGER NOT NULL DEFAULT 1 REFERENCES collections(id);
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS collection_id INTEGER NOT NULL DEFAULT 1;
+
+DO $$
+BEGIN
+    IF to_regclass('chunk_embeddings') IS NOT NULL THEN
+        ALTER TABLE chunk_embeddings ADD COLUMN IF NOT EXISTS collection_id INTEGER NOT NULL DEFAULT 1;
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS documents_collection_id_idx ON documents (collection_id, upload_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS chunks_collection_id_idx ON chunks (collection_id);
+
+COMMIT;
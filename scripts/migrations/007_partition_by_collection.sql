@@ -0,0 +1,103 @@
+-- Секционирование векторной таблицы по коллекциям: LIST(collection_id).
+--
+-- Каждая коллекция хранится в своей секции со своими индексами:
+-- поиск в коллекции читает только ее секцию, а удаление коллекции -
+-- это DETACH + DROP TABLE секции за O(1) без построчного DELETE.
+-- Новые коллекции получают секцию автоматически (VectorStore.create_collection).
+--
+-- Альтернатива 005_partition_chunks.sql: применяйте одну из двух миграций.
+-- Требует 001-003 и 006. Переписывает таблицу целиком: выполняйте в окно обслуживания.
+-- Векторный индекс на секциях - HNSW: секции новых коллекций создаются пустыми,
+-- а ivfflat, построенный на пустой таблице, дает плохую полноту.
+
+BEGIN;
+
+DO $$
+DECLARE
+    inline_layout BOOLEAN;
+    target TEXT;
+    collection RECORD;
+BEGIN
+    SELECT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'chunks' AND column_name = 'embedding'
+    ) INTO inline_layout;
+    target := CASE WHEN inline_layout THEN 'chunks' ELSE 'chunk_embeddings' END;
+
+    IF EXISTS (
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = target
+    ) THEN
+        RAISE EXCEPTION 'Table % is already partitioned; 005 and 007 are alternative layouts', target;
+    END IF;
+
+    IF inline_layout THEN
+        CREATE TABLE chunks_partitioned (
+            id INTEGER NOT NULL DEFAULT nextval('chunks_id_seq'),
+            document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+            collection_id INTEGER NOT NULL DEFAULT 1,
+            content TEXT NOT NULL,
+            embedding vector(768),
+            chunk_index INTEGER NOT NULL,
+            metadata JSONB,
+            content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED,
+            PRIMARY KEY (collection_id, id)
+        ) PARTITION BY LIST (collection_id);
+
+        FOR collection IN SELECT id FROM collections LOOP
+            EXECUTE format(
+                'CREATE TABLE chunks_c%s PARTITION OF chunks_partitioned FOR VALUES IN (%s)',
+                collection.id, collection.id
+            );
+        END LOOP;
+
+        INSERT INTO chunks_partitioned (id, document_id, collection_id, content, embedding, chunk_index, metadata)
+        SELECT id, document_id, collection_id, content, embedding, chunk_index, metadata
+        FROM chunks;
+
+        ALTER SEQUENCE chunks_id_seq OWNED BY NONE;
+        DROP TABLE chunks;
+        ALTER TABLE chunks_partitioned RENAME TO chunks;
+        ALTER SEQUENCE chunks_id_seq OWNED BY chunks.id;
+
+        CREATE INDEX chunks_embedding_idx ON chunks USING hnsw (embedding vector_cosine_ops);
+        CREATE INDEX chunks_document_id_idx ON chunks (document_id);
+        CREATE INDEX chunks_metadata_idx ON chunks USING gin (metadata jsonb_path_ops);
+        CREATE INDEX chunks_content_tsv_idx ON chunks USING gin (content_tsv);
+        CREATE INDEX chunks_collection_id_idx ON chunks (collection_id);
+        CREATE INDEX chunks_document_chunk_idx ON chunks (document_id, chunk_index);
+    ELSE
+        CREATE TABLE chunk_embeddings_partitioned (
+            chunk_id INTEGER NOT NULL REFERENCES chunks(id) ON DELETE CASCADE,
+            document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+            collection_id INTEGER NOT NULL DEFAULT 1,
+            embedding vector(768) NOT NULL,
+            PRIMARY KEY (collection_id, chunk_id)
+        ) PARTITION BY LIST (collection_id);
+
+        FOR collection IN SELECT id FROM collections LOOP
+            EXECUTE format(
+                'CREATE TABLE chunk_embeddings_c%s PARTITION OF chunk_embeddings_partitioned FOR VALUES IN (%s)',
+                collection.id, collection.id
+            );
+        END LOOP;
+
+        INSERT INTO chunk_embeddings_partitioned (chunk_id, document_id, collection_id, embedding)
+        SELECT chunk_id, document_id, collection_id, embedding
+        FROM chunk_embeddings;
+
+        DROP TABLE chunk_embeddings;
+        ALTER TABLE chunk_embeddings_partitioned RENAME TO chunk_embeddings;
+
+        CREATE INDEX chunk_embeddings_embedding_idx ON chunk_embeddings USING hnsw (embedding vector_cosine_ops);
+        CREATE INDEX chunk_embeddings_document_id_idx ON chunk_embeddings (document_id);
+        CREATE INDEX chunk_embeddings_chunk_id_idx ON chunk_embeddings (chunk_id);
+    END IF;
+    -- Частичные индексы коллекций удалены вместе со старой таблицей:
+    -- у каждой секции теперь свой векторный индекс
+END $$;
+
+COMMIT;
+
+ANALYZE chunks;
@@ -0,0 +1,20 @@
+-- Промежуточные результаты LLM-конвейеров (реферат, суммаризация).
+-- Каждый шаг (реферат части, объединение группы, итог) сохраняется сразу после
+-- выполнения; повторный запуск продолжает с последнего готового шага, а для
+-- неизмененного документа итог возвращается без вызовов LLM.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS llm_artifacts (
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    kind VARCHAR(32) NOT NULL,
+    content_hash CHAR(32) NOT NULL,
+    prompt_version VARCHAR(32) NOT NULL,
+    model VARCHAR(255) NOT NULL,
+    step VARCHAR(64) NOT NULL,
+    content TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (document_id, kind, content_hash, prompt_version, model, step)
+);
+
+COMMIT;
@@ -0,0 +1,27 @@
+-- Вектор уровня документа: центроид эмбеддингов его чанков.
+-- Для новых документов считается при загрузке чанков (VectorStore.add_chunks);
+-- для уже загруженных документов вычисляется ниже.
+-- Требуется pgvector >= 0.5 (агрегат avg для vector).
+
+BEGIN;
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS embedding vector(768);
+
+DO $$
+DECLARE
+    vector_table TEXT := CASE
+        WHEN to_regclass('chunk_embeddings') IS NOT NULL THEN 'chunk_embeddings'
+        ELSE 'chunks'
+    END;
+BEGIN
+    EXECUTE format(
+        'UPDATE documents d SET embedding = v.centroid
+         FROM (SELECT document_id, avg(embedding) AS centroid FROM %I GROUP BY document_id) v
+         WHERE v.document_id = d.id AND d.embedding IS NULL',
+        vector_table
+    );
+END $$;
+
+CREATE INDEX IF NOT EXISTS documents_embedding_idx ON documents USING hnsw (embedding vector_cosine_ops);
+
+COMMIT;
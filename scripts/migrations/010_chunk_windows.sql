@@ -0,0 +1,4 @@
+-- Составной индекс для расширения найденных фрагментов соседними чанками:
+-- окна ±k по chunk_index всех фрагментов читаются одним диапазонным запросом.
+
+CREATE INDEX IF NOT EXISTS chunks_document_chunk_idx ON chunks (document_id, chunk_index);
@@ -0,0 +1,25 @@
+-- Языки документов: для каждого документа - языки его чанков и число чанков на языке.
+-- Корпусный кросс-языковой поиск переводит запрос один раз на каждый язык из этой
+-- таблицы и ищет по каждому языку только в его документах.
+-- Язык каждого чанка хранится в chunks.metadata->>'language' (заполняется при загрузке).
+-- Для уже загруженных документов язык берется из documents.metadata->>'language'.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS document_languages (
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    collection_id INTEGER NOT NULL DEFAULT 1,
+    language VARCHAR(16) NOT NULL,
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (language, document_id)
+);
+
+CREATE INDEX IF NOT EXISTS document_languages_document_id_idx ON document_languages (document_id);
+
+INSERT INTO document_languages (document_id, collection_id, language, chunk_count)
+SELECT id, collection_id, metadata->>'language', chunk_count
+FROM documents
+WHERE metadata->>'language' IS NOT NULL
+ON CONFLICT (language, document_id) DO NOTHING;
+
+COMMIT;